@@ -0,0 +1,206 @@
+import concurrent.futures
+import os
+import subprocess
+import threading
+import time
+from CommandRunner import CommandRunner
+from Config import Config
+from LogWriter import invoker
+from Telemetry import telemetry
+
+class CommandResult:
+    """
+    Outcome of a command run by a CommandExecutor
+    """
+    def __init__(self, command, return_code, output, wall_time, timed_out = False, cancelled = False, error = None):
+        """
+        return_code : None if the command could not be started (see error) or was cancelled before starting
+        output : the last (timestamp, stream name, line) output tuples, as many as the output capacity of the executor
+        wall_time : seconds from the start of the command to its exit
+        timed_out, cancelled : whether the executor stopped the command (terminated, then killed if it ignored it)
+        error : why the command could not be started (missing program, refused by the privileged helper...), None if it was
+        """
+        self.command = command
+        self.return_code = return_code
+        self.output = output
+        self.wall_time = wall_time
+        self.timed_out = timed_out
+        self.cancelled = cancelled
+        self.error = error
+
+    def __repr__(self):
+        state = f" error={self.error!r}" if self.error else " timed out" if self.timed_out else " cancelled" if self.cancelled else ""
+        return f"<CommandResult {self.command!r} return_code={self.return_code}{state} {self.wall_time * 1000:.0f} ms>"
+
+    @property
+    def succeeded(self):
+        return self.return_code == 0 and self.error is None and not self.timed_out and not self.cancelled
+
+    @property
+    def stdout(self):
+        return "\n".join(line for _, stream_name, line in self.output if stream_name == "STDOUT")
+
+    @property
+    def stderr(self):
+        return "\n".join(line for _, stream_name, line in self.output if stream_name == "STDERR")
+
+class CommandBatch:
+    """
+    Futures of the commands submitted together by CommandExecutor.map(), in submission order, which can be cancelled at once
+    """
+    def __init__(self, commands):
+        self.commands = list(commands)
+        self.futures = []
+        self.cancelled = threading.Event()
+
+    def __len__(self):
+        return len(self.futures)
+
+    def __iter__(self):
+        return iter(self.futures)
+
+    def as_completed(self, timeout = None):
+        """
+        Return an iterator over the futures as they complete
+        """
+        return concurrent.futures.as_completed(self.futures, timeout)
+
+    def results(self, timeout = None):
+        """
+        Wait for every command and return their CommandResult, in submission order
+        """
+        done, not_done = concurrent.futures.wait(self.futures, timeout)
+        if not_done:
+            raise concurrent.futures.TimeoutError(f"{len(not_done)} of {len(self.futures)} commands still running")
+        return [future.result() for future in self.futures]
+
+    def cancel(self):
+        """
+        Cancel the batch : the commands not started yet are skipped, the running ones are stopped
+        The futures still complete, with cancelled results
+        """
+        self.cancelled.set()
+
+class CommandExecutor:
+    """
+    Run many commands through CommandRunner, at most max_concurrency at a time, each returned as a concurrent.futures.Future
+    of its CommandResult (return code, bounded output and wall time), with a per-command timeout after which the
+    command is terminated, then killed grace seconds later if it ignores it
+    """
+    # Seconds between two cancellation checks of a running command :
+    CANCEL_POLL_INTERVAL = 0.05
+
+    def __init__(self, logger, max_concurrency = None, timeout = None, grace = None, output_capacity = None, helper = None):
+        """
+        Settings that are not given as arguments are read from config.json ("executor")
+        max_concurrency : commands running at once
+        timeout : default seconds a command may run (None : no limit)
+        grace : seconds between terminating and killing a command that timed out or was cancelled
+        output_capacity : output lines kept per command
+        helper : PrivilegedHelper running the sudo commands, the session one by default (see CommandRunner)
+        """
+        executor_config = Config.shared().get_dict("executor", default = {})
+        self.logger = logger
+        self.max_concurrency = max_concurrency if max_concurrency is not None else executor_config.get("max_concurrency", 8)
+        self.timeout = timeout if timeout is not None else executor_config.get("timeout")
+        self.grace = grace if grace is not None else executor_config.get("grace", CommandRunner.TERMINATE_TIMEOUT)
+        self.output_capacity = output_capacity if output_capacity is not None else executor_config.get("output_lines", 1000)
+        self.helper = helper
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers = self.max_concurrency, thread_name_prefix = "CommandExecutor")
+        self._cancelled = threading.Event()  # set by shutdown(cancel = True)
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"initialize CommandExecutor instance ({self.max_concurrency} commands at once)", "invoker":invoker(self), "output":"0"})
+
+    def _cancel_requested(self, batch):
+        return self._cancelled.is_set() or (batch is not None and batch.cancelled.is_set())
+
+    def _execute(self, command, timeout, sudo_required, batch):
+        """
+        Run a command in a pool thread until it exits, times out or is cancelled, and return its CommandResult
+        """
+        if self._cancel_requested(batch):
+            return CommandResult(command, None, [], 0.0, cancelled = True)
+        runner = CommandRunner(command, self.logger, sudo_required, output_capacity = self.output_capacity, helper = self.helper)
+        start = time.perf_counter()
+        deadline = None if timeout is None else start + timeout
+        runner.run()
+        timed_out = cancelled = False
+        # Wait for the output streams to be closed, waking up to check for cancellation :
+        while True:
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            if runner.finished.wait(self.CANCEL_POLL_INTERVAL if remaining is None else min(max(remaining, 0), self.CANCEL_POLL_INTERVAL)):
+                break
+            if deadline is not None and time.perf_counter() >= deadline:
+                timed_out = True
+                break
+            if self._cancel_requested(batch):
+                cancelled = True
+                break
+        return_code = None
+        if runner.process is not None and not (timed_out or cancelled):
+            # The command may outlive its output streams :
+            try:
+                return_code = runner.process.wait(None if deadline is None else max(deadline - time.perf_counter(), 0))
+            except subprocess.TimeoutExpired:
+                timed_out = True
+        if timed_out or cancelled:
+            return_code = runner.stop(self.grace)
+            program = os.path.basename((command.split(maxsplit = 1) or [""])[0])
+            telemetry.count("command_timeouts" if timed_out else "commands_cancelled", program = program)
+            # Write to log file :
+            self.logger.write("EVENT", {"event":f"stop command {command} : {f'timed out after {timeout} s' if timed_out else 'cancelled'}","triggered by":invoker(self), "output":"0"})
+        if runner.error is not None:
+            error = runner.error.message
+        else:
+            error = getattr(runner.process, "error", None)  # set on a HelperProcess when the helper refused the command
+        return CommandResult(command, return_code, runner.lines(), time.perf_counter() - start, timed_out, cancelled, error)
+
+    def submit(self, command, timeout = None, sudo_required = False, batch = None):
+        """
+        Queue a command, return a concurrent.futures.Future of its CommandResult
+        timeout : seconds the command may run, the executor timeout by default
+        """
+        return self._pool.submit(self._execute, command, self.timeout if timeout is None else timeout, sudo_required, batch)
+
+    def map(self, commands, timeout = None, sudo_required = False):
+        """
+        Queue commands, return their CommandBatch
+        """
+        batch = CommandBatch(commands)
+        batch.futures = [self.submit(command, timeout, sudo_required, batch) for command in batch.commands]
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"submit a batch of {len(batch)} commands", "invoker":invoker(self), "output":"0"})
+        return batch
+
+    def run(self, commands, timeout = None, sudo_required = False):
+        """
+        Run commands and return their CommandResult, in order, once they all exited
+        """
+        return self.map(commands, timeout, sudo_required).results()
+
+    def shutdown(self, wait = True, cancel = False):
+        """
+        Stop accepting commands ; cancel : stop the running commands and skip the queued ones
+        """
+        if cancel:
+            self._cancelled.set()
+        self._pool.shutdown(wait)
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"shut CommandExecutor down{' (cancelled)' if cancel else ''}", "invoker":invoker(self), "output":"0"})
+
+# Example usage :
+if __name__ == "__main__":
+    from LogWriter import LogWriter
+    logger = LogWriter("log.txt")
+    executor = CommandExecutor(logger, max_concurrency = 4, timeout = 1, grace = 0.2)
+    for result in executor.run(["/bin/echo hello", "/bin/sh -c 'echo oops >&2; exit 3'", "/bin/sleep 5", "/bin/nonexistent"]):
+        print(result, repr(result.stdout or result.stderr))
+    batch = executor.map([f"/bin/sleep {seconds}" for seconds in range(1, 9)], timeout = 10)
+    time.sleep(0.2)
+    batch.cancel()
+    print(batch.results())
+    executor.shutdown()
+    logger.close()
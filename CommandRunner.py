@@ -1,11 +1,15 @@
+import concurrent.futures
+import os
 import subprocess
 import threading
 import time
 import sys
 import shlex
-import inspect
-import os
-import keyring
+from IOLoop import IOLoop
+from OutputBuffer import OutputBuffer
+from PrivilegedHelper import HelperError, PrivilegedHelper
+from LogWriter import invoker
+from Telemetry import telemetry
 
 class CommandError(Exception):
     """
@@ -22,132 +26,236 @@ class CommandError(Exception):
         Print the formatted error message.
         """
         # Write to log file :
-        self.logger.write("ERROR", {"message":f"{self.message}", "raised by":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}", "running command":f"{self.command}"}})
+        self.logger.write("ERROR", {"message":f"{self.message}", "raised by":invoker(self, {"running command":f"{self.command}"})})
 
 class CommandRunner:
     """
-    Run commands inside a non-blocking separate thread and read stdout/stderr streams to print them and write them in log.txt
+    Run commands in a non-blocking subprocess whose stdout/stderr streams are read by the shared I/O loop into a bounded
+    output buffer, which consumers can query or subscribe to
     """
-    def __init__(self, command, logger, sudo_required = False, sudo_password = None):
+    # Seconds to wait, once the process is terminated, for the output left in its pipes to be read :
+    STREAM_CLOSE_TIMEOUT = 1.0
+    # Seconds given to the command to exit once terminated (SIGTERM) before it is killed (SIGKILL) :
+    TERMINATE_TIMEOUT = 5.0
+    # Commands stopped with stop_async() are waited for here, never on the calling (GUI) thread :
+    _stopper = concurrent.futures.ThreadPoolExecutor(max_workers = 4, thread_name_prefix = "CommandRunner")
+
+    def __init__(self, command, logger, sudo_required = False, sudo_password = None, on_output = None, output_capacity = 10000, helper = None):
+        """
+        sudo_required : run the command through the privileged helper, which is started with the sudo password once per session
+        helper : PrivilegedHelper running the command if sudo is required, the session one by default
+        on_output(stream_name, lines) is called from the I/O loop thread with each chunk of output lines, which must return quickly
+        output_capacity : number of output lines kept in the ring buffer
+        """
         self.logger = logger
         self.command = command
         self.sudo_required = sudo_required
-        # If not provided as an argument, check if a sudo password is defined inside keyring (if necessary)
-        if sudo_required:
+        self.helper = helper
+        # If not provided as an argument, check if a sudo password is defined inside keyring (if necessary, to start the helper)
+        self.sudo_password = sudo_password
+        if sudo_required and helper is None:
             if sudo_password is None:
                 try:
+                    import keyring  # slow to import, and only needed for sudo commands
                     self.sudo_password = keyring.get_password("system", "sudo")
                     # Write to log file :
-                    self.logger.write("ACTION", {"action":"retrieve sudo password from keyring", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
+                    if self.logger.enabled("ACTION"):
+                        self.logger.write("ACTION", {"action":"retrieve sudo password from keyring", "invoker":invoker(self), "output":"0"})
                 except:
                     raise CommandError("no sudo password given as argument or defined in keyring", self.command, self.logger)
                     sys.exit(1)
             else:
-                self.sudo_password = sudo_password
                 # Write to log file :
                 self.logger.write("INFO", {"message":f"sudo password provided manually while running command {self.command}"})
+        self.on_output = on_output
+        self.output = OutputBuffer(output_capacity)
         self.process = None
-        self.stop_event = threading.Event()
-        self.thread = None
+        self.error = None  # CommandError raised when the command could not be started
+        self.finished = threading.Event()  # set once both output streams are closed
+        self._registered_streams = []  # (fd, stream) registered with the I/O loop
+        self._open_streams = 0
+        self._streams_lock = threading.Lock()
         # Write to log file :
-        self.logger.write("ACTION", {"action":"initialize CommandRunner instance", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":"initialize CommandRunner instance", "invoker":invoker(self), "output":"0"})
+
+    def _handle_output(self, stream_name, lines):
+        """
+        Store a chunk of lines read from the specified stream in the output buffer and pass them on to on_output
+        """
+        self.output.append(stream_name, lines)
+        if self.on_output is not None:
+            self.on_output(stream_name, lines)
+
+    def _stream_closed(self):
+        """
+        Called by the I/O loop when a stream is closed : the command is finished once both are
+        """
+        with self._streams_lock:
+            self._open_streams -= 1
+            if self._open_streams:
+                return
+        # Let the subscribers receive their last lines without holding up the I/O loop :
+        self.output.close(wait = False)
+        self.finished.set()
 
-    def _stream_reader(self, stream, stream_name):
+    def subscribe(self, callback, max_pending = 10000, policy = "drop_oldest", interval = 0.05, replay = False):
         """
-        Read lines from the specified stream and print/write them
+        Deliver output lines to callback(batch) in coalesced batches of (timestamp, stream name, line) tuples, from a dedicated thread
+        policy : what happens once max_pending lines wait for a slow subscriber, "drop_oldest" or "block" (which also holds up the reading of other commands)
+        replay : start with the lines already in the output buffer
         """
-        while not self.stop_event.is_set():
-            output = stream.readline()
-            if output:
-                log_message = f"{stream_name} : {output.strip()}"
-                print(log_message)
-                #self.log_file.write(log_message + '\n')
-                #self.log_file.flush()  # Ensure it is written to the file immediately
-            elif self.process.poll() is not None:  # Check if the process has finished
-                break
+        return self.output.subscribe(callback, max_pending, policy, interval, replay)
+
+    def unsubscribe(self, subscription):
+        """
+        Stop delivering output lines to a subscriber
+        """
+        self.output.unsubscribe(subscription)
+
+    def lines(self, count = None):
+        """
+        Return the last count (timestamp, stream name, line) output tuples kept in the output buffer, all of them by default
+        """
+        return self.output.snapshot(count)
+
+    def _program(self):
+        """
+        Return the name of the program run by the command, to label its telemetry
+        """
+        return os.path.basename((self.command.split(maxsplit = 1) or [""])[0])
 
     def run(self):
         """
-        Run the command in a background thread and capture both stdout and stderr output streams
+        Run the command in a subprocess and hand its stdout and stderr output streams to the shared I/O loop
         """
+        with telemetry.span("command_run", program = self._program()):
+            self._run()
+
+    def _run(self):
 
         # Write to log file :
-        self.logger.write("ACTION", {"action":f"run command {self.command}", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
-
-        def target():
-            """
-            Define the target for the main thread: the subprocess, and two threads for capturing stdout and stderr
-            """
-
-            # Format the command to a list usable by subprocess.Popen() and include sudo if required :
-            self.formatted_command = shlex.split(f"/bin/echo {self.sudo_password} | sudo -S " + self.command) if self.sudo_required else shlex.split(self.command)
-            # Create the command-executing process :
-            self.process = subprocess.Popen(
-                self.formatted_command,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                universal_newlines = True,
-                bufsize = 1
-            )
-            # Write to log file :
-            self.logger.write("ACTION", {"action":f"create subprocess {self.process} to run command {self.command}", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
-            # Create separate threads for capturing stdout and stderr using _stream_reader :
-            stdout_thread = threading.Thread(target = self._stream_reader, args = (self.process.stdout, "STDOUT"))
-            stderr_thread = threading.Thread(target = self._stream_reader, args = (self.process.stderr, "STDERR"))
-            # Write to log file :
-            self.logger.write("ACTION", {"action":f"create stdout and stderr threads {stdout_thread} and {stderr_thread} to read command {self.command}", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
-            # Start the threads :
-            stdout_thread.start()
-            stderr_thread.start()
-            # Write to log file :
-            self.logger.write("ACTION", {"action":f"start stdout and stderr threads {stdout_thread} and {stderr_thread} to read command {self.command}", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
-            # Join both threads :
-            stdout_thread.join()
-            stderr_thread.join()
-            # Write to log file :
-            self.logger.write("ACTION", {"action":f"join stdout and stderr threads {stdout_thread} and {stderr_thread} to read command {self.command}", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"run command {self.command}", "invoker":invoker(self), "output":"0"})
 
-        # Start the main thread as a daemon to ensure proper closing :
-        self.thread = threading.Thread(target = target)
-        self.thread.daemon = True  # Make the thread a daemon
+        # Format the command to a list usable by subprocess.Popen() :
+        self.formatted_command = shlex.split(self.command)
+        if self.sudo_required:
+            self._run_privileged()
+            return
+        # Create the command-executing process, with unbuffered binary pipes that the I/O loop reads in chunks :
+        try:
+            with telemetry.span("subprocess_start", program = self._program()):
+                self.process = subprocess.Popen(
+                    self.formatted_command,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    bufsize = 0
+                )
+        except OSError as e:
+            telemetry.count("command_start_failures", program = self._program())
+            self.error = CommandError(f"failed to start command : {e}", self.command, self.logger)
+            self.error.log()
+            self.output.close(wait = False)
+            self.finished.set()
+            return
         # Write to log file :
-        self.logger.write("ACTION", {"action":f"create thread {self.thread} to run command {self.command}", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
-        self.thread.start()
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"create subprocess {self.process} to run command {self.command}", "invoker":invoker(self), "output":"0"})
+
+        # Register both streams with the I/O loop, which reads them from its own thread :
+        io_loop = IOLoop.shared()
+        self._open_streams = 2
+        self._registered_streams = [
+            (io_loop.register(self.process.stdout, lambda lines: self._handle_output("STDOUT", lines), self._stream_closed), self.process.stdout),
+            (io_loop.register(self.process.stderr, lambda lines: self._handle_output("STDERR", lines), self._stream_closed), self.process.stderr)
+        ]
         # Write to log file :
-        self.logger.write("ACTION", {"action":f"start thread {self.thread} to run command {self.command}", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"register stdout and stderr streams with the I/O loop to read command {self.command}", "invoker":invoker(self), "output":"0"})
 
-    def stop(self):
+    def _run_privileged(self):
         """
-        Stop the command and the background thread
+        Run the command through the privileged helper, whose connection carries both output streams and is read by the shared I/O loop
         """
+        self._open_streams = 1
+        try:
+            helper = self.helper or PrivilegedHelper.shared(self.logger, self.sudo_password)
+            with telemetry.span("subprocess_start", program = self._program(), privileged = "true"):
+                self.process = helper.run(self.formatted_command, self._handle_output, self._stream_closed)
+        except HelperError as e:
+            telemetry.count("command_start_failures", program = self._program())
+            self.error = CommandError(f"failed to start command : {e}", self.command, self.logger)
+            self.error.log()
+            self.output.close(wait = False)
+            self.finished.set()
+            return
+        self._registered_streams = [(self.process.fd, self.process.connection)]
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"run command {self.command} through the privileged helper", "invoker":invoker(self), "output":"0"})
+
+    def stop(self, grace = None):
+        """
+        Stop the command : terminate it, kill it if it is still running grace seconds later (TERMINATE_TIMEOUT by default),
+        and wait for its output streams to be closed
+        Blocks until then : see stop_async() ; return the return code of the command
+        """
+        with telemetry.span("command_stop", program = self._program()):
+            return self._stop(grace)
+
+    def _stop(self, grace):
 
         # Write to log file :
-        self.logger.write("ACTION", {"action":f"stop command {self.command}", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"stop command {self.command}", "invoker":invoker(self), "output":"0"})
         
         # Terminate the subprocess:
         if self.process:
             self.process.terminate()
-            self.process.wait()  # Wait for the process to terminate properly
-            # Write to log file :
-            self.logger.write("ACTION", {"action":f"terminate subprocess {self.process} to run command {self.command}", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
-        
-        # Trigger the stop event to stop the thread and join it :
-        self.stop_event.set()
-        # Write to log file :
-        self.logger.write("EVENT", {"event":"set stop_event","triggered by":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
-        
-        # Join the thread :
-        if self.thread and self.thread.is_alive():
-            self.thread.join()
+            try:
+                self.process.wait(self.TERMINATE_TIMEOUT if grace is None else grace)
+                # Write to log file :
+                if self.logger.enabled("ACTION"):
+                    self.logger.write("ACTION", {"action":f"terminate subprocess {self.process} to run command {self.command}", "invoker":invoker(self), "output":"0"})
+            except subprocess.TimeoutExpired:
+                telemetry.count("command_kills", program = self._program())
+                self.process.kill()
+                self.process.wait()
+                # Write to log file :
+                self.logger.write("EVENT", {"event":f"kill subprocess {self.process} of command {self.command}, still running after being terminated","triggered by":invoker(self), "output":"0"})
+
+            # The streams close once the output left in them is read, unless a child of the command still holds them :
+            if not self.finished.wait(self.STREAM_CLOSE_TIMEOUT):
+                io_loop = IOLoop.shared()
+                for fd, stream in self._registered_streams:
+                    io_loop.unregister(fd, stream)
+                self.finished.wait()
+                # Write to log file :
+                self.logger.write("EVENT", {"event":f"force closing of the output streams of command {self.command}","triggered by":invoker(self), "output":"0"})
             # Write to log file :
-            self.logger.write("ACTION", {"action":f"join thread {self.thread} that ran command {self.command}", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
-            
+            if self.logger.enabled("ACTION"):
+                self.logger.write("ACTION", {"action":f"close stdout and stderr streams of command {self.command}", "invoker":invoker(self), "output":"0"})
+            return self.process.returncode
+        return None
+
+    def stop_async(self, callback = None, grace = None):
+        """
+        Stop the command as stop() does, from a worker thread, and return a concurrent.futures.Future of its return code
+        callback(return code) is called from the worker thread once stopped (emit a signal from it to reach the GUI thread)
+        """
+        future = self._stopper.submit(self.stop, grace)
+        if callback is not None:
+            future.add_done_callback(lambda done: callback(done.result() if done.exception() is None else None))
+        return future
+
 # Example usage :
 if __name__ == "__main__":
     try:
         from LogWriter import LogWriter
         logger = LogWriter("log.txt")
         command_runner = CommandRunner("/bin/ping google.com", logger)
+        command_runner.subscribe(lambda batch: print("\n".join(f"{stream_name} : {line}" for _, stream_name, line in batch)))
         command_runner.run()
         time.sleep(10)
         command_runner.stop()
@@ -0,0 +1,285 @@
+import copy
+import fcntl
+import json
+import os
+import threading
+import traceback
+from LogSchema import invoker
+
+class ConfigError(Exception):
+    """
+    Raised when a configuration value is missing or has the wrong type
+    """
+
+class Config:
+    """
+    Process-wide configuration : config.json (user settings) is parsed once, read through typed accessors, written atomically
+    (temporary file + rename) and watched for changes, which are pushed to the subscribers of the changed sections
+    Runtime state that is not a setting (such as the log entry counters) lives in a separate state file
+    """
+    # Directory of this module : config.json and the state file are looked up here, not in the current working directory
+    BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        """
+        Return the process-wide configuration, loading it on first use (NEBULA_CONFIG overrides the config.json path)
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls(os.environ.get("NEBULA_CONFIG", os.path.join(cls.BASE_PATH, "config.json")))
+            return cls._shared
+
+    def __init__(self, config_file, state_file = None, poll_interval = 1.0):
+        """
+        Load the configuration and the state
+        state_file : runtime state, state.json next to config_file by default
+        poll_interval : seconds between two modification time checks of config_file once watched
+        """
+        self.config_file = config_file
+        self.state_file = state_file or os.path.join(os.path.dirname(os.path.abspath(config_file)), "state.json")
+        self.poll_interval = poll_interval
+        self._lock = threading.RLock()
+        self._subscribers = {}  # section -> list of callbacks
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.logger = None  # reports the subscribers that fail (see watch)
+        self._mtime = None
+        self._data = self._read()
+        self._state = self._read_state()
+        self._state_changes = {}  # path of keys -> value set since the state was last saved
+        self._migrate_state()
+
+    def _read(self):
+        """
+        Parse config_file, remembering its modification time
+        """
+        with open(self.config_file) as config_file:
+            self._mtime = os.fstat(config_file.fileno()).st_mtime_ns
+            return json.load(config_file)
+
+    def _read_state(self):
+        """
+        Parse the state file, empty if it is missing or unreadable
+        """
+        try:
+            with open(self.state_file) as state_file:
+                state = json.load(state_file)
+        except (OSError, ValueError):
+            return {}
+        return state if isinstance(state, dict) else {}
+
+    def _write_json(self, path, data):
+        """
+        Atomically write a JSON file : a crash mid-write leaves the previous file intact
+        """
+        temporary_file = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_file, 'w') as json_file:
+            json.dump(data, json_file, indent = 2)
+            json_file.flush()
+            os.fsync(json_file.fileno())
+        os.replace(temporary_file, path)
+
+    def _migrate_state(self):
+        """
+        Move the log counters that older versions kept in config.json to the state file
+        """
+        log = self._data.get("log", {})
+        if "entry_number" not in log and "error_number" not in log:
+            return
+        for key in ("entry_number", "error_number"):
+            if key in log:
+                value = log.pop(key)
+                if self.get_state("log", key) is None:
+                    self.set_state("log", key, value = value)
+        self.save_state()
+        self.save()
+
+    def resolve(self, path):
+        """
+        Return a path from the configuration, relative paths being relative to the directory of config_file
+        """
+        return os.path.join(os.path.dirname(os.path.abspath(self.config_file)), os.path.expanduser(path))
+
+    # Settings :
+
+    def get(self, *keys, default = None):
+        """
+        Return the value at a path of keys (get("log", "writer", "batch_size")), or default if it is missing
+        Dictionaries and lists are copies : change settings with set()
+        """
+        with self._lock:
+            value = self._data
+            for key in keys:
+                if not isinstance(value, dict) or key not in value:
+                    return default
+                value = value[key]
+            return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+    def _typed(self, keys, default, types, type_name):
+        value = self.get(*keys, default = default)
+        # bool is an int subclass, but never a valid number setting :
+        if not isinstance(value, types) or (isinstance(value, bool) and bool not in types):
+            raise ConfigError(f"{'.'.join(keys)} must be {type_name}, not {type(value).__name__} ({value!r})")
+        return value
+
+    def get_int(self, *keys, default = None):
+        return self._typed(keys, default, (int,), "an integer")
+
+    def get_float(self, *keys, default = None):
+        return float(self._typed(keys, default, (int, float), "a number"))
+
+    def get_bool(self, *keys, default = None):
+        return self._typed(keys, default, (bool,), "a boolean")
+
+    def get_str(self, *keys, default = None):
+        return self._typed(keys, default, (str,), "a string")
+
+    def get_list(self, *keys, default = None):
+        return self._typed(keys, default, (list,), "a list")
+
+    def get_dict(self, *keys, default = None):
+        return self._typed(keys, default, (dict,), "an object")
+
+    def set(self, *keys, value, save = True):
+        """
+        Set the value at a path of keys, creating the missing objects, and save config_file
+        """
+        with self._lock:
+            target = self._data
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+            if save:
+                self.save()
+
+    def save(self):
+        """
+        Atomically write config_file
+        """
+        with self._lock:
+            self._write_json(self.config_file, self._data)
+            self._mtime = os.stat(self.config_file).st_mtime_ns  # our own write is not a change to report
+
+    # Runtime state :
+
+    def get_state(self, *keys, default = None):
+        """
+        Return the state value at a path of keys, or default
+        """
+        with self._lock:
+            value = self._state
+            for key in keys:
+                if not isinstance(value, dict) or key not in value:
+                    return default
+                value = value[key]
+            return value
+
+    def set_state(self, *keys, value):
+        """
+        Set the state value at a path of keys (call save_state() to persist it)
+        """
+        with self._lock:
+            target = self._state
+            for key in keys[:-1]:
+                target = target.setdefault(key, {})
+            target[keys[-1]] = value
+            self._state_changes[keys] = value
+
+    def save_state(self):
+        """
+        Atomically write the state file, merging the values set in this process into the state on disk : other processes
+        (the GUI, the daemon) save their own values to the same file
+        """
+        with self._lock, open(f"{self.state_file}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)  # released when the lock file is closed
+            state = self._read_state()
+            for keys, value in self._state_changes.items():
+                target = state
+                for key in keys[:-1]:
+                    if not isinstance(target.get(key), dict):
+                        target[key] = {}
+                    target = target[key]
+                target[keys[-1]] = value
+            self._write_json(self.state_file, state)
+            self._state = state
+            self._state_changes = {}
+
+    # Hot reload :
+
+    def subscribe(self, section, callback):
+        """
+        Call callback(new value) when a top-level section of config_file ("colors", "paths"...) changes on disk
+        Callbacks are called from the watcher thread (see watch)
+        """
+        with self._lock:
+            self._subscribers.setdefault(section, []).append(callback)
+
+    def unsubscribe(self, section, callback):
+        with self._lock:
+            if callback in self._subscribers.get(section, []):
+                self._subscribers[section].remove(callback)
+
+    def reload(self):
+        """
+        Parse config_file again if it changed, and notify the subscribers of the sections that changed
+        A file that does not parse (being edited) is ignored until it does
+        """
+        try:
+            if os.stat(self.config_file).st_mtime_ns == self._mtime:
+                return
+            data = self._read()
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            previous, self._data = self._data, data
+            changed = [section for section in set(previous) | set(data) if previous.get(section) != data.get(section)]
+            notifications = [(callback, self.get(section)) for section in changed for callback in self._subscribers.get(section, [])]
+        # A failing subscriber must not keep the others from being notified, nor stop the watcher thread :
+        for callback, value in notifications:
+            try:
+                callback(value)
+            except Exception as e:
+                if self.logger is None:
+                    traceback.print_exc()
+                # Write to log file :
+                elif self.logger.enabled("ERROR"):
+                    self.logger.write("ERROR", {"message":f"configuration subscriber {callback!r} failed : {e!r}", "raised by":invoker(self)})
+
+    def watch(self, logger = None):
+        """
+        Check config_file for changes every poll_interval seconds from a background thread
+        logger : LogWriter reporting the subscribers that raise, printed to stderr without one
+        """
+        if logger is not None:
+            self.logger = logger
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target = self._watch_loop, name = "Config", daemon = True)
+        self._thread.start()
+
+    def _watch_loop(self):
+        while not self._stop_event.wait(self.poll_interval):
+            self.reload()
+
+    def stop(self):
+        """
+        Stop watching config_file
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+# Example usage :
+if __name__ == "__main__":
+    import time
+    config = Config.shared()
+    print(config.get_list("paths", "vpns"), config.get_int("log", "writer", "batch_size"))
+    config.subscribe("colors", lambda colors: print(f"colors changed : {colors}"))
+    config.watch()
+    time.sleep(30)
+    config.stop()
@@ -0,0 +1,185 @@
+import concurrent.futures
+import shlex
+import threading
+import time
+from LogWriter import invoker
+from Telemetry import telemetry
+
+class ConnectionManager:
+    """
+    The openvpn tunnel, one at a time : started through the privileged helper with its byte counters collected into a
+    TrafficBuffer, stopped without blocking the caller (SIGTERM, grace time, SIGKILL : see CommandRunner.stop_async),
+    and switched from a server to another with the teardown of the old tunnel overlapping the preparation of the new one
+    """
+    # Tunnels are prepared, started and torn down here, never on the calling (GUI) thread :
+    _executor = concurrent.futures.ThreadPoolExecutor(max_workers = 4, thread_name_prefix = "ConnectionManager")
+    # Teardowns overlapping a switch run on their own pool : switches waiting for them must not hold every worker of _executor
+    _teardown_executor = concurrent.futures.ThreadPoolExecutor(max_workers = 4, thread_name_prefix = "ConnectionManagerTeardown")
+
+    def __init__(self, logger, traffic_buffer, traffic_interval = 1, on_output = None, helper = None):
+        """
+        traffic_interval : seconds between two byte counter samples
+        on_output(batch) : subscriber of the openvpn output (see CommandRunner.subscribe)
+        helper : PrivilegedHelper running openvpn, the session one by default
+        """
+        self.logger = logger
+        self.traffic_buffer = traffic_buffer
+        self.traffic_interval = traffic_interval
+        self.on_output = on_output
+        self.helper = helper
+        self.vpn = None
+        self.command_runner = None
+        self.traffic_collector = None
+        self._lock = threading.Lock()
+        self._switch_lock = threading.Lock()  # one switch at a time
+        self._tunnel_up = None  # telemetry span from the launch of openvpn to its "Initialization Sequence Completed"
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":"initialize ConnectionManager instance", "invoker":invoker(self), "output":"0"})
+
+    def _prepare(self, vpn, config_path):
+        """
+        Do what precedes starting openvpn : command line, management interface and privileged helper (authenticated by
+        sudo on first use), return (vpn, command runner, traffic collector)
+        """
+        from CommandRunner import CommandRunner
+        from TrafficStats import ManagementCollector
+        traffic_collector = ManagementCollector(self.traffic_buffer, self.logger, self.traffic_interval)
+        try:
+            command_runner = CommandRunner(f"openvpn --config {shlex.quote(config_path)} {traffic_collector.openvpn_options()}", self.logger, True, on_output = self._watch_output if telemetry.enabled else None, helper = self.helper)
+            if self.helper is None:
+                from PrivilegedHelper import PrivilegedHelper
+                PrivilegedHelper.shared(self.logger, command_runner.sudo_password)
+        except Exception:
+            traffic_collector.stop()  # removes its password file
+            raise
+        return vpn, command_runner, traffic_collector
+
+    def _start(self, prepared):
+        """
+        Start a prepared tunnel
+        """
+        vpn, command_runner, traffic_collector = prepared
+        self.traffic_buffer.clear()
+        if self.on_output is not None:
+            command_runner.subscribe(self.on_output)
+        with self._lock:
+            self._tunnel_up = telemetry.begin("tunnel_up", server = vpn)
+        command_runner.run()
+        traffic_collector.start()
+        with self._lock:
+            self.vpn, self.command_runner, self.traffic_collector = prepared
+
+    def _watch_output(self, stream_name, lines):
+        """
+        End the tunnel_up span when openvpn reports the tunnel is up (called from the I/O loop thread, with telemetry enabled)
+        """
+        if self._tunnel_up is not None and any("Initialization Sequence Completed" in line for line in lines):
+            with self._lock:
+                tunnel_up, self._tunnel_up = self._tunnel_up, None
+            telemetry.end(tunnel_up, outcome = "up")
+
+    def _detach(self):
+        """
+        Forget the current tunnel, return its (command runner, traffic collector) to tear it down
+        """
+        with self._lock:
+            detached = (self.command_runner, self.traffic_collector)
+            self.vpn = self.command_runner = self.traffic_collector = None
+            tunnel_up, self._tunnel_up = self._tunnel_up, None
+        # The tunnel is torn down before it came up :
+        telemetry.end(tunnel_up, outcome = "aborted")
+        return detached
+
+    def _teardown(self, command_runner, traffic_collector, grace = None):
+        """
+        Stop a tunnel, return the return code of openvpn (None if there was no tunnel)
+        """
+        return_code = command_runner.stop(grace) if command_runner is not None else None
+        if traffic_collector is not None:
+            traffic_collector.stop()
+        return return_code
+
+    def _disconnect(self, grace = None):
+        """
+        Tear the current tunnel down once no switch is running, so a switch in progress cannot bring a tunnel up afterwards
+        """
+        with self._switch_lock:
+            return self._teardown(*self._detach(), grace)
+
+    def _switch(self, vpn, config_path, grace):
+        """
+        Tear the current tunnel down while preparing the new one, then start it once the old one is gone (both would set
+        up routes), return the latency of each phase in seconds
+        """
+        with self._switch_lock:
+            start = time.perf_counter()
+            phases = {}
+            def timed(phase, function, *arguments):
+                phase_start = time.perf_counter()
+                try:
+                    with telemetry.span(f"connection_{phase}", server = vpn):
+                        return function(*arguments)
+                finally:
+                    phases[phase] = time.perf_counter() - phase_start
+            try:
+                teardown = self._teardown_executor.submit(timed, "teardown", self._teardown, *self._detach(), grace)
+                try:
+                    prepared = timed("prepare", self._prepare, vpn, config_path)
+                finally:
+                    teardown.result()
+                timed("start", self._start, prepared)
+            except Exception:
+                telemetry.count("connection_failures", server = vpn)
+                raise
+            phases["total"] = time.perf_counter() - start
+            # Connect latency per server :
+            telemetry.observe("connection_switch_seconds", phases["total"], server = vpn)
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"switch to VPN {vpn} ({', '.join(f'{phase} {seconds * 1000:.0f} ms' for phase, seconds in phases.items())})", "invoker":invoker(self), "output":"0"})
+        return phases
+
+    def switch(self, vpn, config_path, callback = None, grace = None):
+        """
+        Connect to a VPN, disconnecting the current one first if there is one, from worker threads
+        Return a concurrent.futures.Future of the phase latencies ({"teardown", "prepare", "start", "total"} in seconds)
+        callback(phases, error) is called from a worker thread once connected (error None) or once it failed (phases None)
+        """
+        future = self._executor.submit(self._switch, vpn, config_path, grace)
+        if callback is not None:
+            future.add_done_callback(lambda done: callback(*((done.result(), None) if done.exception() is None else (None, done.exception()))))
+        return future
+
+    def disconnect(self, callback = None, grace = None):
+        """
+        Disconnect from worker threads, return a concurrent.futures.Future of the return code of openvpn
+        callback(return code) is called from a worker thread once disconnected
+        """
+        future = self._executor.submit(self._disconnect, grace)
+        if callback is not None:
+            future.add_done_callback(lambda done: callback(done.result() if done.exception() is None else None))
+        return future
+
+    def close(self, grace = None):
+        """
+        Disconnect, blocking until done (when the application quits)
+        """
+        return self._disconnect(grace)
+
+# Example usage, switching between two stand-in "tunnels" run by a non-root helper :
+if __name__ == "__main__":
+    import shutil
+    from LogWriter import LogWriter
+    from PrivilegedHelper import PrivilegedHelper
+    from TrafficStats import TrafficBuffer
+    logger = LogWriter("log.txt")
+    helper = PrivilegedHelper(logger, allowed = {"openvpn": shutil.which("sleep")})
+    helper.start()
+    # openvpn is refused at once (/dev/null is not in a VPN directory) : only the phases are of interest here
+    connection = ConnectionManager(logger, TrafficBuffer(), helper = helper)
+    print(connection.switch("first", "/dev/null").result())
+    print(connection.switch("second", "/dev/null").result())
+    print(connection.disconnect().result())
+    helper.stop()
+    logger.close()
@@ -0,0 +1,190 @@
+import json
+import os
+import socket
+import sys
+import threading
+from Config import Config
+
+class DaemonError(Exception):
+    """
+    Raised when the daemon cannot be started or reached, or refuses a request
+    """
+
+def socket_path():
+    """
+    Return the path of the daemon socket : config.json daemon.socket, or daemon.sock in a per-user directory of the runtime
+    directory (XDG_RUNTIME_DIR, the temporary directory if it is not set)
+    """
+    config = Config.shared()
+    path = config.get_str("daemon", "socket", default = "")
+    if path:
+        return config.resolve(path)
+    runtime_directory = os.environ.get("XDG_RUNTIME_DIR")
+    if not runtime_directory:
+        import tempfile  # only needed here : the command line client starts faster without it
+        runtime_directory = tempfile.gettempdir()
+    return os.path.join(runtime_directory, f"nebula-{os.getuid()}", "daemon.sock")
+
+class DaemonStream:
+    """
+    Messages of a daemon stream (see DaemonClient.follow), received from a background thread
+    """
+    def __init__(self, connection, on_message):
+        self.connection = connection
+        self.on_message = on_message
+        self._thread = threading.Thread(target = self._receive, name = "DaemonStream", daemon = True)
+        self._thread.start()
+
+    def _receive(self):
+        with self.connection.makefile('rb') as reader:
+            try:
+                for line in reader:
+                    self.on_message(json.loads(line))
+            except (OSError, ValueError):
+                pass
+        # The daemon stopped, or the stream was closed :
+        self.on_message({"event": "closed"})
+
+    def wait(self):
+        """
+        Block until the daemon closes the stream
+        """
+        self._thread.join()
+
+    def close(self):
+        """
+        Stop receiving messages
+        """
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._thread.join()
+        self.connection.close()
+
+class DaemonClient:
+    """
+    Client of the connection daemon (see NebulaDaemon) : only standard library imports, so that scripts starting it pay
+    no GUI nor tunnel startup
+    """
+    DAEMON_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "NebulaDaemon.py")
+    # Seconds to wait for a daemon started by start() to answer :
+    START_TIMEOUT = 10
+
+    def __init__(self, path = None):
+        """
+        path : socket of the daemon, socket_path() by default
+        """
+        self.socket_path = path or socket_path()
+
+    def _connect(self, request):
+        """
+        Open a connection to the daemon and send it a request
+        """
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(self.socket_path)
+            connection.sendall(json.dumps(request).encode() + b"\n")
+        except OSError as e:
+            connection.close()
+            raise DaemonError(f"daemon unreachable : {e}")
+        return connection
+
+    def request(self, command, **arguments):
+        """
+        Send a request and return the reply of the daemon
+        """
+        with self._connect({"command": command, **arguments}) as connection:
+            try:
+                line = connection.makefile('rb').readline()
+            except OSError as e:
+                raise DaemonError(f"daemon unreachable : {e}")
+        if not line:
+            raise DaemonError("the daemon closed the connection")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise DaemonError(reply["error"])
+        return reply
+
+    def running(self):
+        """
+        Return whether the daemon answers
+        """
+        try:
+            self.request("ping")
+            return True
+        except DaemonError:
+            return False
+
+    def start(self):
+        """
+        Start the daemon in its own session (it outlives the client) unless it is running, and wait until it answers
+        Return whether it was started
+        """
+        if self.running():
+            return False
+        # Only needed to start the daemon : the command line client starts faster without them
+        import select
+        import subprocess
+        try:
+            process = subprocess.Popen([sys.executable, self.DAEMON_FILE, "--socket", self.socket_path, "--detach"], stdin = subprocess.DEVNULL, stdout = subprocess.PIPE, stderr = subprocess.PIPE, start_new_session = True)
+        except OSError as e:
+            raise DaemonError(f"failed to start the daemon : {e}")
+        readable, _, _ = select.select([process.stdout], [], [], self.START_TIMEOUT)
+        if not readable or process.stdout.readline() != b"ready\n":
+            process.kill()
+            process.wait()
+            # Another client started it meanwhile :
+            if self.running():
+                return False
+            error = process.stderr.read().decode(errors = "replace").strip()
+            raise DaemonError(f"daemon failed to start : {error or 'timed out'}")
+        process.stdout.close()
+        process.stderr.close()
+        return True
+
+    def list(self):
+        """
+        Return the names of the VPN configurations
+        """
+        return self.request("list")["vpns"]
+
+    def status(self):
+        """
+        Return the state of the tunnel : {"status", "vpn", "phases", "rates"}
+        """
+        return self.request("status")
+
+    def connect(self, vpn, wait = True):
+        """
+        Connect to a VPN, disconnecting the current one first ; wait : return once connected, with the phase latencies
+        """
+        return self.request("connect", vpn = vpn, wait = wait)
+
+    def disconnect(self, wait = True):
+        """
+        Disconnect ; wait : return once disconnected, with the return code of openvpn
+        """
+        return self.request("disconnect", wait = wait)
+
+    def shutdown(self):
+        """
+        Disconnect and stop the daemon
+        """
+        return self.request("shutdown")
+
+    def follow(self, on_message, replay = 0):
+        """
+        Call on_message(message) from a background thread with the state of the tunnel, then with every event, output
+        lines and traffic samples of the daemon (see NebulaDaemon), ending with {"event": "closed"}
+        replay : number of past output lines to receive first
+        Return the DaemonStream, close it to stop following
+        """
+        return DaemonStream(self._connect({"command": "stream", "replay": replay}), on_message)
+
+# Example usage :
+if __name__ == "__main__":
+    client = DaemonClient()
+    client.start()
+    print(client.status())
+    print(client.list())
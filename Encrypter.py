@@ -1,52 +1,123 @@
+import concurrent.futures
+import hashlib
+import platform
+import time
 import keyring
+import psutil
 from argon2 import PasswordHasher
-import inspect
-import os
+from argon2.exceptions import InvalidHashError, VerificationError
+from Config import Config
+from LogWriter import invoker
 
 class Encrypter:
   """
-  Handle sudo passwords by hashing them through Argon2 (with parameters adaptated from machine specs) and safely storing the through keyring
+  Handle sudo passwords by hashing them through Argon2 (with parameters calibrated on the machine) and safely storing them through keyring
   """
+  # Memory cost bounds of the calibration, in KiB :
+  MIN_MEMORY_COST = 8192
+  MAX_MEMORY_COST = 1048576
+  # Password checks run here, never on the calling (GUI) thread :
+  _executor = concurrent.futures.ThreadPoolExecutor(max_workers = 1, thread_name_prefix = "Encrypter")
+
   def __init__(self, logger):
     # Initialize logger and PasswordHasher :
     self.logger = logger
     self.ph = PasswordHasher()
+    self.calibrated = False
     # Write to log file :
-    self.logger.write("ACTION", {"action":"initialize Encrypter instance", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
+    if self.logger.enabled("ACTION"):
+      self.logger.write("ACTION", {"action":"initialize Encrypter instance", "invoker":invoker(self), "output":"0"})
 
-  def adjust_argon2_parameters(self):
+  def _caps(self):
     """
-    Retrieve system specifications and user parameters (maximum values allowed) to adjust Argon2 parameters dynamically
+    Return the user parameters from config.json : maximum memory cost, time cost and parallelism (0 = no cap) and target hashing time
     """
+    config = Config.shared()
+    return (
+      config.get_int("hash_parameters", "memory_cost_cap", default = 0),
+      config.get_int("hash_parameters", "time_cost_cap", default = 0),
+      config.get_int("hash_parameters", "parallelism_cap", default = 0),
+      config.get_float("hash_parameters", "target_time", default = 0.25)
+    )
 
-    # Get system specifications :
-    cpu_cores = psutil.cpu_count(logical = False)  # Number of cpu physical cores
-    total_memory = psutil.virtual_memory().total // (1024 * 1024)  # Memory ammount in MB
-    cpu_freq = psutil.cpu_freq().current  # Current CPU frequency in MHz
+  def fingerprint(self):
+    """
+    Return a fingerprint of the hardware and of the user parameters : calibration results are only reused when it is unchanged
+    """
+    cpu_model = platform.processor()
+    try:
+      with open("/proc/cpuinfo") as cpu_info:
+        cpu_model = next((line.split(":", 1)[1].strip() for line in cpu_info if line.startswith("model name")), cpu_model)
+    except OSError:
+      pass
+    hardware = [platform.machine(), cpu_model, psutil.cpu_count(logical = False), psutil.cpu_count(), psutil.virtual_memory().total >> 30]
+    return hashlib.sha256(repr(hardware + list(self._caps())).encode()).hexdigest()[:16]
 
-    # Get user parameters from config.json :
-    with open("config.json") as config_file:
-      config = json.load(config_file)
-    memory_cost_cap = config["hash_parameters"]["memory_cost_cap"]
-    time_cost_cap = config["hash_parameters"]["time_cost_cap"]
-    parallelism_cost_cap = config["hash_parameters"]["parallelism_cost_cap"]
+  def _time_hash(self, time_cost, memory_cost, parallelism):
+    """
+    Return the time taken to hash (and so to verify) a password with the given parameters, in seconds
+    """
+    hasher = PasswordHasher(time_cost = time_cost, memory_cost = memory_cost, parallelism = parallelism)
+    start = time.perf_counter()
+    hasher.hash("calibration")
+    return time.perf_counter() - start
 
-    # Adjust Argon2 parameters :
-    # Get the best system parameters, but do not exceed user cap (which is defined if different than 0)
+  def calibrate(self):
+    """
+    Time real hashes to find the strongest parameters whose hashing time stays under the target time, within the user caps :
+    memory first (the main cost for attackers), doubled while a single pass stays under half the target, then passes
+    Return (time_cost, memory_cost, parallelism, measured hashing time)
+    """
+    memory_cost_cap, time_cost_cap, parallelism_cap, target_time = self._caps()
+    # Parallelism : at most 8 threads, but not more than the system has
+    cpu_cores = psutil.cpu_count(logical = False) or psutil.cpu_count() or 1
+    parallelism = min(min(cpu_cores, 8), parallelism_cap) if parallelism_cap else min(cpu_cores, 8)
+    # Memory cost : never more than an eighth of the RAM, nor the user cap
+    memory_limit = min(self.MAX_MEMORY_COST, psutil.virtual_memory().total // 1024 // 8)
+    if memory_cost_cap:
+      memory_limit = min(memory_limit, memory_cost_cap)
+    memory_cost = max(min(self.MIN_MEMORY_COST, memory_limit), 8 * parallelism)
+    measured = self._time_hash(1, memory_cost, parallelism)
+    while memory_cost * 2 <= memory_limit and measured * 2 < target_time / 2:
+      memory_cost *= 2
+      measured = self._time_hash(1, memory_cost, parallelism)
+    # Time cost : as many passes as fit in the target time
+    time_cost = max(1, int(target_time / measured)) if measured else 1
+    if time_cost_cap:
+      time_cost = min(time_cost, time_cost_cap)
+    if time_cost > 1:
+      measured = self._time_hash(time_cost, memory_cost, parallelism)
+      while time_cost > 1 and measured > target_time * 1.2:
+        time_cost -= 1
+        measured = self._time_hash(time_cost, memory_cost, parallelism)
+    # Write to log file :
+    if self.logger.enabled("ACTION"):
+      self.logger.write("ACTION", {"action":f"calibrate Argon2 parameters (time cost {time_cost}, memory cost {memory_cost} KiB, parallelism {parallelism} : {measured * 1000:.0f} ms)", "invoker":invoker(self), "output":"0"})
+    return time_cost, memory_cost, parallelism, measured
 
-    # Memory cost : 100MB by default, 4+GB RAM -> 250MB, 8+GB RAM-> 500MB
-    system_based_memory_cost = 512000 if total_memory > 8192 else (256000 if total_memory > 4096 else 102400)
-    memory_cost = min(system_based_memory_cost, memory_cost_cap) if memory_cost_cap else system_based_memory_cost
-    # Time cost : 1 iteration by default, frequency>1500GHz -> 2, frequency>2500GHz -> 3
-    system_based_time_cost = 3 if cpu_freq > 2500 else (2 if cpu_freq > 1500 else 1)
-    time_cost = min(system_based_time_cost, time_cost_cap) if time_cost_cap else system_based_time_cost
-    # Parralelism : at most 8 threads, but not more than the system has
-    parallelism = min(min(cpu_cores, 8), parallelism_cost_cap) if parallelism_cost_cap else min(cpu_cores, 8)
+  def adjust_argon2_parameters(self, force = False):
+    """
+    Set the Argon2 parameters from the last calibration on this machine, calibrating (and saving the result in the
+    state file) if there is none, if the hardware or the user parameters changed, or if force is set
+    """
+    if self.calibrated and not force:
+      return
+    config = Config.shared()
+    fingerprint = self.fingerprint()
+    saved = config.get_state("argon2", default = {})
+    if not force and saved.get("fingerprint") == fingerprint:
+      time_cost, memory_cost, parallelism = saved["time_cost"], saved["memory_cost"], saved["parallelism"]
+    else:
+      time_cost, memory_cost, parallelism, measured = self.calibrate()
+      config.set_state("argon2", value = {"fingerprint": fingerprint, "time_cost": time_cost, "memory_cost": memory_cost, "parallelism": parallelism, "measured": measured})
+      config.save_state()
 
     # Update hasher :
     self.ph = PasswordHasher(time_cost = time_cost, memory_cost = memory_cost, parallelism = parallelism)
+    self.calibrated = True
     # Write to log file :
-    self.logger.write("ACTION", {"action":"adjust Argon2 parameters to machine specs", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
+    if self.logger.enabled("ACTION"):
+      self.logger.write("ACTION", {"action":"adjust Argon2 parameters to machine specs", "invoker":invoker(self), "output":"0"})
 
   def encrypt_password(self, password):
     """
@@ -54,16 +125,42 @@ class Encrypter:
     """
     self.adjust_argon2_parameters()
     hashed_password = self.ph.hash(password)
-    keyring.set_password("system", "sudo_hashed", "hashed_password")
+    keyring.set_password("system", "sudo_hashed", hashed_password)
     # Write to log file :
-    self.logger.write("ACTION", {"action":"hash and encrypt sudo password", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
+    if self.logger.enabled("ACTION"):
+      self.logger.write("ACTION", {"action":"hash and encrypt sudo password", "invoker":invoker(self), "output":"0"})
 
   def check_password(self, checked_password):
     """
-    Check if the provided password is correct
+    Check if the provided password is correct (blocks for about the calibrated target time : see check_password_async)
+    A hash made with outdated parameters is replaced by one made with the current ones
     """
+    self.adjust_argon2_parameters()
     hashed_password = keyring.get_password("system", "sudo_hashed")
-    is_valid = self.ph.verify(hashed_password, checked_password)
+    try:
+      is_valid = hashed_password is not None and self.ph.verify(hashed_password, checked_password)
+    except (VerificationError, InvalidHashError):
+      is_valid = False
+    if is_valid and self.ph.check_needs_rehash(hashed_password):
+      keyring.set_password("system", "sudo_hashed", self.ph.hash(checked_password))
     # Write to log file :
-    self.logger.write("ACTION", {"action":"check if provided sudo password is valid", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
-    return is_valid
\ No newline at end of file
+    if self.logger.enabled("ACTION"):
+      self.logger.write("ACTION", {"action":"check if provided sudo password is valid", "invoker":invoker(self), "output":"0"})
+    return is_valid
+
+  def check_password_async(self, checked_password, callback = None):
+    """
+    Check if the provided password is correct on a worker thread, return a concurrent.futures.Future of the result
+    callback(is_valid) is called from the worker thread once done (emit a signal from it to reach the GUI thread)
+    """
+    future = self._executor.submit(self.check_password, checked_password)
+    if callback is not None:
+      future.add_done_callback(lambda done: callback(done.result() if done.exception() is None else False))
+    return future
+
+# Example usage, calibrating :
+if __name__ == "__main__":
+  from LogWriter import LogWriter
+  logger = LogWriter("log.txt")
+  encrypter = Encrypter(logger)
+  print(encrypter.calibrate())
@@ -0,0 +1,87 @@
+import json
+import math
+import os
+from PyQt6.QtCore import Qt, QRect
+from PyQt6.QtGui import QColor, QIcon, QPainter, QPixmap
+
+class FlagIcons:
+    """
+    Flag icons shared by every row of the VPN list : each flag is loaded once, the first time a row showing it is painted,
+    unknown country codes share a single placeholder icon, and every flag can be preloaded from a single packed atlas
+    """
+    def __init__(self, flags_path, atlas_file = None, size = 20):
+        """
+        flags_path : directory of the <country code>.png flags
+        atlas_file : packed flags (see build_atlas), loaded at once instead of the separate files when it exists
+        size : side of the placeholder icon, in pixels
+        """
+        self.flags_path = flags_path
+        self._icons = {}  # lowercase country code -> QIcon
+        placeholder = QPixmap(size, size)
+        placeholder.fill(QColor(0, 0, 0, 0))
+        painter = QPainter(placeholder)
+        painter.setPen(QColor(128, 128, 128))
+        painter.drawRoundedRect(1, 4, size - 3, size - 9, 2, 2)
+        painter.end()
+        self.placeholder = QIcon(placeholder)
+        if atlas_file and os.path.exists(atlas_file) and os.path.exists(atlas_file + ".json"):
+            self._load_atlas(atlas_file)
+
+    def _load_atlas(self, atlas_file):
+        """
+        Cut every flag out of the atlas image, as described by its .json sidecar (code -> [x, y, width, height])
+        """
+        with open(atlas_file + ".json") as layout_file:
+            layout = json.load(layout_file)
+        atlas = QPixmap(atlas_file)
+        if atlas.isNull():
+            return
+        for code, (x, y, width, height) in layout.items():
+            self._icons[code] = QIcon(atlas.copy(QRect(x, y, width, height)))
+
+    def icon(self, code):
+        """
+        Return the flag icon of a country code, loading it on first use, or the placeholder icon
+        """
+        if not code:
+            return self.placeholder
+        code = code.lower()
+        icon = self._icons.get(code)
+        if icon is None:
+            pixmap = QPixmap(os.path.join(self.flags_path, f"{code}.png"))
+            icon = QIcon(pixmap) if not pixmap.isNull() else self.placeholder
+            self._icons[code] = icon
+        return icon
+
+def build_atlas(flags_path, atlas_file, columns = 16):
+    """
+    Pack every flag of flags_path into a single image, in a grid, with a .json sidecar giving the rectangle of each flag
+    """
+    codes = sorted(os.path.splitext(name)[0] for name in os.listdir(flags_path) if name.endswith(".png"))
+    pixmaps = {code: QPixmap(os.path.join(flags_path, f"{code}.png")) for code in codes}
+    pixmaps = {code: pixmap for code, pixmap in pixmaps.items() if not pixmap.isNull()}
+    cell_width = max((pixmap.width() for pixmap in pixmaps.values()), default = 1)
+    cell_height = max((pixmap.height() for pixmap in pixmaps.values()), default = 1)
+    rows = max(math.ceil(len(pixmaps) / columns), 1)
+    atlas = QPixmap(cell_width * columns, cell_height * rows)
+    atlas.fill(Qt.GlobalColor.transparent)
+    painter = QPainter(atlas)
+    layout = {}
+    for index, (code, pixmap) in enumerate(pixmaps.items()):
+        x, y = (index % columns) * cell_width, (index // columns) * cell_height
+        painter.drawPixmap(x, y, pixmap)
+        layout[code] = [x, y, pixmap.width(), pixmap.height()]
+    painter.end()
+    atlas.save(atlas_file, "PNG")
+    with open(atlas_file + ".json", 'w') as layout_file:
+        json.dump(layout, layout_file)
+
+# Example usage, building the atlas :
+if __name__ == "__main__":
+    import sys
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication(sys.argv)
+    os.makedirs(".cache", exist_ok = True)
+    build_atlas("flags", ".cache/flags_atlas.png")
+    flag_icons = FlagIcons("flags", ".cache/flags_atlas.png")
+    print(flag_icons.icon("fr").isNull(), flag_icons.icon("zz") is flag_icons.placeholder)
@@ -0,0 +1,161 @@
+import os
+import selectors
+import threading
+import traceback
+
+class IOLoop:
+    """
+    Read the output pipes of every running command from a single thread : pipes are non-blocking, read in chunks
+    with selectors and split into lines that are dispatched to a callback per pipe
+    """
+    CHUNK_SIZE = 65536
+    # Longest incomplete line kept between two reads : a longer one is dispatched as a line, so a stream that never
+    # writes a newline cannot grow it without bound
+    MAX_LINE_SIZE = 65536
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls):
+        """
+        Return the process-wide I/O loop, starting it on first use
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def __init__(self):
+        """
+        Initialize the selector, the wake-up pipe used to hand over (un)registrations, and the loop thread
+        """
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._pending = []  # (un)registrations waiting to be applied by the loop thread
+        self._wakeup_read, self._wakeup_write = os.pipe()
+        os.set_blocking(self._wakeup_read, False)
+        os.set_blocking(self._wakeup_write, False)
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ)
+        self._streams = {}  # fd -> [on_lines, on_close, incomplete line, stream]
+        self._thread = threading.Thread(target = self._loop, name = "IOLoop", daemon = True)
+        self._thread.start()
+
+    def _wake_up(self):
+        """
+        Interrupt the select() call so that pending (un)registrations are applied
+        """
+        try:
+            os.write(self._wakeup_write, b"\0")
+        except BlockingIOError:  # the pipe is already full of wake-ups
+            pass
+
+    def register(self, stream, on_lines, on_close = None):
+        """
+        Start reading a pipe (file object or file descriptor), which is closed by the loop once done
+        on_lines(lines) is called from the loop thread with the list of complete lines read in a chunk (without line endings)
+        on_close() is called once the pipe reached end of file or was unregistered, after the last line was dispatched
+        """
+        fd = stream if isinstance(stream, int) else stream.fileno()
+        os.set_blocking(fd, False)
+        with self._lock:
+            self._pending.append(("register", fd, on_lines, on_close, stream))
+        self._wake_up()
+        return fd
+
+    def unregister(self, fd, stream):
+        """
+        Stop reading a pipe, dispatching what is left of it : lines still readable are not waited for
+        fd, stream : the descriptor returned by register() and the stream given to it ; nothing is done if that pipe
+        was closed already, even when its descriptor now belongs to a pipe registered since
+        """
+        with self._lock:
+            self._pending.append(("unregister", fd, None, None, stream))
+        self._wake_up()
+
+    def _apply_pending(self):
+        """
+        Apply the (un)registrations requested by other threads
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for action, fd, on_lines, on_close, stream in pending:
+            if action == "register":
+                self._streams[fd] = [on_lines, on_close, b"", stream]
+                self._selector.register(fd, selectors.EVENT_READ)
+            elif fd in self._streams and self._streams[fd][3] is stream:
+                self._read(fd)
+                self._close(fd)
+
+    def _read(self, fd):
+        """
+        Read what is available on a pipe and dispatch the complete lines, closing the pipe at end of file
+        """
+        stream = self._streams[fd]
+        try:
+            chunk = os.read(fd, self.CHUNK_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b""
+        if not chunk:
+            self._close(fd)
+            return
+        end = chunk.rfind(b"\n")
+        if end == -1:
+            stream[2] += chunk
+        else:
+            # Decode and split the complete lines of the chunk at once, keeping the incomplete last line for the next read :
+            complete, stream[2] = stream[2] + chunk[:end], chunk[end + 1:]
+            self._dispatch(stream[0], complete.decode(errors = "replace").split("\n"))
+        if len(stream[2]) > self.MAX_LINE_SIZE:
+            incomplete, stream[2] = stream[2], b""
+            self._dispatch(stream[0], [incomplete.decode(errors = "replace")])
+
+    def _close(self, fd):
+        """
+        Dispatch the incomplete last line of a pipe, stop watching it and close it
+        """
+        on_lines, on_close, incomplete, stream = self._streams.pop(fd)
+        self._selector.unregister(fd)
+        # Close through the file object when there is one, so it does not close the descriptor a second time later :
+        if isinstance(stream, int):
+            os.close(stream)
+        else:
+            stream.close()
+        if incomplete:
+            self._dispatch(on_lines, [incomplete.decode(errors = "replace")])
+        if on_close is not None:
+            self._dispatch(on_close)
+
+    def _dispatch(self, callback, *args):
+        """
+        Call a callback, printing its exceptions instead of letting them stop the loop for every other pipe
+        """
+        try:
+            callback(*args)
+        except Exception:
+            traceback.print_exc()
+
+    def _loop(self):
+        """
+        Wait for readable pipes and read them, forever
+        """
+        while True:
+            for key, _ in self._selector.select():
+                if key.fd == self._wakeup_read:
+                    try:
+                        while os.read(self._wakeup_read, 4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    self._apply_pending()
+                elif key.fd in self._streams:
+                    self._read(key.fd)
+
+# Example usage :
+if __name__ == "__main__":
+    import subprocess
+    process = subprocess.Popen(["/bin/ping", "-c", "3", "localhost"], stdout = subprocess.PIPE, bufsize = 0)
+    closed = threading.Event()
+    IOLoop.shared().register(process.stdout, lambda lines: print("\n".join(lines)), closed.set)
+    closed.wait()
@@ -0,0 +1,297 @@
+import json
+import os
+import shutil
+import struct
+
+class IndexedLog:
+    """
+    Structured log storage : one JSON record per line in a data file, plus a sidecar index file of fixed-size records
+    (entry number, byte offset, timestamp, type) so that lookups are binary searches and trimming is a seek and a truncate
+    """
+    # Index header : magic and position of the first live record (records before it were flushed but not compacted yet)
+    HEADER = struct.Struct("<8sQ")
+    MAGIC = b"NBLIDX1\0"
+    # Index record : entry number, byte offset in the data file, POSIX timestamp, type (UTF-8, cut to 8 bytes, padded)
+    RECORD = struct.Struct("<QQd8s")
+
+    def __init__(self, data_file):
+        """
+        Open (or create) the data file and its index, rebuilding the index tail if the last run stopped between the two writes
+        """
+        self.data_file = data_file
+        self.index_file = data_file + ".idx"
+        self._data = open(self.data_file, 'ab+')
+        self._index = open(self.index_file, 'ab+')
+        self._index.seek(0)
+        header = self._index.read(self.HEADER.size)
+        if len(header) == self.HEADER.size and header[:8] == self.MAGIC:
+            self._head = self.HEADER.unpack(header)[1]
+        else:
+            # Missing or unreadable index : start a new one, _recover() then indexes the whole data file
+            self._head = 0
+            self._index.truncate(0)
+            self._index.write(self.HEADER.pack(self.MAGIC, 0))
+            self._index.flush()
+        self._count = (os.path.getsize(self.index_file) - self.HEADER.size) // self.RECORD.size
+        self._recover()
+
+    def _reset(self):
+        """
+        Empty both files and write a fresh index header
+        """
+        self._data.truncate(0)
+        self._index.truncate(0)
+        self._head = 0
+        self._count = 0
+        self._index.write(self.HEADER.pack(self.MAGIC, 0))
+        self._index.flush()
+
+    def _write_head(self):
+        """
+        Persist the position of the first live record in the index header
+        """
+        self._index.flush()
+        with open(self.index_file, 'r+b') as index_file:
+            index_file.write(self.HEADER.pack(self.MAGIC, self._head))
+
+    def _record(self, position):
+        """
+        Read the index record at a given position : (entry number, offset, timestamp, type)
+        """
+        self._index.seek(self.HEADER.size + position * self.RECORD.size)
+        entry_number, offset, timestamp, log_type = self.RECORD.unpack(self._index.read(self.RECORD.size))
+        return entry_number, offset, timestamp, log_type.rstrip(b"\0").decode("utf-8")
+
+    def _recover(self):
+        """
+        Drop index records pointing past the data, index data lines that have no record yet, and cut the data at a partially
+        written last line or at the first line that cannot be decoded (with everything after it)
+        """
+        self._index.flush()
+        self._data.flush()
+        data_size = os.path.getsize(self.data_file)
+        # Drop a torn index record and records whose data is missing :
+        self._index.truncate(self.HEADER.size + self._count * self.RECORD.size)
+        while self._count and self._record(self._count - 1)[1] >= data_size:
+            self._count -= 1
+        self._index.truncate(self.HEADER.size + self._count * self.RECORD.size)
+        self._head = min(self._head, self._count)
+        # Find where the last indexed line ends, and index the complete lines written after it :
+        self._data.seek(self._record(self._count - 1)[1] if self._count else 0)
+        if self._count:
+            self._data.readline()
+        offset = self._data.tell()
+        for line in self._data:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+                index_record = self._pack_record(record["entry"], offset, record["posix_timestamp"], record["type"])
+            except (ValueError, TypeError, KeyError, AttributeError, struct.error):  # corrupt line
+                break
+            self._append_record(index_record)
+            offset += len(line)
+        self._data.truncate(offset)
+        self._index.flush()
+
+    def _pack_record(self, entry_number, offset, timestamp, log_type):
+        """
+        Pack an index record, the type cut to 8 bytes on a character boundary
+        Raises struct.error (or AttributeError for a type that is not a string) on values the index cannot hold
+        """
+        return self.RECORD.pack(entry_number, offset, timestamp, log_type.encode("utf-8")[:8].decode("utf-8", errors = "ignore").encode("utf-8"))
+
+    def _append_record(self, index_record):
+        """
+        Append a packed record at the end of the index
+        """
+        self._index.seek(0, os.SEEK_END)
+        self._index.write(index_record)
+        self._count += 1
+
+    def _bisect(self, key, value):
+        """
+        Return the position of the first live record whose key (0 = entry number, 2 = timestamp) is >= value
+        """
+        low, high = self._head, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self._record(middle)[key] < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _read_from(self, position, stop = None):
+        """
+        Read and decode the records from a given index position to the stop position (the end by default)
+        """
+        if position >= self._count:
+            return []
+        self._data.flush()
+        self._data.seek(self._record(position)[1])
+        if stop is None or stop >= self._count:
+            lines = self._data.read().splitlines()
+        else:
+            lines = self._data.read(self._record(stop)[1] - self._record(position)[1]).splitlines()
+        return [json.loads(line) for line in lines]
+
+    @staticmethod
+    def _to_json(value):
+        """
+        Convert values json cannot serialize : objects providing as_dict() (such as log invokers) or their string form
+        """
+        return value.as_dict() if hasattr(value, "as_dict") else str(value)
+
+    def __len__(self):
+        """
+        Number of live entries
+        """
+        return self._count - self._head
+
+    def append(self, records):
+        """
+        Append a batch of records : dictionaries with "entry", "timestamp", "posix_timestamp", "type" and "args" keys
+        """
+        # Serialize the whole batch and its index records first, so a record that cannot be stored leaves the files untouched :
+        lines = [json.dumps(record, ensure_ascii = False, default = self._to_json).encode("utf-8") + b"\n" for record in records]
+        self._data.seek(0, os.SEEK_END)
+        offset = self._data.tell()
+        index_records = []
+        for record, line in zip(records, lines):
+            try:
+                index_records.append(self._pack_record(record["entry"], offset, record["posix_timestamp"], record["type"]))
+            except (AttributeError, struct.error) as e:
+                raise ValueError(f"cannot index record {record.get('entry')} : {e}") from e
+            offset += len(line)
+        # Data first, then index, so a crash in between is repaired by _recover() :
+        self._data.write(b"".join(lines))
+        self._data.flush()
+        for index_record in index_records:
+            self._append_record(index_record)
+
+    def last_entry_number(self):
+        """
+        Entry number of the last record, 0 if there is none
+        """
+        return self._record(self._count - 1)[0] if self._count else 0
+
+    def data_size(self):
+        """
+        Size of the data file, in bytes
+        """
+        self._data.seek(0, os.SEEK_END)
+        return self._data.tell()
+
+    def sync(self):
+        """
+        Flush both files to the operating system
+        """
+        self._data.flush()
+        self._index.flush()
+
+    def get(self, entry_number):
+        """
+        Return the record of a given entry number, or None if it is not in the log
+        """
+        position = self._bisect(0, entry_number)
+        if position < self._count and self._record(position)[0] == entry_number:
+            return self._read_from(position, position + 1)[0]
+        return None
+
+    def tail(self, number_of_entries):
+        """
+        Return the last number_of_entries records
+        """
+        return self._read_from(max(self._head, self._count - number_of_entries))
+
+    def since(self, timestamp):
+        """
+        Return the records written at or after a POSIX timestamp
+        Entries are indexed in the order they were queued, which is the order of their timestamps up to thread scheduling
+        """
+        return self._read_from(self._bisect(2, timestamp))
+
+    def records(self):
+        """
+        Iterate over every live record, oldest first, without loading the whole log in memory
+        """
+        if self._head >= self._count:
+            return
+        self._data.flush()
+        self._data.seek(self._record(self._head)[1])
+        for line in self._data:
+            yield json.loads(line)
+
+    def flush(self, number_of_entries = 0, inverse = False):
+        """
+        Delete entries : 0 = all of them, by default
+        inverse : by default, deletes oldest entries, but inverse makes it delete the newest ones
+        Deleting the newest entries truncates both files ; deleting the oldest ones moves the head of the index and only
+        compacts the files once more than half of the data is dead, so the cost of compaction is amortized over the writes
+        """
+        self.sync()
+        if not number_of_entries or number_of_entries >= len(self):
+            self._reset()
+        elif inverse:
+            self._count -= number_of_entries
+            self._data.truncate(self._record(self._count)[1])
+            self._index.truncate(self.HEADER.size + self._count * self.RECORD.size)
+        else:
+            self._head += number_of_entries
+            self._write_head()
+            if self._record(self._head)[1] > os.path.getsize(self.data_file) // 2:
+                self._compact()
+
+    def _compact(self):
+        """
+        Rewrite both files without the records before the head, into temporary files that replace them once synced to
+        disk : the index is removed before the data is replaced, so a crash in between leaves data that _recover()
+        indexes again, never an index that does not match it
+        """
+        self.sync()
+        start = self._record(self._head)[1]
+        temporary_data, temporary_index = self.data_file + ".compact", self.index_file + ".compact"
+        try:
+            with open(temporary_data, 'wb') as data_file:
+                self._data.seek(start)
+                shutil.copyfileobj(self._data, data_file)
+                data_file.flush()
+                os.fsync(data_file.fileno())
+            with open(temporary_index, 'wb') as index_file:
+                index_file.write(self.HEADER.pack(self.MAGIC, 0))
+                self._index.seek(self.HEADER.size + self._head * self.RECORD.size)
+                for entry_number, offset, timestamp, log_type in self.RECORD.iter_unpack(self._index.read((self._count - self._head) * self.RECORD.size)):
+                    index_file.write(self.RECORD.pack(entry_number, offset - start, timestamp, log_type))
+                index_file.flush()
+                os.fsync(index_file.fileno())
+        except BaseException:
+            for temporary_file in (temporary_data, temporary_index):
+                if os.path.exists(temporary_file):
+                    os.remove(temporary_file)
+            raise
+        self._data.close()
+        self._index.close()
+        os.remove(self.index_file)
+        os.replace(temporary_data, self.data_file)
+        os.replace(temporary_index, self.index_file)
+        self._data = open(self.data_file, 'ab+')
+        self._index = open(self.index_file, 'ab+')
+        self._count -= self._head
+        self._head = 0
+
+    def close(self):
+        """
+        Close both files
+        """
+        self.sync()
+        self._data.close()
+        self._index.close()
+
+# Example usage
+if __name__ == "__main__":
+    import time
+    indexed_log = IndexedLog("log.jsonl")
+    indexed_log.append([{"entry": len(indexed_log) + 1, "timestamp": "", "posix_timestamp": time.time(), "type": "DEBUG", "args": {"message": "hey, IndexedLog.py works !"}}])
+    print(indexed_log.tail(1))
+    indexed_log.close()
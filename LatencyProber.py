@@ -0,0 +1,137 @@
+import asyncio
+import os
+import threading
+import time
+from LogWriter import invoker
+
+class _UdpProbe(asyncio.DatagramProtocol):
+    """
+    Datagram protocol resolving a future with the time of the first reply
+    """
+    def __init__(self, future):
+        self.future = future
+
+    def datagram_received(self, data, address):
+        if not self.future.done():
+            self.future.set_result(time.perf_counter())
+
+    def error_received(self, exception):
+        if not self.future.done():
+            self.future.set_exception(exception)
+
+class LatencyProber:
+    """
+    Measure the latency of VPN servers concurrently with asyncio : TCP connect time for TCP remotes, round-trip time of an
+    openvpn handshake packet for UDP remotes, with a concurrency cap, a timeout per probe and results cached for ttl seconds
+    """
+    # P_CONTROL_HARD_RESET_CLIENT_V2 (opcode 7, key id 0), random session id, empty ack array, packet id 0 : the first packet
+    # of an openvpn handshake, answered by servers that do not require tls-auth/tls-crypt
+    UDP_PAYLOAD = bytes([7 << 3]) + os.urandom(8) + bytes(1) + bytes(4)
+
+    def __init__(self, logger, concurrency = 64, timeout = 1.0, ttl = 300):
+        """
+        concurrency : maximum number of probes in flight
+        timeout : seconds after which a server is considered unreachable
+        ttl : seconds during which a measure is reused instead of probing again
+        """
+        self.logger = logger
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.ttl = ttl
+        self._cache = {}  # (host, port, proto) -> (measure time, latency in seconds or None)
+        self._lock = threading.Lock()
+
+    async def _probe_tcp(self, host, port):
+        """
+        Return the TCP connect time to an endpoint
+        """
+        start = time.perf_counter()
+        _, writer = await asyncio.open_connection(host, port)
+        latency = time.perf_counter() - start
+        writer.close()
+        return latency
+
+    async def _probe_udp(self, host, port):
+        """
+        Return the round-trip time of an openvpn handshake packet to an endpoint
+        """
+        loop = asyncio.get_running_loop()
+        reply = loop.create_future()
+        transport, _ = await loop.create_datagram_endpoint(lambda: _UdpProbe(reply), remote_addr = (host, port))
+        try:
+            start = time.perf_counter()
+            transport.sendto(self.UDP_PAYLOAD)
+            return await reply - start
+        finally:
+            transport.close()
+
+    async def _probe(self, semaphore, endpoint):
+        """
+        Probe an endpoint under the concurrency cap, returning its latency or None if it is unreachable
+        """
+        host, port, proto = endpoint
+        async with semaphore:
+            probe = self._probe_tcp if proto.startswith("tcp") else self._probe_udp
+            try:
+                return await asyncio.wait_for(probe(host, port), self.timeout)
+            except (OSError, asyncio.TimeoutError):
+                return None
+
+    async def _probe_all(self, endpoints):
+        """
+        Probe every endpoint concurrently
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self._probe(semaphore, endpoint) for endpoint in endpoints))
+
+    def probe(self, endpoints):
+        """
+        Return the latency in seconds (None if unreachable) of each (host, port, proto) endpoint, probing only the ones
+        without a fresh cached measure
+        Runs its own event loop : call it from a worker thread, never from the GUI thread
+        """
+        now = time.monotonic()
+        with self._lock:
+            to_probe = list({endpoint for endpoint in endpoints if endpoint not in self._cache or now - self._cache[endpoint][0] > self.ttl})
+        if to_probe:
+            latencies = asyncio.run(self._probe_all(to_probe))
+            with self._lock:
+                for endpoint, latency in zip(to_probe, latencies):
+                    self._cache[endpoint] = (time.monotonic(), latency)
+            # Write to log file :
+            if self.logger.enabled("ACTION"):
+                self.logger.write("ACTION", {"action":f"probe the latency of {len(to_probe)} endpoints ({sum(latency is not None for latency in latencies)} reachable)", "invoker":invoker(self), "output":"0"})
+        with self._lock:
+            return {endpoint: self._cache[endpoint][1] for endpoint in endpoints}
+
+    def probe_configs(self, configs):
+        """
+        Return the latency of each configuration : the lowest latency of its remotes, or None if none of them is reachable
+        configs : configuration name -> metadata (see OvpnIndex)
+        """
+        remotes = {name: [tuple(remote) for remote in metadata["remotes"]] for name, metadata in configs.items()}
+        latencies = self.probe([endpoint for endpoints in remotes.values() for endpoint in endpoints])
+        results = {}
+        for name, endpoints in remotes.items():
+            measured = [latencies[endpoint] for endpoint in endpoints if latencies[endpoint] is not None]
+            results[name] = min(measured) if measured else None
+        return results
+
+# Example usage, against local stand-in servers :
+if __name__ == "__main__":
+    import socket
+    from LogWriter import LogWriter
+    logger = LogWriter("log.txt")
+    tcp_server = socket.create_server(("127.0.0.1", 0))
+    udp_server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_server.bind(("127.0.0.1", 0))
+    def echo():
+        data, address = udp_server.recvfrom(64)
+        udp_server.sendto(data, address)
+    threading.Thread(target = echo, daemon = True).start()
+    latency_prober = LatencyProber(logger, timeout = 0.5)
+    print(latency_prober.probe([
+        ("127.0.0.1", tcp_server.getsockname()[1], "tcp"),
+        ("127.0.0.1", udp_server.getsockname()[1], "udp"),
+        ("127.0.0.1", 9, "tcp")
+    ]))
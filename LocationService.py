@@ -0,0 +1,132 @@
+import csv
+import marshal
+import os
+import re
+import threading
+from LogWriter import invoker
+
+class LocationService:
+    """
+    Locate VPN servers : country codes are loaded once (from a marshal cache of the country codes file, rebuilt when the
+    file changes), and each configuration is located from its file name or its remote host, memoized per configuration
+    """
+    # Country codes used in server names that are not ISO 3166 codes :
+    ALIASES = {"UK": "GB", "EL": "GR"}
+    # Separators of the parts of file names and host names (us-nyc.prod.surfshark.com_udp.ovpn) :
+    SEPARATORS = re.compile(r"[-_.\s]+")
+    # Country code optionally followed by a server number (us, us1234, us01) :
+    COUNTRY_PART = re.compile(r"([a-z]{2})\d*")
+    # City code optionally followed by a server number (nyc, nyc2) :
+    CITY_PART = re.compile(r"([a-z]{3})\d*")
+    # Three-letter parts that are not city codes :
+    NOT_CITIES = ("udp", "tcp", "com", "net", "org", "vpn")
+
+    def __init__(self, countries_file, cache_file, logger):
+        """
+        Load the country codes, from the cache if it is up to date with the country codes file
+        """
+        self.countries_file = countries_file
+        self.cache_file = cache_file
+        self.logger = logger
+        self._locations = {}  # (configuration name, remote host) -> location
+        self._lock = threading.Lock()
+        self.countries = self._load()  # code -> country name
+
+    def _load(self):
+        """
+        Return the code -> country name dictionary, parsing the country codes file only if the cache is stale
+        """
+        mtime = os.stat(self.countries_file).st_mtime_ns
+        try:
+            with open(self.cache_file, 'rb') as cache_file:
+                cache = marshal.load(cache_file)
+            if cache["mtime"] == mtime:
+                return cache["countries"]
+        except (OSError, EOFError, ValueError, TypeError, KeyError):  # missing or corrupted cache : parse the file again
+            pass
+        with open(self.countries_file, newline = "") as countries_file:
+            reader = csv.reader(countries_file, delimiter = ",")
+            next(reader, None)  # header
+            countries = {row[1].upper(): row[0] for row in reader if len(row) > 1}
+        os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok = True)
+        temporary_file = self.cache_file + ".tmp"
+        with open(temporary_file, 'wb') as cache_file:
+            marshal.dump({"mtime": mtime, "countries": countries}, cache_file)
+        os.replace(temporary_file, self.cache_file)
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"Build country codes cache ({len(countries)} countries)", "invoker":invoker(self), "output":"0"})
+        return countries
+
+    def _country(self, part):
+        """
+        Return the country code of a name part (us, us1234, uk...) or None
+        """
+        match = self.COUNTRY_PART.fullmatch(part)
+        if match is None:
+            return None
+        code = match.group(1).upper()
+        code = self.ALIASES.get(code, code)
+        return code if code in self.countries else None
+
+    def _parse(self, name, host = False):
+        """
+        Return (country code, city code) from a file name or host name, or None
+        A country part counts only next to what server names put around it : a server number (us1234, node-de-05) or a
+        city code (us-nyc.prod.surfshark.com), or as the first label of a host name (de.example.com) ; a two-letter word
+        in a file name (my-home-vpn, office-at-work) is not a country
+        """
+        parts = [part for part in self.SEPARATORS.split(name.lower()) if part]
+        for index, part in enumerate(parts):
+            code = self._country(part)
+            if code is None:
+                continue
+            following = parts[index + 1] if index + 1 < len(parts) else ""
+            city = self.CITY_PART.fullmatch(following)
+            if city is not None and city.group(1) in self.NOT_CITIES:
+                city = None
+            numbered = len(part) > 2 or following.isdigit()
+            if numbered or city is not None or (index == 0 and (host or len(parts) == 1)):
+                return code, city.group(1).upper() if city is not None else ""
+        return None
+
+    def locate(self, name, metadata = None):
+        """
+        Return the location of a configuration, {"code", "country", "city"}, or None if it cannot be located
+        name : configuration file name, located first
+        metadata : its metadata (see OvpnIndex), whose remote host is located when the file name does not tell
+        """
+        host = metadata["remotes"][0][0] if metadata and metadata["remotes"] else None
+        key = (name, host)
+        with self._lock:
+            if key in self._locations:
+                return self._locations[key]
+        parsed = self._parse(os.path.splitext(name)[0])
+        if parsed is None and host is not None:
+            parsed = self._parse(host, host = True)
+            if parsed is None:
+                top_level_domain = host.rsplit(".", 1)[-1].upper()
+                top_level_domain = self.ALIASES.get(top_level_domain, top_level_domain)
+                if top_level_domain in self.countries:
+                    parsed = (top_level_domain, "")
+        location = {"code": parsed[0], "country": self.countries[parsed[0]], "city": parsed[1]} if parsed else None
+        with self._lock:
+            self._locations[key] = location
+        return location
+
+    def describe(self, name, metadata = None):
+        """
+        Return the location of a configuration as text (United States (NYC)), or "unknown"
+        """
+        location = self.locate(name, metadata)
+        if location is None:
+            return "unknown"
+        return f"{location['country']} ({location['city']})" if location["city"] else location["country"]
+
+# Example usage :
+if __name__ == "__main__":
+    from LogWriter import LogWriter
+    logger = LogWriter("log.txt")
+    location_service = LocationService("country_codes.csv", ".cache/country_codes.marshal", logger)
+    for name in ["us-nyc.prod.surfshark.com_udp.ovpn", "uk1234.nordvpn.com.tcp.ovpn", "node-de-05.protonvpn.net.udp.ovpn", "my-home-vpn.ovpn", "work.ovpn"]:
+        print(name, "->", location_service.describe(name, {"remotes": [["vpn.example.fr", 1194, "udp"]]}))
@@ -0,0 +1,224 @@
+import bisect
+import gzip
+import io
+import json
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+try:
+    import zstandard
+except ImportError:  # zstd compression is optional
+    zstandard = None
+
+class LogRotator:
+    """
+    Rotate a log file into numbered segments (log.000001.txt, log.000002.txt...) by size or age, compress closed segments
+    in a background thread and delete the oldest ones beyond a retained size
+    Segments are listed in a manifest (log.segments.json) with the range of entry numbers they hold, so old entries can still be found
+    """
+    COMPRESSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+    def __init__(self, log_file, max_bytes = 0, max_age = 0, max_retained_bytes = 0, compression = "gzip"):
+        """
+        Initialize the rotation settings (0 = no limit) and load the segment manifest
+        Rotation is disabled when neither max_bytes nor max_age is set : no manifest is created and no compressor runs,
+        but the segments archived by earlier runs can still be found
+        max_bytes : size of the active file that triggers a rotation
+        max_age : age of the active file, in seconds, that triggers a rotation
+        max_retained_bytes : total size of the archived segments above which the oldest ones are deleted
+        """
+        if compression not in self.COMPRESSIONS:
+            raise ValueError(f"unknown compression {compression}, expected one of {tuple(self.COMPRESSIONS)}")
+        if compression == "zstd" and zstandard is None:
+            raise ValueError("zstd compression requires the zstandard package")
+        self.log_file = log_file
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_retained_bytes = max_retained_bytes
+        self.compression = compression
+        self.enabled = bool(max_bytes or max_age)
+        self.base, self.extension = os.path.splitext(log_file)
+        self.manifest_file = self.base + ".segments.json"
+        self._lock = threading.Lock()  # guards the manifest, shared by the writer and compressor threads
+        if os.path.exists(self.manifest_file):
+            with open(self.manifest_file) as manifest_file:
+                manifest = json.load(manifest_file)
+        else:
+            manifest = None
+        self.segments = manifest["segments"] if manifest is not None else []
+        self.active_started = manifest["active_started"] if manifest is not None else time.time()
+        self._queue = queue.Queue()
+        self._thread = None
+        if not self.enabled:
+            return
+        if manifest is None:  # persist active_started now, so max_age does not restart on every launch before the first rotation
+            self._save_manifest()
+        # Compress segments in a background thread, resuming the ones left uncompressed by the last run :
+        self._start_compressor()
+        for segment in self.segments:
+            if not segment["compressed"] and self.compression != "none":
+                self._queue.put(segment)
+
+    def _start_compressor(self):
+        """
+        Start the compressor thread if it is not running
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target = self._compressor_loop, name = "LogRotator", daemon = True)
+            self._thread.start()
+
+    def _save_manifest(self):
+        """
+        Atomically write the manifest (temporary file + rename)
+        """
+        temporary_file = self.manifest_file + ".tmp"
+        with open(temporary_file, 'w') as manifest_file:
+            json.dump({"segments": self.segments, "active_started": self.active_started}, manifest_file, indent=2)
+        os.replace(temporary_file, self.manifest_file)
+
+    def _failed(self, action, error):
+        """
+        Report an error of the compressor thread on stderr : it has no log to write to but the one it rotates
+        """
+        print(f"LogRotator : failed to {action} : {error!r}", file = sys.stderr)
+
+    def should_rotate(self, size):
+        """
+        Return whether the active file, of a given size, must be rotated
+        """
+        if not self.enabled or not size:
+            return False
+        return bool((self.max_bytes and size >= self.max_bytes) or (self.max_age and time.time() - self.active_started >= self.max_age))
+
+    def rotate(self, data_file, last_entry, extra_files = ()):
+        """
+        Turn a closed active file holding the entries up to last_entry into the next segment and queue its compression
+        extra_files : files that belong to the active file but are not archived (such as an index), deleted instead
+        """
+        with self._lock:
+            number = self.segments[-1]["number"] + 1 if self.segments else 1
+            first_entry = self.segments[-1]["last_entry"] + 1 if self.segments else 1
+            segment_file = f"{self.base}.{number:06d}{self.extension}"
+            os.replace(data_file, segment_file)
+            for extra_file in extra_files:
+                if os.path.exists(extra_file):
+                    os.remove(extra_file)
+            segment = {
+                "number": number,
+                "file": segment_file,
+                "first_entry": first_entry,
+                "last_entry": last_entry,
+                "start": self.active_started,
+                "end": time.time(),
+                "bytes": os.path.getsize(segment_file),
+                "compressed": False
+            }
+            self.segments.append(segment)
+            self.active_started = time.time()
+            if self.compression == "none":
+                self._enforce_retention()
+            self._save_manifest()
+        if self.compression != "none":
+            self._start_compressor()
+            self._queue.put(segment)
+
+    def _compress(self, segment):
+        """
+        Compress a segment file next to it and delete the uncompressed one
+        """
+        compressed_file = segment["file"] + self.COMPRESSIONS[self.compression]
+        with open(segment["file"], 'rb') as source:
+            if self.compression == "gzip":
+                with gzip.open(compressed_file, 'wb') as destination:
+                    shutil.copyfileobj(source, destination)
+            else:
+                with open(compressed_file, 'wb') as destination:
+                    zstandard.ZstdCompressor().copy_stream(source, destination)
+        os.remove(segment["file"])
+        return compressed_file
+
+    def _compressor_loop(self):
+        """
+        Compress queued segments until the None sentinel is received, deleting the oldest segments beyond max_retained_bytes
+        A segment that cannot be compressed (disk full, permissions) is reported and kept uncompressed : the next ones are
+        still compressed and pruned
+        """
+        while True:
+            segment = self._queue.get()
+            if segment is None:
+                break
+            if not os.path.exists(segment["file"]):
+                continue
+            try:
+                compressed_file = self._compress(segment)
+            except Exception as e:
+                self._failed(f"compress {segment['file']}", e)
+                partial_file = segment["file"] + self.COMPRESSIONS[self.compression]
+                if os.path.exists(partial_file):
+                    os.remove(partial_file)
+                compressed_file = None
+            try:
+                with self._lock:
+                    if compressed_file is not None:
+                        segment["file"] = compressed_file
+                        segment["bytes"] = os.path.getsize(compressed_file)
+                        segment["compressed"] = True
+                    self._enforce_retention()
+                    self._save_manifest()
+            except Exception as e:
+                self._failed(f"prune the segments of {self.log_file}", e)
+
+    def _enforce_retention(self):
+        """
+        Delete the oldest segments until the archived size is within max_retained_bytes (the newest segment is always kept)
+        """
+        if not self.max_retained_bytes:
+            return
+        while len(self.segments) > 1 and sum(segment["bytes"] for segment in self.segments) > self.max_retained_bytes:
+            segment = self.segments.pop(0)
+            if os.path.exists(segment["file"]):
+                os.remove(segment["file"])
+
+    def find_segment(self, entry_number):
+        """
+        Return the file of the archived segment holding an entry number, the log file if it is in the active one,
+        or None if it was deleted by the retention policy
+        """
+        with self._lock:
+            if not self.segments or entry_number > self.segments[-1]["last_entry"]:
+                return self.log_file
+            position = bisect.bisect_left([segment["last_entry"] for segment in self.segments], entry_number)
+            segment = self.segments[position]
+            return segment["file"] if entry_number >= segment["first_entry"] else None
+
+    def open_segment(self, segment_file):
+        """
+        Open a segment file for reading as text, decompressing it if needed
+        """
+        if segment_file.endswith(".gz"):
+            return gzip.open(segment_file, 'rt')
+        if segment_file.endswith(".zst"):
+            return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(segment_file, 'rb')))
+        return open(segment_file)
+
+    def close(self):
+        """
+        Wait for the queued compressions to finish and stop the compressor thread
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+# Example usage
+if __name__ == "__main__":
+    with open("log.txt", 'a') as file:
+        file.write("entry 1 :\n")
+    log_rotator = LogRotator("log.txt", max_bytes = 1)
+    if log_rotator.should_rotate(os.path.getsize("log.txt")):
+        log_rotator.rotate("log.txt", 1)
+    log_rotator.close()
+    print(log_rotator.find_segment(1))
@@ -0,0 +1,172 @@
+import os
+import sys
+
+class Invoker:
+    """
+    Describe who wrote a log entry (file, instance and calling function) without formatting anything until the entry is rendered
+    """
+    __slots__ = ("code", "caller", "instance", "details")
+
+    def __init__(self, code, caller, instance = None, details = None):
+        self.code = code
+        self.caller = caller
+        self.instance = instance
+        self.details = details
+
+    def as_dict(self):
+        """
+        Format the invoker as the dictionary written in log entries
+        """
+        invoker_dict = {"file":os.path.basename(self.code.co_filename), "instance":f"{self.instance}", "called by":self.caller}
+        if self.details:
+            invoker_dict.update(self.details)
+        return invoker_dict
+
+def invoker(instance = None, details = None, depth = 1):
+    """
+    Capture the invoker of the function calling invoker() : its file and the name of the function that called it
+    Only walks frames (no source lines are read, unlike inspect.stack()) and defers formatting to when the entry is rendered
+    details : extra key/value pairs to add to the invoker, such as the running command
+    """
+    frame = sys._getframe(depth)
+    caller = frame.f_back.f_code.co_name if frame.f_back is not None else "<module>"
+    return Invoker(frame.f_code, caller, instance, details)
+
+# Base names of the source files of the invokers, by full path :
+_basenames = {}
+
+def _render_invoker(invoker, parts, prefix):
+    """
+    Append an invoker rendered as a tree to parts, as its as_dict() would be, without building the dictionary
+    """
+    if invoker.details:
+        _render_tree(invoker.as_dict(), parts, prefix)
+        return
+    path = invoker.code.co_filename
+    basename = _basenames.get(path)
+    if basename is None:
+        basename = _basenames[path] = os.path.basename(path)
+    parts.append(f"{prefix}├── file : {basename}\n{prefix}├── instance : {invoker.instance}\n{prefix}└── called by : {invoker.caller}\n")
+
+def _render_tree(d, parts, prefix):
+    """
+    Append a dictionary rendered as a tree to parts : the generic renderer, for nested values and undeclared payloads
+    """
+    last = len(d) - 1
+    for index, (key, value) in enumerate(d.items()):
+        branch = "└── " if index == last else "├── "
+        if isinstance(value, Invoker):
+            parts.append(f"{prefix}{branch}{key} :\n")
+            _render_invoker(value, parts, prefix + ("    " if index == last else "│   "))
+        elif isinstance(value, dict):
+            parts.append(f"{prefix}{branch}{key} :\n")
+            _render_tree(value, parts, prefix + ("    " if index == last else "│   "))
+        else:
+            parts.append(f"{prefix}{branch}{key} : {value}\n")
+
+class LogSchema:
+    """
+    Log entry renderers compiled from the keys declared per log type in config.json ("log" -> "types") : the connectors
+    and prefixes of every declared key are computed once, so rendering an entry of the declared shape is a pass over
+    its values and a single join
+    Payloads are checked against the declared keys : each undeclared type or key is reported once (see reports())
+    """
+    ENTRY_PREFIX = "    "
+
+    def __init__(self, types, reported = ()):
+        """
+        types : log type -> list of its keys, in rendering order
+        reported : (log type, key) pairs reported already (see the reported property), not to report again
+        """
+        self.types = {log_type: tuple(keys) for log_type, keys in types.items()}
+        self._renderers = {log_type: self._compile(log_type, keys) for log_type, keys in self.types.items()}
+        self._checked = set()  # (log type, payload keys) shapes validated already
+        self._reported = set(reported)  # (log type, key) pairs reported already, key None for an undeclared type
+        self._reports = []
+
+    def _compile(self, log_type, keys):
+        """
+        Return the renderer of the entries of a log type
+        """
+        header = f"└── type : {log_type}\n"
+        # Per key, in order : (connector of a value, connector of a nested value, prefix of the nested lines)
+        slots = []
+        for index, key in enumerate(keys):
+            branch, indent = ("└── ", "    ") if index == len(keys) - 1 else ("├── ", "│   ")
+            slots.append((f"{self.ENTRY_PREFIX}{branch}{key} : ", f"{self.ENTRY_PREFIX}{branch}{key} :\n", self.ENTRY_PREFIX + indent))
+        slots = tuple(slots)
+
+        def render(entry_number, timestamp, args):
+            if tuple(args) != keys:  # not the declared shape
+                self.validate(log_type, args)
+                return self._render_generic(entry_number, timestamp, header, args)
+            parts = [f"entry {entry_number} :\n├── timestamp : {timestamp}\n{header}"]
+            for (connector, nested_connector, nested_prefix), value in zip(slots, args.values()):
+                if isinstance(value, Invoker):
+                    parts.append(nested_connector)
+                    _render_invoker(value, parts, nested_prefix)
+                elif isinstance(value, dict):
+                    parts.append(nested_connector)
+                    _render_tree(value, parts, nested_prefix)
+                else:
+                    parts.append(f"{connector}{value}\n")
+            return "".join(parts)
+        return render
+
+    def _render_generic(self, entry_number, timestamp, header, args):
+        parts = [f"entry {entry_number} :\n├── timestamp : {timestamp}\n{header}"]
+        _render_tree(args, parts, self.ENTRY_PREFIX)
+        return "".join(parts)
+
+    def render(self, entry_number, timestamp, log_type, args):
+        """
+        Render an entry to the text written in the log file
+        """
+        renderer = self._renderers.get(log_type)
+        if renderer is None:
+            self.validate(log_type, args)
+            return self._render_generic(entry_number, timestamp, f"└── type : {log_type}\n", args)
+        return renderer(entry_number, timestamp, args)
+
+    def validate(self, log_type, args):
+        """
+        Check the keys of a payload against the keys declared for its type, queuing a report for each undeclared type or
+        key not reported yet ; declared keys may be left out
+        """
+        keys = tuple(args)
+        declared = self.types.get(log_type)
+        if keys == declared or (log_type, keys) in self._checked:
+            return
+        self._checked.add((log_type, keys))
+        if declared is None:
+            if (log_type, None) not in self._reported:
+                self._reported.add((log_type, None))
+                self._reports.append(f"undeclared log type {log_type} (keys : {', '.join(keys)})")
+            return
+        unknown = [key for key in keys if key not in declared and (log_type, key) not in self._reported]
+        if unknown:
+            self._reported.update((log_type, key) for key in unknown)
+            self._reports.append(f"undeclared keys in {log_type} log entries : {', '.join(unknown)} (declared : {', '.join(declared)})")
+
+    @property
+    def reported(self):
+        """
+        (log type, key) pairs reported already, key None for an undeclared type : given to the schema compiled when the
+        declared types change, so they are not reported again
+        """
+        return frozenset(self._reported)
+
+    def reports(self):
+        """
+        Return and forget the validation reports queued since the last call
+        """
+        reports, self._reports = self._reports, []
+        return reports
+
+# Example usage :
+if __name__ == "__main__":
+    schema = LogSchema({"ACTION": ["action", "invoker", "output"], "EVENT": ["event", "triggered by", "output"]})
+    print(schema.render(1, "2026-10-18T19:05:00+00:00", "ACTION", {"action":"example", "invoker":invoker(), "output":"0"}))
+    print(schema.render(2, "2026-10-18T19:05:01+00:00", "EVENT", {"event":"example", "triggered by":{"file":"LogSchema.py"}, "extra":"1"}))
+    print(schema.render(3, "2026-10-18T19:05:02+00:00", "EVENT", {"event":"example", "extra":"2"}))
+    print(schema.reports())
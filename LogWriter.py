@@ -1,63 +1,399 @@
+import atexit
 import datetime
-import json
 import os
+import queue
 import re
+import sys
+import threading
+import time
+from Config import Config
+from IndexedLog import IndexedLog
+from LogRotator import LogRotator
+from LogSchema import Invoker, LogSchema, invoker
+from Telemetry import telemetry
+
+# invoker and Invoker are re-exported : they used to be defined here, and modules import invoker from here
+__all__ = ["LogWriter", "Invoker", "invoker"]
 
 class LogWriter:
-    def __init__(self, log_file):
+    """
+    Write prettified log entries from a background thread : callers only enqueue entries, a single writer thread
+    keeps log.txt open, writes them in batches and saves the entry/error numbers to the state file every now and then
+    With the "jsonl" log format, entries are stored as indexed JSON records instead and the tree-rendered text is a view
+    generated on demand (render(), export_text())
+    Once the active file is too big or too old, it is rotated into a numbered segment that is compressed in the background
+    """
+    # Flush policies : flush the file after every entry, after every batch, or at most every flush_interval seconds
+    FLUSH_POLICIES = ("entry", "batch", "interval")
+    # Log formats : tree-rendered text in log_file, or JSON records in a .jsonl file next to it with an offset index
+    LOG_FORMATS = ("text", "jsonl")
+    # Seconds between two checks that the writer thread is still running, while waiting for room in the queue or for a sync :
+    WRITER_CHECK_INTERVAL = 0.5
+
+    def __init__(self, log_file, queue_size = None, batch_size = None, flush_policy = None, flush_interval = None, counter_save_interval = None, log_format = None):
         """
-        Initialize the log file and entry/error numbers
+        Initialize the log file, entry/error numbers and the background writer thread
+        Writer settings that are not given as arguments are read from config.json ("log" -> "writer")
         """
         self.log_file = log_file
-        with open("config.json") as config_file:
-            self.config = json.load(config_file)
-        self.entry_number = self.config["log"]["entry_number"]
-        self.error_number = self.config["log"]["error_number"]
+        self.config = Config.shared()
+        # Entry/error numbers of this log file (the GUI and the daemon write different logs), in the state file. The
+        # counters older versions shared between every log are the starting point of logs that have none yet :
+        self.counters_key = os.path.abspath(log_file)
+        counters = self.config.get_state("log", "counters", self.counters_key, default = {})
+        self.entry_number = counters.get("entry_number", self.config.get_state("log", "entry_number", default = 0))
+        self.error_number = counters.get("error_number", self.config.get_state("log", "error_number", default = 0))
+
+        # Writer settings :
+        writer_config = self.config.get_dict("log", "writer", default = {})
+        self.queue_size = queue_size if queue_size is not None else writer_config.get("queue_size", 10000)
+        self.batch_size = batch_size if batch_size is not None else writer_config.get("batch_size", 256)
+        self.flush_policy = flush_policy if flush_policy is not None else writer_config.get("flush_policy", "batch")
+        self.flush_interval = flush_interval if flush_interval is not None else writer_config.get("flush_interval", 1.0)
+        self.counter_save_interval = counter_save_interval if counter_save_interval is not None else writer_config.get("counter_save_interval", 100)
+        self.log_format = log_format if log_format is not None else writer_config.get("format", "text")
+        if self.flush_policy not in self.FLUSH_POLICIES:
+            raise ValueError(f"unknown flush policy {self.flush_policy}, expected one of {self.FLUSH_POLICIES}")
+        if self.log_format not in self.LOG_FORMATS:
+            raise ValueError(f"unknown log format {self.log_format}, expected one of {self.LOG_FORMATS}")
+        self.records_file = os.path.splitext(self.log_file)[0] + ".jsonl"
+        # Rotation settings (0 = no limit) :
+        rotation_config = self.config.get_dict("log", "rotation", default = {})
+        self._rotator = LogRotator(
+            self.records_file if self.log_format == "jsonl" else self.log_file,
+            max_bytes = rotation_config.get("max_bytes", 0),
+            max_age = rotation_config.get("max_age", 0),
+            max_retained_bytes = rotation_config.get("max_retained_bytes", 0),
+            compression = rotation_config.get("compression", "gzip")
+        )
+        # Log types that are dropped before anything is queued or formatted :
+        self.disabled_types = set(self.config.get_list("log", "disabled_types", default = []))
+        # Renderers compiled from the declared keys of every log type :
+        self.schema = LogSchema(self.config.get_dict("log", "types", default = {}))
+        self.config.subscribe("log", self._reload_settings)
 
-    def _get_timestamp(self):
+        # Writer state :
+        self._queue = queue.Queue(maxsize = self.queue_size)  # bounded : write() blocks instead of dropping entries when full
+        self._file_lock = threading.Lock()  # held by whoever touches the file handle (writer thread, flush, close)
+        self._state_lock = threading.Lock()  # makes closing and enqueuing atomic, so no entry is queued after the shutdown sentinel
+        self._closed = False
+        self._unsaved_entries = 0
+        self._last_flush = time.monotonic()
+        self._file = None
+        self._indexed_log = None
+        self._open_storage()
+        self._thread = threading.Thread(target = self._writer_loop, name = "LogWriter", daemon = True)
+        self._thread.start()
+        # Drain the queue when the interpreter exits :
+        atexit.register(self.close)
+
+    def _get_timestamp(self, posix_timestamp = None):
         """
-        Get the current timestamp in ISO 8601 format with timezone info
+        Get the current timestamp (or the given POSIX timestamp) in ISO 8601 format with timezone info
         """
-        return datetime.datetime.now(datetime.timezone.utc).isoformat()
+        if posix_timestamp is None:
+            return datetime.datetime.now(datetime.timezone.utc).isoformat()
+        return datetime.datetime.fromtimestamp(posix_timestamp, datetime.timezone.utc).isoformat()
+
+    def _open_storage(self):
+        """
+        Open the log file, or the indexed records with the "jsonl" log format
+        """
+        if self.log_format == "jsonl":
+            self._indexed_log = IndexedLog(self.records_file)
+            # Lookups bisect the entry numbers : never number an entry below the last one stored
+            self.entry_number = max(self.entry_number, self._indexed_log.last_entry_number())
+        else:
+            self._file = open(self.log_file, 'a')
+
+    def _close_storage(self):
+        """
+        Close the log file or the indexed records
+        """
+        if self._indexed_log is not None:
+            self._indexed_log.close()
+            self._indexed_log = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _storage_size(self):
+        """
+        Get the size of the active log file or indexed records
+        """
+        if self._indexed_log is not None:
+            return self._indexed_log.data_size()
+        return self._file.tell()
+
+    def _rotate(self):
+        """
+        Close the active file, hand it to the rotator as a new segment and start a new one
+        Runs in the writer thread : callers keep queuing entries meanwhile, and compression happens in the rotator's thread
+        """
+        self._close_storage()
+        self._save_counters()
+        if self.log_format == "jsonl":
+            self._rotator.rotate(self.records_file, self.entry_number, extra_files = (self.records_file + ".idx",))
+        else:
+            self._rotator.rotate(self.log_file, self.entry_number)
+        self._open_storage()
+
+    def _sync_storage(self):
+        """
+        Flush the log file or the indexed records to the operating system
+        """
+        if self._indexed_log is not None:
+            self._indexed_log.sync()
+        else:
+            self._file.flush()
+        self._last_flush = time.monotonic()
 
     def _increment_entry_number(self, log_type):
         """
-        Increment the number of entries and errors in config.json and for the script
+        Increment the number of entries and errors, saving them to the state file every counter_save_interval entries
         """
-        self.config["log"]["entry_number"] += 1
+        self.entry_number += 1
         if log_type == "ERROR":
-            self.config["log"]["error_number"] += 1
-        with open("config.json", 'w') as config_file:
-            json.dump(self.config, config_file, indent=2)
-        self.entry_number = self.config["log"]["entry_number"]
-        self.error_number = self.config["log"]["error_number"]
-
-    def _display_dict(self, d, indent=0, prefix=""):
-        items = list(d.items())
-        with open(self.log_file, 'a') as file:
-            for index, (key, value) in enumerate(items):
-                is_last = index == len(items) - 1
-                # Print key with proper connector
-                if isinstance(value, dict):
-                    file.write(f"{prefix}{'└── ' if is_last else '├── '}{key} :\n")
-                    # Update prefix for nested items, maintaining connector lines
-                    new_prefix = prefix + ('    ' if is_last else '│   ')
-                    # Recursive call for nested dictionary
-                    self._display_dict(value, indent + 1, new_prefix)
+            self.error_number += 1
+        self._unsaved_entries += 1
+        if self._unsaved_entries >= self.counter_save_interval:
+            self._save_counters()
+
+    def _save_counters(self):
+        """
+        Save the number of entries and errors to the state file (see Config)
+        """
+        self.config.set_state("log", "counters", self.counters_key, value = {"entry_number": self.entry_number, "error_number": self.error_number})
+        self.config.save_state()
+        self._unsaved_entries = 0
+
+    def _reload_settings(self, log_config):
+        """
+        Apply the log settings that can change while running (disabled types, declared keys) when config.json changes
+        """
+        self.disabled_types = set(log_config.get("disabled_types", []))
+        types = log_config.get("types", {})
+        if {log_type: tuple(keys) for log_type, keys in types.items()} != self.schema.types:
+            self.schema = LogSchema(types, reported = self.schema.reported)
+
+    def _render_entry(self, entry_number, timestamp, log_type, args):
+        """
+        Render an entry to the text written in the log file
+        """
+        return self.schema.render(entry_number, timestamp, log_type, args)
+
+    def _store(self, entries):
+        """
+        Number a batch of (POSIX timestamp, type, args) entries and write them to the open log file or indexed records
+        """
+        if self._indexed_log is not None:
+            records = []
+            for posix_timestamp, log_type, args in entries:
+                self.schema.validate(log_type, args)
+                self._increment_entry_number(log_type)
+                records.append({"entry": self.entry_number, "timestamp": self._get_timestamp(posix_timestamp), "posix_timestamp": posix_timestamp, "type": log_type, "args": args})
+            try:
+                self._indexed_log.append(records)
+            except (TypeError, ValueError):
+                # A record cannot be serialized : append them one by one, replacing those that fail
+                for record in records:
+                    try:
+                        self._indexed_log.append([record])
+                    except (TypeError, ValueError) as e:
+                        record.update(type = "ERROR", args = self._failed_entry(record["type"], e))
+                        self._indexed_log.append([record])
+        else:
+            for posix_timestamp, log_type, args in entries:
+                self._increment_entry_number(log_type)
+                timestamp = self._get_timestamp(posix_timestamp)
+                try:
+                    text = self._render_entry(self.entry_number, timestamp, log_type, args)
+                except Exception as e:
+                    text = self._render_entry(self.entry_number, timestamp, "ERROR", self._failed_entry(log_type, e))
+                self._file.write(text)
+        # Payloads that did not match the declared keys, reported once per undeclared type or key :
+        reports = self.schema.reports()
+        if reports and "WARNING" not in self.disabled_types:
+            now = time.time()
+            self._store([(now, "WARNING", {"message":report, "raised by":invoker(self)}) for report in reports])
+
+    def _failed_entry(self, log_type, error):
+        """
+        Return the arguments of the ERROR entry written instead of an entry that could not be rendered or serialized
+        """
+        return {"message":f"failed to write a {log_type} log entry : {error!r}", "raised by":invoker(self)}
+
+    def _writer_failed(self, action, error):
+        """
+        Report an error of the writer thread, which keeps running : it cannot be written to the log it failed to write
+        """
+        print(f"LogWriter : failed to {action} {self.log_file} : {error!r}", file = sys.stderr)
+
+    def _write_batch(self, entries):
+        """
+        Write a batch of entries, flushing them according to the flush policy
+        """
+        if telemetry.enabled:
+            telemetry.gauge("log_queue_depth", self._queue.qsize())
+            telemetry.observe("log_queue_latency_seconds", time.time() - entries[0][0])  # time the oldest entry waited
+        with self._file_lock, telemetry.span("log_write"):
+            try:
+                if self.flush_policy == "entry":
+                    for entry in entries:
+                        self._store([entry])
+                        self._sync_storage()
+                else:
+                    self._store(entries)
+                    if self.flush_policy == "batch" or time.monotonic() - self._last_flush >= self.flush_interval:
+                        self._sync_storage()
+                if self._rotator.should_rotate(self._storage_size()):
+                    self._rotate()
+            except Exception as e:
+                self._writer_failed(f"write {len(entries)} entries to", e)
+
+    def _sync_batch(self):
+        """
+        Flush the written entries, from the writer thread
+        """
+        with self._file_lock:
+            try:
+                self._sync_storage()
+            except Exception as e:
+                self._writer_failed("flush", e)
+
+    def _writer_loop(self):
+        """
+        Drain the queue in batches until the shutdown sentinel is received
+        Queue items are either (timestamp, type, args) entries, threading.Event markers set once everything before them is written, or None to stop
+        """
+        running = True
+        while running:
+            try:
+                # Wake up periodically so the interval flush policy also applies when no new entry comes in :
+                item = self._queue.get(timeout = self.flush_interval)
+            except queue.Empty:
+                if self._last_flush < time.monotonic() - self.flush_interval:
+                    self._sync_batch()
+                continue
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            entries = []
+            for item in batch:
+                if isinstance(item, tuple):
+                    entries.append(item)
+                    continue
+                # Write what came before a marker or the sentinel, then handle it :
+                if entries:
+                    self._write_batch(entries)
+                    entries = []
+                if item is None:
+                    running = False
                 else:
-                    # Print key-value pair with proper connector
-                    file.write(f"{prefix}{'└── ' if is_last else '├── '}{key} : {value}\n")
+                    self._sync_batch()
+                    item.set()
+            if entries:
+                self._write_batch(entries)
+
+    def enabled(self, log_type):
+        """
+        Return whether entries of a log type are written, so callers can skip building payloads that would be dropped
+        """
+        return log_type not in self.disabled_types
+
+    def set_enabled(self, log_type, enabled = True):
+        """
+        Enable or disable the writing of a log type
+        """
+        if enabled:
+            self.disabled_types.discard(log_type)
+        else:
+            self.disabled_types.add(log_type)
 
     def write(self, log_type, args):
         """
         Write a prettified log entry of the specified type to the log file using config.json for argument specification
+        The entry is queued and written by the background thread, or written directly if the writer has been closed
+        Entries of disabled log types are dropped
         """
-        self._increment_entry_number(log_type)
-        with open(self.log_file, 'a') as file:
-            file.write(f"entry {self.entry_number} :\n")
-            file.write(f"├── timestamp : {self._get_timestamp()}\n")
-            file.write(f"└── type : {log_type}\n")
-        self._display_dict(args, 1, "    ")
+        if log_type in self.disabled_types:
+            return
+        if not isinstance(args, dict):
+            raise TypeError(f"log entry arguments must be a dictionary, not {type(args).__name__}")
+        entry = (time.time(), log_type, args)
+        with self._state_lock:
+            if not self._closed and self._enqueue(entry):
+                return
+        # The writer is closed (or its thread is gone) : wait for it to finish draining so entries stay in order, then write synchronously
+        self._thread.join()
+        with self._file_lock:
+            reopen = self._file is None and self._indexed_log is None
+            if reopen:
+                self._open_storage()
+            self._store([entry])
+            if reopen:
+                self._close_storage()
+            self._save_counters()
+
+    def _enqueue(self, item):
+        """
+        Queue an item for the writer thread, waiting for room in the queue while the thread runs
+        Return False if the thread is not running, so callers never wait for a queue nobody drains
+        """
+        while self._thread.is_alive():
+            try:
+                self._queue.put(item, timeout = self.WRITER_CHECK_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def sync(self, timeout = None):
+        """
+        Block until every entry queued so far is written and flushed to the log file
+        Return False if the timeout expired first
+        """
+        marker = threading.Event()
+        with self._state_lock:
+            if self._closed:
+                return True
+            if not self._enqueue(marker):
+                return False
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # Stop waiting if the writer thread is gone :
+        while not marker.wait(self.WRITER_CHECK_INTERVAL if deadline is None else min(max(deadline - time.monotonic(), 0), self.WRITER_CHECK_INTERVAL)):
+            if not self._thread.is_alive() or (deadline is not None and time.monotonic() >= deadline):
+                return marker.is_set()
+        return True
+
+    def close(self):
+        """
+        Stop the writer thread after it wrote every queued entry, then save the entry/error numbers and close the log file
+        """
+        with self._state_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._enqueue(None)
+        self._thread.join()
+        with self._file_lock:
+            # Entries the writer thread could not take, if it is gone :
+            entries = []
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if isinstance(item, tuple):
+                    entries.append(item)
+                elif item is not None:
+                    item.set()
+            if entries and (self._file is not None or self._indexed_log is not None):
+                self._store(entries)
+            self._close_storage()
+            self._save_counters()
+        self._rotator.close()
+        atexit.unregister(self.close)
 
     def flush(self, number_of_entries = 0, inverse = False):
         """
@@ -65,45 +401,129 @@ class LogWriter:
         0 = all of them, by default
         inverse : by default, deletes oldest entries, but inverse makes it delete the newest ones
         """
-        if number_of_entries: # if the number of entries to delete is specified, flush the corresponding ones
-            with open(self.log_file, 'r') as log_file:
-                lines = log_file.readlines()
-                # Determine values for the for loop based on if we should loop in increasing or decreasing order :
-                (start, stop, step) = (len(lines) - 1, -1, -1) if inverse else (0, len(lines), 1)
-                # "Entry x :" where x is an int is the pattern to match to count the number of entries (to detect the number of lines to delete, which is inconsistent based on log type) :
-                pattern = r"Entry \d+ :"
-                number_of_entries_found = 0
-                number_of_entries_index = number_of_entries if inverse else number_of_entries + 1
-                # Find the line matching the pattern, starting from the end
-                for i in range(start, stop, step):
-                    if re.match(pattern, lines[i]):
-                        number_of_entries_found += 1
-                    if number_of_entries_found == number_of_entries_index:
-                        # If the pattern is found, truncate lines accordingly
-                        lines = lines[:i] if inverse else lines[i:]
-                        break
-                    if ((i == 0 and inverse) or (i == len(lines)-1 and (not inverse))):
-                        # If the list has been completely seen (meaning the number of entries was bigger than what was in the file), delete everything
-                        lines = []
-        else: # if it isn't specified, i.e. 0, then delete everything
-            lines = []
-        # Move to the beginning and write the modified lines back :
-        with open(self.log_file, 'w') as log_file:
-            log_file.seek(0)
-            log_file.writelines(lines)
-            log_file.truncate()  # Remove any leftover content
+        # Make sure every queued entry is in the file before counting entries :
+        self.sync()
+        with self._file_lock:
+            if self.log_format == "jsonl":
+                # Indexed records : a seek and a truncate instead of a rewrite
+                if self._closed:
+                    self._open_storage()
+                self._indexed_log.flush(number_of_entries, inverse)
+                if self._closed:
+                    self._close_storage()
+                return
+            if not self._closed:
+                self._file.close()
+            if number_of_entries: # if the number of entries to delete is specified, flush the corresponding ones
+                with open(self.log_file, 'r') as log_file:
+                    lines = log_file.readlines()
+                    # Determine values for the for loop based on if we should loop in increasing or decreasing order :
+                    (start, stop, step) = (len(lines) - 1, -1, -1) if inverse else (0, len(lines), 1)
+                    # "entry x :" where x is an int is the pattern to match to count the number of entries (to detect the number of lines to delete, which is inconsistent based on log type) :
+                    pattern = r"entry \d+ :"
+                    number_of_entries_found = 0
+                    number_of_entries_index = number_of_entries if inverse else number_of_entries + 1
+                    # Find the line matching the pattern, starting from the end
+                    for i in range(start, stop, step):
+                        if re.match(pattern, lines[i]):
+                            number_of_entries_found += 1
+                        if number_of_entries_found == number_of_entries_index:
+                            # If the pattern is found, truncate lines accordingly
+                            lines = lines[:i] if inverse else lines[i:]
+                            break
+                        if ((i == 0 and inverse) or (i == len(lines)-1 and (not inverse))):
+                            # If the list has been completely seen (meaning the number of entries was bigger than what was in the file), delete everything
+                            lines = []
+            else: # if it isn't specified, i.e. 0, then delete everything
+                lines = []
+            # Move to the beginning and write the modified lines back :
+            with open(self.log_file, 'w') as log_file:
+                log_file.seek(0)
+                log_file.writelines(lines)
+                log_file.truncate()  # Remove any leftover content
+            # Reopen the log file for the writer thread :
+            if not self._closed:
+                self._file = open(self.log_file, 'a')
+
+    def _query(self, method, *args):
+        """
+        Run a lookup on the indexed records once every queued entry is written
+        """
+        if self.log_format != "jsonl":
+            raise ValueError("indexed lookups require the jsonl log format")
+        self.sync()
+        with self._file_lock:
+            if self._closed:
+                self._open_storage()
+            result = getattr(self._indexed_log, method)(*args)
+            if self._closed:
+                self._close_storage()
+        return result
+
+    def get(self, entry_number):
+        """
+        Return the record of an entry from its number, or None if it was flushed (jsonl log format only)
+        """
+        return self._query("get", entry_number)
+
+    def tail(self, number_of_entries):
+        """
+        Return the records of the last number_of_entries entries (jsonl log format only)
+        """
+        return self._query("tail", number_of_entries)
+
+    def since(self, timestamp):
+        """
+        Return the records of the entries written since a timestamp : POSIX, ISO 8601 string or datetime (jsonl log format only)
+        """
+        if isinstance(timestamp, str):
+            timestamp = datetime.datetime.fromisoformat(timestamp)
+        if isinstance(timestamp, datetime.datetime):
+            timestamp = timestamp.timestamp()
+        return self._query("since", timestamp)
+
+    def find_segment(self, entry_number):
+        """
+        Return the file holding an entry number : an archived segment (see LogRotator.open_segment() to read it),
+        the active log file, or None if the segment was deleted
+        """
+        return self._rotator.find_segment(entry_number)
+
+    def render(self, records):
+        """
+        Render records (as returned by get(), tail() or since()) to the tree-rendered text of log.txt
+        """
+        return "".join(self._render_entry(record["entry"], record["timestamp"], record["type"], record["args"]) for record in records)
+
+    def export_text(self, path = None):
+        """
+        Write the tree-rendered text view of every indexed record to path (log_file by default)
+        """
+        if self.log_format != "jsonl":
+            raise ValueError("exporting a text view requires the jsonl log format")
+        self.sync()
+        with self._file_lock:
+            if self._closed:
+                self._open_storage()
+            with open(path or self.log_file, 'w') as file:
+                for record in self._indexed_log.records():
+                    file.write(self.render([record]))
+            if self._closed:
+                self._close_storage()
 
 # Example usage
 if __name__ == "__main__":
     logger = LogWriter("log.txt")
     logger.write("DEBUG", {"message":"hey, LogWriter.py works !"})
+    logger.close()
 # Example of logging commands for every type of events (to copy paste from so that arguments are already written)
 """
 logger.write("COMMAND", {"command":"", "requires sudo":"", "invoker":"", "output (STDOUT stream)":"", "errors (STDERR Stream)":""})
 logger.write("INFO", {"message":""})
 logger.write("DEBUG", {"message":""})
-logger.write("WARNING", {"message":"", "raised by":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}})
-logger.write("EVENT", {"event":"","triggered by":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
-logger.write("ACTION", {"action":"", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
-logger.write("ERROR", {"message":"", "raised by":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}", "running command":""}})
-"""
\ No newline at end of file
+logger.write("WARNING", {"message":"", "raised by":invoker(self)})
+logger.write("EVENT", {"event":"","triggered by":invoker(self), "output":"0"})
+if logger.enabled("ACTION"):
+    logger.write("ACTION", {"action":"", "invoker":invoker(self), "output":"0"})
+logger.write("ERROR", {"message":"", "raised by":invoker(self, {"running command":""})})
+"""
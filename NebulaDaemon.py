@@ -0,0 +1,371 @@
+import fcntl
+import json
+import os
+import queue
+import select
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+from Config import Config
+from ConnectionManager import ConnectionManager
+from DaemonClient import DaemonError, socket_path
+from LogWriter import LogWriter, invoker
+from TrafficStats import TrafficBuffer
+from VpnDiscovery import VpnDiscovery
+
+class NebulaDaemon:
+    """
+    Headless owner of the VPN tunnel : the tunnel outlives the clients (GUI, command line, scripts), several of which can
+    follow it at once
+    Protocol, one connection per request, which starts with a JSON line {"command": name, arguments...} answered by
+    JSON lines ({"error": message} if refused) :
+    - list : {"vpns": [names]}
+    - status : {"status": "off" / "connecting" / "switching" / "on" / "disconnecting", "vpn", "phases", "rates": [received, sent]}
+    - connect (vpn, wait) : {"vpn", "phases"}, once connected if wait is true
+    - disconnect (wait) : {"vpn", "return_code"}, once disconnected if wait is true
+    - stream (replay) : the status, the last replay output lines and the traffic history, then every message until the
+      client disconnects : {"event": "connecting" / "switching" / "connected" / "failed" / "disconnecting" / "disconnected", "vpn", ...},
+      {"output": [[stream name, line], ...]} and {"traffic": [[timestamp, received, sent], ...], "reset": whether to replace the previous samples}
+    - ping, shutdown : {}
+    """
+    # Seconds between two traffic and idle checks :
+    POLL_INTERVAL = 0.25
+    # Messages waiting to be sent to a streaming client, which is dropped past this count :
+    MAX_PENDING = 1000
+    BUSY = ("connecting", "switching", "disconnecting")
+
+    def __init__(self, socket_path, logger, idle_timeout = None):
+        """
+        idle_timeout : seconds without tunnel nor client after which the daemon exits (0 : never), config.json daemon.idle_timeout by default
+        """
+        config = Config.shared()
+        self.socket_path = socket_path
+        self.logger = logger
+        self.idle_timeout = idle_timeout if idle_timeout is not None else config.get_float("daemon", "idle_timeout", default = 0)
+        cache_path = config.resolve(config.get_str("paths", "cache"))
+        self.vpn_discovery = VpnDiscovery(config.get_list("paths", "vpns"), os.path.join(cache_path, "daemon_vpns.json"), logger)
+        self.traffic_buffer = TrafficBuffer(config.get_int("traffic", "history", default = 300))
+        self.connection = ConnectionManager(logger, self.traffic_buffer, config.get_int("traffic", "interval", default = 1), self._broadcast_output)
+        self.status = "off"
+        self.vpn = None
+        self.phases = None
+        self._lock = threading.Lock()
+        self._streams = set()  # message queues of the streaming clients
+        self._streams_lock = threading.Lock()
+        self._connections = 0
+        self._last_activity = time.monotonic()
+        self._stopping = threading.Event()
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":"initialize NebulaDaemon instance", "invoker":invoker(self), "output":"0"})
+
+    # Tunnel :
+
+    def _path(self, vpn):
+        """
+        Return the path of a VPN configuration from its name
+        """
+        self.vpn_discovery.list()  # cached by directory modification time
+        for directory, names in self.vpn_discovery.listings.items():
+            if vpn in names:
+                return os.path.join(directory, vpn)
+        raise DaemonError(f"unknown VPN {vpn}")
+
+    def _status(self):
+        rates = self.traffic_buffer.rates()
+        with self._lock:
+            return {"status": self.status, "vpn": self.vpn, "phases": self.phases, "rates": list(rates[-1][1:]) if rates and self.status == "on" else None}
+
+    def connect(self, vpn, wait = True):
+        """
+        Connect to a VPN, switching from the connected one
+        """
+        config_path = self._path(vpn)
+        with self._lock:
+            if self.status in self.BUSY:
+                raise DaemonError(f"busy {self.status}")
+            self.status = "switching" if self.vpn else "connecting"
+            event = {"event": self.status, "vpn": vpn}
+        self._broadcast(event)
+        future = self.connection.switch(vpn, config_path, lambda phases, error: self._switched(vpn, phases, error))
+        if not wait:
+            return {"vpn": vpn, "phases": None}
+        try:
+            return {"vpn": vpn, "phases": future.result()}
+        except Exception as e:
+            raise DaemonError(f"connection to {vpn} failed : {e}")
+
+    def _switched(self, vpn, phases, error):
+        """
+        Called from a ConnectionManager worker thread once connected (error None) or once connecting failed
+        """
+        with self._lock:
+            self.status, self.vpn, self.phases = ("on", vpn, phases) if error is None else ("off", None, None)
+        if error is None:
+            self._broadcast({"event": "connected", "vpn": vpn, "phases": phases})
+            # Write to log file :
+            self.logger.write("EVENT", {"event":f"Connected to VPN {vpn}","triggered by":invoker(self), "output":"0"})
+        else:
+            self._broadcast({"event": "failed", "vpn": vpn, "error": str(error)})
+            # Write to log file :
+            self.logger.write("EVENT", {"event":f"Connection to VPN {vpn} failed : {error}","triggered by":invoker(self), "output":"1"})
+
+    def disconnect(self, wait = True):
+        """
+        Disconnect the tunnel, if there is one
+        """
+        with self._lock:
+            if self.status in self.BUSY:
+                raise DaemonError(f"busy {self.status}")
+            if self.vpn is None:
+                return {"vpn": None, "return_code": None}
+            vpn = self.vpn
+            self.status = "disconnecting"
+        self._broadcast({"event": "disconnecting", "vpn": vpn})
+        future = self.connection.disconnect(lambda return_code: self._disconnected(vpn, return_code))
+        return {"vpn": vpn, "return_code": future.result() if wait else None}
+
+    def _disconnected(self, vpn, return_code):
+        with self._lock:
+            self.status, self.vpn, self.phases = "off", None, None
+        self._broadcast({"event": "disconnected", "vpn": vpn, "return_code": return_code})
+        # Write to log file :
+        self.logger.write("EVENT", {"event":f"Disconnection from VPN {vpn} (openvpn return code {return_code})","triggered by":invoker(self), "output":"0"})
+
+    # Streams :
+
+    def _broadcast(self, message):
+        """
+        Queue a message for every streaming client, dropping the ones too slow to keep up
+        """
+        with self._streams_lock:
+            for messages in list(self._streams):
+                try:
+                    messages.put_nowait(message)
+                except queue.Full:
+                    self._streams.discard(messages)
+
+    def _broadcast_output(self, batch):
+        """
+        Subscriber of the openvpn output (see CommandRunner.subscribe)
+        """
+        if self._streams:
+            self._broadcast({"output": [[stream_name, line] for _, stream_name, line in batch]})
+
+    def _traffic_loop(self):
+        """
+        Send the new traffic samples to the streaming clients
+        """
+        version, last_sample = self.traffic_buffer.version, None
+        while not self._stopping.wait(self.POLL_INTERVAL):
+            if self.traffic_buffer.version == version:
+                continue
+            version = self.traffic_buffer.version
+            samples = self.traffic_buffer.samples()
+            # Samples newer than the last one sent, or all of them if the buffer was cleared :
+            if last_sample is not None and last_sample in samples:
+                self._broadcast({"traffic": samples[samples.index(last_sample) + 1:], "reset": False})
+            else:
+                self._broadcast({"traffic": samples, "reset": True})
+            last_sample = samples[-1] if samples else None
+
+    def _stream(self, connection, replay, send):
+        """
+        Send the state of the tunnel, then every message, until the client disconnects or falls behind
+        """
+        messages = queue.Queue(self.MAX_PENDING)
+        with self._streams_lock:
+            self._streams.add(messages)
+        try:
+            send(self._status())
+            command_runner = self.connection.command_runner
+            if replay and command_runner is not None:
+                send({"output": [[stream_name, line] for _, stream_name, line in command_runner.lines(replay)]})
+            send({"traffic": self.traffic_buffer.samples(), "reset": True})
+            while not self._stopping.is_set():
+                try:
+                    send(messages.get(timeout = self.POLL_INTERVAL))
+                except queue.Empty:
+                    with self._streams_lock:
+                        if messages not in self._streams:  # dropped
+                            return
+                    # The client sends nothing : readable means it disconnected
+                    if select.select([connection], [], [], 0)[0] and not connection.recv(1):
+                        return
+        finally:
+            with self._streams_lock:
+                self._streams.discard(messages)
+
+    # Server :
+
+    def _handle(self, connection):
+        """
+        Serve one request
+        """
+        def send(message):
+            connection.sendall(json.dumps(message).encode() + b"\n")
+        reader = connection.makefile('rb')
+        try:
+            request = json.loads(reader.readline() or b"{}")
+            command = request.get("command")
+            if command == "stream":
+                self._stream(connection, int(request.get("replay", 0)), send)
+            elif command == "list":
+                send({"vpns": self.vpn_discovery.list()})
+            elif command == "status":
+                send(self._status())
+            elif command == "connect":
+                send(self.connect(str(request.get("vpn")), bool(request.get("wait", True))))
+            elif command == "disconnect":
+                send(self.disconnect(bool(request.get("wait", True))))
+            elif command in ("ping", "shutdown"):
+                send({})
+                if command == "shutdown":
+                    self._stopping.set()
+            else:
+                send({"error": f"unknown command {command}"})
+        except DaemonError as e:
+            self._send_error(send, str(e))
+        except (ValueError, AttributeError, TypeError):
+            self._send_error(send, "invalid request")
+        except OSError:  # the client is gone
+            pass
+        finally:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            reader.close()
+            connection.close()
+            with self._lock:
+                self._connections -= 1
+                self._last_activity = time.monotonic()
+
+    def _send_error(self, send, message):
+        try:
+            send({"error": message})
+        except OSError:
+            pass
+
+    def _authorized(self, connection):
+        """
+        Only accept connections from the current user (the socket permissions already restrict them where peer credentials are not available)
+        """
+        if not hasattr(socket, "SO_PEERCRED"):
+            return True
+        _, uid, _ = struct.unpack("3i", connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+        return uid == os.getuid()
+
+    def _idle(self):
+        with self._lock:
+            return self.idle_timeout > 0 and not self._connections and self.status == "off" and time.monotonic() - self._last_activity > self.idle_timeout
+
+    def serve(self, detach = False):
+        """
+        Accept requests until shut down, stopped or idle for idle_timeout seconds, then disconnect and remove the socket
+        Return False if another daemon serves the socket already
+        detach : once listening, stop using the standard streams of the process that started the daemon
+        """
+        directory = os.path.dirname(self.socket_path)
+        os.makedirs(directory, mode = 0o700, exist_ok = True)
+        if os.stat(directory).st_uid != os.getuid():
+            raise DaemonError(f"the socket directory {directory} belongs to another user")
+        # One daemon per socket : the lock is held as long as the daemon runs
+        lock_file = open(f"{self.socket_path}.lock", 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        listener.listen()
+        listener.settimeout(self.POLL_INTERVAL)
+        threading.Thread(target = self._traffic_loop, name = "NebulaDaemon traffic", daemon = True).start()
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"serve connection daemon on {self.socket_path}", "invoker":invoker(self), "output":"0"})
+        # Tell the client that started the daemon it can connect :
+        print("ready", flush = True)
+        if detach:
+            with open(os.devnull, 'r+') as devnull:
+                for descriptor in (0, 1, 2):
+                    os.dup2(devnull.fileno(), descriptor)
+        try:
+            while not self._stopping.is_set():
+                try:
+                    connection, _ = listener.accept()
+                except socket.timeout:
+                    if self._idle():
+                        break
+                    continue
+                if not self._authorized(connection):
+                    connection.close()
+                    continue
+                with self._lock:
+                    self._connections += 1
+                    self._last_activity = time.monotonic()
+                threading.Thread(target = self._handle, args = (connection,), daemon = True).start()
+        finally:
+            listener.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self._stopping.set()
+            self.close()
+            lock_file.close()
+        return True
+
+    def stop(self):
+        """
+        Make serve() return, from any thread or a signal handler
+        """
+        self._stopping.set()
+
+    def close(self):
+        """
+        Disconnect and stop the privileged helper
+        """
+        from PrivilegedHelper import PrivilegedHelper
+        vpn = self.vpn
+        self.connection.close()
+        PrivilegedHelper.stop_shared()
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"stop connection daemon{f', disconnecting from VPN {vpn}' if vpn else ''}", "invoker":invoker(self), "output":"0"})
+
+def main(arguments):
+    """
+    Entry point of the daemon process
+    """
+    import argparse
+    parser = argparse.ArgumentParser(description = "Nebula connection daemon")
+    parser.add_argument("--socket", help = "socket to listen on, see DaemonClient.socket_path")
+    parser.add_argument("--idle-timeout", type = float, help = "seconds without tunnel nor client before exiting, 0 : never")
+    parser.add_argument("--detach", action = "store_true", help = "close the standard streams once listening (used by DaemonClient.start)")
+    options = parser.parse_args(arguments)
+    # Relative to the configuration, not to the directory of whichever client started the daemon :
+    config = Config.shared()
+    logger = LogWriter(config.resolve(config.get_str("daemon", "log_file", default = "daemon_log.txt")))
+    daemon = NebulaDaemon(options.socket or socket_path(), logger, options.idle_timeout)
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stop())
+    signal.signal(signal.SIGINT, lambda *_: daemon.stop())
+    try:
+        if not daemon.serve(options.detach):
+            print(f"a daemon is running on {daemon.socket_path} already", file = sys.stderr)
+            return 1
+    except DaemonError as e:
+        print(e, file = sys.stderr)
+        return 1
+    finally:
+        logger.close()
+    return 0
+
+# Run the daemon in the foreground :
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
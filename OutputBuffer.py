@@ -0,0 +1,151 @@
+import collections
+import threading
+import time
+import traceback
+
+class Subscription:
+    """
+    Deliver output lines to a consumer from a dedicated thread, in coalesced batches, so a slow consumer never stalls the reader
+    Lines waiting for delivery are bounded : past max_pending, the "drop_oldest" policy drops the oldest ones (counted in dropped)
+    and the "block" policy makes the producer wait
+    """
+    POLICIES = ("drop_oldest", "block")
+
+    def __init__(self, callback, max_pending = 10000, policy = "drop_oldest", interval = 0.05):
+        """
+        callback(batch) receives lists of (timestamp, stream name, line) tuples
+        interval : minimum time between two deliveries, in seconds, during which lines are coalesced
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"unknown backpressure policy {policy}, expected one of {self.POLICIES}")
+        self.callback = callback
+        self.max_pending = max_pending
+        self.policy = policy
+        self.interval = interval
+        self.dropped = 0
+        self._pending = collections.deque()
+        self._condition = threading.Condition()
+        self._active = True
+        self._thread = threading.Thread(target = self._deliver, name = "Subscription", daemon = True)
+        self._thread.start()
+
+    def push(self, lines):
+        """
+        Queue lines for delivery, applying the backpressure policy
+        """
+        with self._condition:
+            if not self._active:
+                return
+            if self.policy == "drop_oldest":
+                self._pending.extend(lines)
+                overflow = len(self._pending) - self.max_pending
+                for _ in range(overflow):
+                    self._pending.popleft()
+                self.dropped += max(overflow, 0)
+            else:
+                for line in lines:
+                    while len(self._pending) >= self.max_pending and self._active:
+                        self._condition.notify_all()
+                        self._condition.wait()
+                    self._pending.append(line)
+            self._condition.notify_all()
+
+    def _deliver(self):
+        """
+        Hand everything pending to the callback, at most once per interval, until closed and drained
+        """
+        while True:
+            with self._condition:
+                while not self._pending and self._active:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                batch = list(self._pending)
+                self._pending.clear()
+                self._condition.notify_all()
+            # A failing consumer must not stop the deliveries : under the "block" policy, the producer would wait forever
+            try:
+                self.callback(batch)
+            except Exception:
+                traceback.print_exc()
+            if self.interval:
+                time.sleep(self.interval)
+
+    def close(self, wait = True):
+        """
+        Stop accepting lines ; the delivery thread hands over what is still pending and stops
+        """
+        with self._condition:
+            self._active = False
+            self._condition.notify_all()
+        if wait and threading.current_thread() is not self._thread:
+            self._thread.join()
+
+class OutputBuffer:
+    """
+    Fixed-capacity ring buffer of timestamped output lines, so memory stays constant however long a command runs,
+    with subscribers receiving new lines as they come
+    """
+    def __init__(self, capacity = 10000):
+        self.capacity = capacity
+        self._lines = collections.deque(maxlen = capacity)  # (timestamp, stream name, line)
+        self._subscriptions = []
+        self._lock = threading.Lock()
+
+    def append(self, stream_name, lines):
+        """
+        Add lines read from a stream, and push them to the subscribers
+        """
+        timestamp = time.time()
+        entries = [(timestamp, stream_name, line) for line in lines]
+        with self._lock:
+            self._lines.extend(entries)
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.push(entries)
+
+    def snapshot(self, count = None):
+        """
+        Return the last count lines (all the buffered ones by default), oldest first
+        """
+        with self._lock:
+            lines = list(self._lines)
+        return lines[-count:] if count else lines
+
+    def subscribe(self, callback, max_pending = 10000, policy = "drop_oldest", interval = 0.05, replay = False):
+        """
+        Deliver new lines to callback(batch) from a dedicated thread (see Subscription) and return the subscription
+        replay : start by delivering the lines already buffered
+        """
+        subscription = Subscription(callback, max_pending, policy, interval)
+        with self._lock:
+            if replay:
+                subscription.push(list(self._lines))
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription, wait = True):
+        """
+        Stop delivering lines to a subscriber
+        """
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+        subscription.close(wait)
+
+    def close(self, wait = True):
+        """
+        Close every subscription once their pending lines are delivered
+        """
+        with self._lock:
+            subscriptions, self._subscriptions = self._subscriptions, []
+        for subscription in subscriptions:
+            subscription.close(wait)
+
+# Example usage :
+if __name__ == "__main__":
+    output_buffer = OutputBuffer(capacity = 3)
+    output_buffer.subscribe(print)
+    output_buffer.append("STDOUT", ["line 1", "line 2", "line 3", "line 4"])
+    output_buffer.close()
+    print(output_buffer.snapshot())
@@ -0,0 +1,182 @@
+import concurrent.futures
+import marshal
+import multiprocessing
+import os
+import threading
+from LogWriter import invoker
+
+# Inline blocks holding embedded certificates and keys :
+EMBEDDED_BLOCKS = ("ca", "cert", "key", "tls-auth", "tls-crypt", "tls-crypt-v2", "pkcs12", "extra-certs")
+
+def parse_config(path):
+    """
+    Parse an openvpn configuration file and return its metadata :
+    remotes ([host, port, proto] lists), proto, cipher, auth-user-pass (bool), embedded blocks (certificates and keys) and device
+    Return None if the file cannot be read
+    """
+    metadata = {"remotes": [], "proto": "udp", "port": 1194, "cipher": "", "auth_user_pass": False, "embedded": [], "dev": ""}
+    remotes = []
+    try:
+        with open(path, errors = "replace") as config_file:
+            inline_block = None
+            for line in config_file:
+                line = line.strip()
+                if inline_block is not None:
+                    if line == f"</{inline_block}>":
+                        inline_block = None
+                    continue
+                if not line or line[0] in "#;":
+                    continue
+                if line[0] == "<" and line[-1] == ">" and line[1] != "/":
+                    inline_block = line[1:-1]
+                    if inline_block in EMBEDDED_BLOCKS:
+                        metadata["embedded"].append(inline_block)
+                    continue
+                words = line.split()
+                directive = words[0]
+                if directive == "remote" and len(words) > 1:
+                    remotes.append(words[1:4])
+                elif directive == "proto" and len(words) > 1:
+                    metadata["proto"] = words[1]
+                elif directive in ("port", "rport") and len(words) > 1 and words[1].isdigit():
+                    metadata["port"] = int(words[1])
+                elif directive in ("cipher", "data-ciphers") and len(words) > 1:
+                    metadata["cipher"] = words[1]
+                elif directive == "auth-user-pass":
+                    metadata["auth_user_pass"] = True
+                elif directive == "dev" and len(words) > 1:
+                    metadata["dev"] = words[1]
+    except OSError:
+        return None
+    # Remotes default to the global port and proto :
+    for remote in remotes:
+        port = int(remote[1]) if len(remote) > 1 and remote[1].isdigit() else metadata["port"]
+        proto = remote[2] if len(remote) > 2 else metadata["proto"]
+        metadata["remotes"].append([remote[0], port, proto])
+    return metadata
+
+def _parse_configs(paths):
+    """
+    Parse a chunk of configuration files (run in the worker processes)
+    """
+    return [parse_config(path) for path in paths]
+
+class OvpnIndex:
+    """
+    Metadata of every VPN configuration, parsed on a worker pool and kept in a compact on-disk index (marshal)
+    invalidated by file modification time and size, so that looking a configuration up is a dictionary lookup
+    """
+    # Below this number of files to parse, parsing in-process is faster than starting worker processes :
+    POOL_THRESHOLD = 64
+    CHUNK_SIZE = 64
+
+    def __init__(self, index_file, logger):
+        """
+        Load the on-disk index
+        """
+        self.index_file = index_file
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._entries = {}  # path -> (mtime_ns, size, metadata)
+        self._names = {}  # configuration name -> path
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, 'rb') as index_file:
+                    self._entries = marshal.load(index_file)
+            except (EOFError, ValueError, TypeError):  # corrupted index : parse everything again
+                self._entries = {}
+
+    def _save(self):
+        """
+        Atomically write the index (temporary file + rename)
+        """
+        os.makedirs(os.path.dirname(self.index_file) or ".", exist_ok = True)
+        temporary_file = self.index_file + ".tmp"
+        with open(temporary_file, 'wb') as index_file:
+            marshal.dump(self._entries, index_file)
+        os.replace(temporary_file, self.index_file)
+
+    def update(self, listings):
+        """
+        Bring the index up to date with the configurations of listings (directory -> configuration names, see VpnDiscovery),
+        parsing only the new and modified files, and forgetting the ones that are gone
+        """
+        stats = {}
+        names = {}
+        for directory, directory_names in listings.items():
+            for name in directory_names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                names[name] = path
+                stats[path] = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            to_parse = [path for path, (mtime, size) in stats.items() if self._entries.get(path, (None, None))[:2] != (mtime, size)]
+        if len(to_parse) >= self.POOL_THRESHOLD:
+            # Not forked : update() runs on a worker thread of the GUI, and a fork could copy locks held by its other threads
+            with concurrent.futures.ProcessPoolExecutor(mp_context = multiprocessing.get_context("forkserver")) as executor:
+                chunks = [to_parse[index:index + self.CHUNK_SIZE] for index in range(0, len(to_parse), self.CHUNK_SIZE)]
+                parsed = [metadata for chunk in executor.map(_parse_configs, chunks) for metadata in chunk]
+        else:
+            parsed = _parse_configs(to_parse)
+        with self._lock:
+            for path, metadata in zip(to_parse, parsed):
+                if metadata is not None:
+                    self._entries[path] = stats[path] + (metadata,)
+            stale = [path for path in self._entries if path not in stats]
+            for path in stale:
+                del self._entries[path]
+            self._names = names
+            if to_parse or stale:
+                self._save()
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"index VPN configurations ({len(to_parse)} parsed, {len(stats) - len(to_parse)} up to date, {len(stale)} removed)", "invoker":invoker(self), "output":"0"})
+
+    def lookup(self, name):
+        """
+        Return the metadata of a configuration from its name, or None if it is not indexed (yet)
+        """
+        with self._lock:
+            entry = self._entries.get(self._names.get(name))
+        return entry[2] if entry else None
+
+    def path(self, name):
+        """
+        Return the path of a configuration from its name, or None if it is not listed
+        """
+        with self._lock:
+            return self._names.get(name)
+
+    def configs(self):
+        """
+        Return the metadata of every indexed configuration, by configuration name
+        """
+        with self._lock:
+            return {name: self._entries[path][2] for name, path in self._names.items() if path in self._entries}
+
+    def filter(self, proto = None, port = None):
+        """
+        Return the names of the configurations with a remote (or default) matching a protocol and/or a port
+        """
+        matches = []
+        with self._lock:
+            for name, path in self._names.items():
+                entry = self._entries.get(path)
+                if entry is None:
+                    continue
+                metadata = entry[2]
+                endpoints = [(remote_port, remote_proto) for _, remote_port, remote_proto in metadata["remotes"]] or [(metadata["port"], metadata["proto"])]
+                if any((proto is None or endpoint_proto.startswith(proto)) and (port is None or endpoint_port == port) for endpoint_port, endpoint_proto in endpoints):
+                    matches.append(name)
+        return matches
+
+# Example usage :
+if __name__ == "__main__":
+    from LogWriter import LogWriter
+    logger = LogWriter("log.txt")
+    ovpn_index = OvpnIndex(".cache/ovpn_index.marshal", logger)
+    ovpn_index.update({"/etc/openvpn": [name for name in os.listdir("/etc/openvpn") if name.endswith(".ovpn")]})
+    print(ovpn_index.filter(proto = "udp"))
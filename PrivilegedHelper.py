@@ -0,0 +1,597 @@
+import json
+import os
+import select
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from IOLoop import IOLoop
+from LogWriter import invoker
+
+class HelperError(Exception):
+    """
+    Raised when the privileged helper cannot be started or reached
+    """
+
+class HelperServer:
+    """
+    The helper process : runs the whitelisted commands requested over a Unix socket and streams back their output
+    Protocol, one connection per request, which starts with a JSON line :
+    - {"run": [name, arguments...]} : answered by "p <pid>", then "1 <stdout line>" / "2 <stderr line>", then "x <return code>"
+      ("e <message>" if refused) ; "signal <number>" lines sent by the client signal the command, closing the connection terminates it
+      The arguments of openvpn and ip are checked (see _openvpn_argv() and _ip_argv()) : the helper builds their command line
+      itself, so a client cannot run scripts or other programs through them
+    - {"shutdown": true} : terminate every command and exit, answered by "x 0"
+    - {"ping": true} : answered by "x 0"
+    """
+    # Commands run as root, looked up in the system directories only :
+    WHITELIST = ("openvpn", "ip")
+    SAFE_PATH = "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
+    SIGNALS = {signal.SIGTERM, signal.SIGKILL, signal.SIGINT, signal.SIGHUP, signal.SIGUSR1, signal.SIGUSR2}
+    # openvpn options refused in configurations : they run scripts, plugins or other programs as root, write files as
+    # root, load other configurations, detach openvpn from the helper, or send a file read as root to a proxy
+    OPENVPN_REFUSED_OPTIONS = {
+        "up", "down", "route-up", "route-pre-down", "ipchange", "learn-address", "client-connect", "client-disconnect",
+        "tls-verify", "auth-user-pass-verify", "tls-crypt-v2-verify", "plugin", "script-security", "iproute", "config", "daemon", "management", "log", "log-append", "status",
+        "writepid", "tmp-dir", "chroot", "replay-persist", "ifconfig-pool-persist", "tls-export-cert",
+        "http-proxy", "http-proxy-user-pass", "socks-proxy"
+    }
+    # openvpn options whose file is sent to the server : the file must belong to the owner
+    OPENVPN_SECRET_FILE_OPTIONS = {"auth-user-pass", "askpass"}
+    # openvpn options a client may give, with their number of arguments :
+    OPENVPN_OPTIONS = {"--config": 1, "--management": 3}
+    # Largest openvpn configuration accepted, in bytes :
+    MAX_CONFIG_SIZE = 1024 * 1024
+    # ip objects that can be managed, and global options allowed before them :
+    IP_OBJECTS = {"address", "addr", "route", "rule", "link", "neighbour", "neighbor", "tuntap"}
+    IP_OPTIONS = {"-4", "-6", "-j", "-json", "-p", "-pretty", "-o", "-oneline", "-d", "-details", "-s", "-stats", "-br", "-brief"}
+    # Seconds between two idle checks, and given to the commands to exit on teardown before they are killed :
+    POLL_INTERVAL = 0.25
+    TERMINATE_TIMEOUT = 5
+
+    def __init__(self, socket_path, allowed, idle_timeout, owner, vpn_directories = ()):
+        """
+        allowed : whitelisted command name -> executable path
+        idle_timeout : seconds without connection nor running command after which the helper exits
+        owner : uid allowed to connect (besides root)
+        vpn_directories : directories of the configurations openvpn may be started with
+        """
+        self.socket_path = socket_path
+        self.allowed = allowed
+        self.vpn_directories = [os.path.realpath(directory) for directory in vpn_directories]
+        self.validators = {"openvpn": self._openvpn_argv, "ip": self._ip_argv}
+        self._configs_directory = None  # copies of the checked openvpn configurations, only readable by the helper
+        self.idle_timeout = idle_timeout
+        self.owner = owner
+        self._lock = threading.Lock()
+        self._processes = set()
+        self._connections = 0
+        self._last_activity = time.monotonic()
+        self._stopping = threading.Event()
+
+    def serve(self):
+        """
+        Accept requests until shut down or idle for idle_timeout seconds, then terminate the commands left and remove the socket
+        """
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        listener.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        if os.geteuid() == 0:
+            os.chown(self.socket_path, self.owner, -1)
+        listener.listen()
+        listener.settimeout(self.POLL_INTERVAL)
+        self._configs_directory = tempfile.mkdtemp(prefix = "nebula-helper-configs-")
+        # Tell the client it can connect :
+        print("ready", flush = True)
+        try:
+            while not self._stopping.is_set():
+                try:
+                    connection, _ = listener.accept()
+                except socket.timeout:
+                    with self._lock:
+                        if not self._connections and time.monotonic() - self._last_activity > self.idle_timeout:
+                            break
+                    continue
+                if not self._authorized(connection):
+                    connection.close()
+                    continue
+                with self._lock:
+                    self._connections += 1
+                    self._last_activity = time.monotonic()
+                threading.Thread(target = self._handle, args = (connection,), daemon = True).start()
+        finally:
+            listener.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self._terminate_all()
+            shutil.rmtree(self._configs_directory, ignore_errors = True)
+
+    def _authorized(self, connection):
+        """
+        Only accept connections from the owner and root (the socket permissions already restrict them where peer credentials are not available)
+        """
+        if not hasattr(socket, "SO_PEERCRED"):
+            return True
+        _, uid, _ = struct.unpack("3i", connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+        return uid in (self.owner, 0)
+
+    def _handle(self, connection):
+        """
+        Serve one request
+        """
+        send_lock = threading.Lock()
+        def send(line):
+            with send_lock:
+                try:
+                    connection.sendall(line)
+                except OSError:  # the client is gone, the command is terminated by the control loop
+                    pass
+        reader = connection.makefile('rb')
+        try:
+            request = json.loads(reader.readline() or b"{}")
+            if "run" in request:
+                self._run(request["run"], reader, send)
+            else:
+                send(b"x 0\n")
+                if request.get("shutdown"):
+                    self._stopping.set()
+        except (ValueError, AttributeError, OSError):
+            send(b"e invalid request\n")
+        finally:
+            # Shut down first : it ends the client's stream and wakes up the control loop still reading the connection
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            reader.close()
+            connection.close()
+            with self._lock:
+                self._connections -= 1
+                self._last_activity = time.monotonic()
+
+    def _in_vpn_directories(self, path):
+        return any(os.path.commonpath([path, directory]) == directory for directory in self.vpn_directories)
+
+    def _openvpn_argv(self, arguments):
+        """
+        Check the arguments of openvpn, or raise ValueError
+        Only "--config <configuration> [--management 127.0.0.1 <port> <password file>]" is accepted : the configuration
+        must be in a VPN directory and must not use OPENVPN_REFUSED_OPTIONS ; openvpn reads a copy of it that the client
+        cannot change once checked
+        Return the command line and the temporary files to remove once openvpn exited
+        """
+        options = {}
+        index = 0
+        while index < len(arguments):
+            option = arguments[index]
+            length = self.OPENVPN_OPTIONS.get(option)
+            if length is None or option in options:
+                raise ValueError(f"openvpn option not allowed : {option}")
+            options[option] = arguments[index + 1:index + 1 + length]
+            if len(options[option]) != length:
+                raise ValueError(f"missing arguments to openvpn option {option}")
+            index += 1 + length
+        if "--config" not in options:
+            raise ValueError("openvpn requires --config")
+        config_path = os.path.realpath(options["--config"][0])
+        if not self._in_vpn_directories(config_path):
+            raise ValueError(f"openvpn configuration outside of the VPN directories : {config_path}")
+        with open(config_path, 'rb') as config_file:
+            config = config_file.read(self.MAX_CONFIG_SIZE + 1)
+        if len(config) > self.MAX_CONFIG_SIZE:
+            raise ValueError(f"openvpn configuration too large : {config_path}")
+        self._check_openvpn_config(config.decode(errors = "replace"))
+        management = []
+        if "--management" in options:
+            host, port, password_file = options["--management"]
+            if host not in ("127.0.0.1", "localhost", "::1") or not port.isdigit() or not 0 < int(port) < 65536:
+                raise ValueError(f"openvpn management interface not allowed : {host} {port}")
+            self._check_owned(password_file)
+            management = ["--management", host, port, password_file]
+        descriptor, config_copy = tempfile.mkstemp(suffix = ".ovpn", dir = self._configs_directory)
+        with os.fdopen(descriptor, 'wb') as copy:
+            copy.write(config)
+        return ["--config", config_copy] + management, [config_copy]
+
+    def _check_openvpn_config(self, config):
+        """
+        Raise ValueError if an openvpn configuration uses a refused option, or sends a file not belonging to the owner
+        """
+        inline_block = None
+        for line in config.splitlines():
+            words = line.split()
+            if not words or words[0][0] in "#;":
+                continue
+            if inline_block is not None:
+                # Inline files (<ca>...</ca>) only hold data :
+                if words[0].lower() == f"</{inline_block}>":
+                    inline_block = None
+                continue
+            if words[0].startswith("<") and words[0].endswith(">"):
+                # <connection> blocks hold options, checked as the others :
+                if words[0].lower() not in ("<connection>", "</connection>"):
+                    inline_block = words[0][1:-1].lower()
+                continue
+            option = words[0].lower().lstrip("-")
+            if option in self.OPENVPN_REFUSED_OPTIONS:
+                raise ValueError(f"openvpn configuration option not allowed : {option}")
+            if option in self.OPENVPN_SECRET_FILE_OPTIONS and len(words) > 1 and words[1] != "stdin":
+                self._check_owned(words[1])
+
+    def _check_owned(self, path):
+        """
+        Raise ValueError unless a file given by the client belongs to the owner (and so could be read by it anyway)
+        """
+        try:
+            owned = os.stat(path).st_uid == self.owner
+        except OSError:
+            owned = False
+        if not owned:
+            raise ValueError(f"file not owned by the client : {path}")
+
+    def _ip_argv(self, arguments):
+        """
+        Check the arguments of ip and return them, or raise ValueError : IP_OPTIONS, then one of IP_OBJECTS and its
+        arguments, "exec" excluded (network namespaces and batch files are refused)
+        """
+        index = 0
+        while index < len(arguments) and arguments[index].startswith("-"):
+            if arguments[index] not in self.IP_OPTIONS:
+                raise ValueError(f"ip option not allowed : {arguments[index]}")
+            index += 1
+        if index == len(arguments) or arguments[index] not in self.IP_OBJECTS:
+            raise ValueError(f"ip object not allowed : {arguments[index] if index < len(arguments) else ''}")
+        if "exec" in arguments[index + 1:]:
+            raise ValueError("ip exec not allowed")
+        return list(arguments), []
+
+    def _run(self, argv, reader, send):
+        """
+        Run a whitelisted command and stream its output until it exits
+        """
+        if not isinstance(argv, list) or not argv or not all(isinstance(argument, str) for argument in argv):
+            send(b"e invalid command\n")
+            return
+        executable = self.allowed.get(argv[0])
+        if executable is None:
+            send(f"e command not allowed : {argv[0]}\n".encode())
+            return
+        arguments, temporary_files = argv[1:], []
+        if argv[0] in self.validators:
+            try:
+                arguments, temporary_files = self.validators[argv[0]](argv[1:])
+            except (ValueError, OSError) as e:
+                send(f"e command refused : {e}\n".encode())
+                return
+        try:
+            try:
+                process = subprocess.Popen([executable] + arguments, stdin = subprocess.DEVNULL, stdout = subprocess.PIPE, stderr = subprocess.PIPE, bufsize = 0, start_new_session = True)
+            except OSError as e:
+                send(f"e failed to start command : {e}\n".encode())
+                return
+            with self._lock:
+                self._processes.add(process)
+            send(f"p {process.pid}\n".encode())
+            forwarders = [
+                threading.Thread(target = self._forward, args = (process.stdout, b"1 ", send), daemon = True),
+                threading.Thread(target = self._forward, args = (process.stderr, b"2 ", send), daemon = True)
+            ]
+            for forwarder in forwarders:
+                forwarder.start()
+            threading.Thread(target = self._control, args = (process, reader), daemon = True).start()
+            for forwarder in forwarders:
+                forwarder.join()
+            process.wait()
+            with self._lock:
+                self._processes.discard(process)
+            send(f"x {process.returncode}\n".encode())
+        finally:
+            for path in temporary_files:
+                os.unlink(path)
+
+    def _forward(self, pipe, prefix, send):
+        """
+        Send the lines of a command output pipe to the client, prefixed by their stream
+        """
+        for line in iter(pipe.readline, b""):
+            send(prefix + (line if line.endswith(b"\n") else line + b"\n"))
+        pipe.close()
+
+    def _control(self, process, reader):
+        """
+        Apply the signals sent by the client to a command, and terminate it if the client disconnects
+        """
+        try:
+            for line in iter(reader.readline, b""):
+                action, _, number = line.decode(errors = "replace").strip().partition(" ")
+                if action == "signal" and number.isdigit() and int(number) in self.SIGNALS and process.poll() is None:
+                    process.send_signal(int(number))
+        except (OSError, ValueError):
+            pass
+        if process.poll() is None:
+            process.terminate()
+
+    def _terminate_all(self):
+        """
+        Terminate the commands still running, killing those that ignore it
+        """
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(self.TERMINATE_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+class HelperProcess:
+    """
+    Popen-like handle of a command run by the helper : its output arrives on the connection, which the shared I/O loop reads
+    """
+    def __init__(self, connection, on_output, on_close = None):
+        """
+        on_output(stream_name, lines) is called from the I/O loop thread with each chunk of output lines, as with CommandRunner
+        on_close() is called once the command exited and its output was delivered
+        """
+        self.connection = connection
+        self.on_output = on_output
+        self.on_close = on_close
+        self.pid = None
+        self.returncode = None
+        self.error = None
+        self._exited = threading.Event()
+        self.fd = IOLoop.shared().register(connection, self._handle_lines, self._closed)
+
+    def __repr__(self):
+        return f"<HelperProcess pid={self.pid} returncode={self.returncode}>"
+
+    def _handle_lines(self, lines):
+        """
+        Split the lines received from the helper into the output streams and the command status
+        """
+        stdout, stderr = [], []
+        for line in lines:
+            kind, _, text = line.partition(" ")
+            if kind == "1":
+                stdout.append(text)
+            elif kind == "2":
+                stderr.append(text)
+            elif kind == "p":
+                self.pid = int(text)
+            elif kind == "x":
+                self.returncode = int(text)
+            elif kind == "e":
+                self.error = text
+                stderr.append(text)
+        if stdout:
+            self.on_output("STDOUT", stdout)
+        if stderr:
+            self.on_output("STDERR", stderr)
+
+    def _closed(self):
+        if self.returncode is None:  # refused, or the helper died
+            self.returncode = -1
+        self._exited.set()
+        if self.on_close is not None:
+            self.on_close()
+
+    def poll(self):
+        return self.returncode if self._exited.is_set() else None
+
+    def wait(self, timeout = None):
+        if not self._exited.wait(timeout):
+            raise subprocess.TimeoutExpired(f"helper command {self.pid}", timeout)
+        return self.returncode
+
+    def send_signal(self, signal_number):
+        if self._exited.is_set():
+            return
+        try:
+            self.connection.sendall(f"signal {int(signal_number)}\n".encode())
+        except OSError:  # closed meanwhile : the command exited
+            pass
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+class PrivilegedHelper:
+    """
+    Client of a long-lived helper process running the whitelisted privileged commands (openvpn, ip) : started through sudo
+    once per session, with the password written to sudo's stdin, then reached over a Unix socket, so that commands pay no
+    sudo authentication and the password never appears in a process list
+    Started without a password, the helper runs as the current user with the given whitelist : a non-root stand-in for tests
+    """
+    HELPER_FILE = os.path.abspath(__file__)
+    # Seconds to wait for the helper to be ready (sudo authentication included) :
+    START_TIMEOUT = 30
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, logger, sudo_password):
+        """
+        Return the session helper, starting it on first use or once it exited after being idle
+        """
+        with cls._shared_lock:
+            if cls._shared is None or not cls._shared.running():
+                cls._shared = cls(logger, sudo_password)
+                cls._shared.start()
+            return cls._shared
+
+    @classmethod
+    def stop_shared(cls):
+        """
+        Stop the session helper if it was started
+        """
+        with cls._shared_lock:
+            if cls._shared is not None:
+                cls._shared.stop()
+                cls._shared = None
+
+    def __init__(self, logger, sudo_password = None, idle_timeout = None, allowed = None, vpn_directories = None):
+        """
+        sudo_password : start the helper as root through sudo with this password, as the current user if None
+        idle_timeout : seconds without connection nor running command after which the helper exits, config.json helper.idle_timeout by default
+        allowed : whitelisted command name -> executable path, only for a helper running as the current user
+        vpn_directories : directories of the configurations openvpn may be started with, config.json paths.vpns by default
+        """
+        if idle_timeout is None or vpn_directories is None:
+            from Config import Config
+            config = Config.shared()
+            if idle_timeout is None:
+                idle_timeout = config.get_float("helper", "idle_timeout", default = 900)
+            if vpn_directories is None:
+                vpn_directories = [config.resolve(directory) for directory in config.get_list("paths", "vpns", default = [])]
+        self.logger = logger
+        self.sudo_password = sudo_password
+        self.idle_timeout = idle_timeout
+        self.vpn_directories = vpn_directories
+        self.allowed = allowed or {}
+        self.process = None
+        self.socket_directory = None
+        self.socket_path = None
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":"initialize PrivilegedHelper instance", "invoker":invoker(self), "output":"0"})
+
+    def start(self):
+        """
+        Start the helper and wait for it to listen on its socket, in a directory only the current user can access
+        """
+        self.socket_directory = tempfile.mkdtemp(prefix = "nebula-helper-")
+        self.socket_path = os.path.join(self.socket_directory, "helper.sock")
+        command = [sys.executable, self.HELPER_FILE, "--serve", self.socket_path, "--idle-timeout", str(self.idle_timeout), "--owner", str(os.getuid())]
+        for name, path in self.allowed.items():
+            command += ["--allow", f"{name}={path}"]
+        for directory in self.vpn_directories:
+            command += ["--vpn-directory", directory]
+        if self.sudo_password is not None:
+            command = ["sudo", "-S", "-p", "", "--"] + command
+        try:
+            self.process = subprocess.Popen(command, stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+        except OSError as e:
+            shutil.rmtree(self.socket_directory, ignore_errors = True)
+            raise HelperError(f"failed to start the privileged helper : {e}")
+        # The password only goes through sudo's stdin :
+        if self.sudo_password is not None:
+            try:
+                self.process.stdin.write(f"{self.sudo_password}\n".encode())
+            except BrokenPipeError:
+                pass
+        self.process.stdin.close()
+        readable, _, _ = select.select([self.process.stdout], [], [], self.START_TIMEOUT)
+        if not readable or self.process.stdout.readline() != b"ready\n":
+            self.process.kill()
+            self.process.wait()
+            error = self.process.stderr.read().decode(errors = "replace").strip()
+            shutil.rmtree(self.socket_directory, ignore_errors = True)
+            raise HelperError(f"privileged helper failed to start : {error or 'timed out'}")
+        self.process.stdout.close()
+        # What the helper reports afterwards goes to the log :
+        IOLoop.shared().register(self.process.stderr, lambda lines: self.logger.write("EVENT", {"event":f"privileged helper : {' / '.join(lines)}", "triggered by":invoker(self), "output":"0"}))
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"start privileged helper {self.process.pid} on {self.socket_path}", "invoker":invoker(self), "output":"0"})
+
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def _connect(self, request):
+        """
+        Open a connection to the helper and send it a request
+        """
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(self.socket_path)
+            connection.sendall(json.dumps(request).encode() + b"\n")
+        except (OSError, TypeError) as e:
+            connection.close()
+            raise HelperError(f"privileged helper unreachable : {e}")
+        return connection
+
+    def run(self, argv, on_output, on_close = None):
+        """
+        Run a whitelisted command through the helper and return its HelperProcess
+        """
+        process = HelperProcess(self._connect({"run": list(argv)}), on_output, on_close)
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"run {argv[0]} through the privileged helper", "invoker":invoker(self), "output":"0"})
+        return process
+
+    def ping(self):
+        """
+        Return whether the helper answers
+        """
+        try:
+            with self._connect({"ping": True}) as connection:
+                return connection.makefile('rb').readline() == b"x 0\n"
+        except (HelperError, OSError):
+            return False
+
+    def stop(self, timeout = 5):
+        """
+        Tear the helper down : its running commands are terminated, it exits and its socket is removed
+        """
+        if self.process is None:
+            return
+        try:
+            with self._connect({"shutdown": True}) as connection:
+                connection.makefile('rb').readline()
+        except (HelperError, OSError):
+            pass
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        shutil.rmtree(self.socket_directory, ignore_errors = True)
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"stop privileged helper {self.process.pid}", "invoker":invoker(self), "output":"0"})
+        self.process = None
+
+def _serve(arguments):
+    """
+    Entry point of the helper process
+    """
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--serve", required = True)
+    parser.add_argument("--idle-timeout", type = float, required = True)
+    parser.add_argument("--owner", type = int, required = True)
+    parser.add_argument("--allow", action = "append", default = [])
+    parser.add_argument("--vpn-directory", action = "append", default = [])
+    options = parser.parse_args(arguments)
+    if os.geteuid() == options.owner:
+        # Not privileged : a stand-in, which runs the whitelist it is given
+        allowed = dict(entry.split("=", 1) for entry in options.allow)
+    else:
+        allowed = {name: shutil.which(name, path = HelperServer.SAFE_PATH) for name in HelperServer.WHITELIST}
+        allowed = {name: path for name, path in allowed.items() if path}
+    HelperServer(options.serve, allowed, options.idle_timeout, options.owner, options.vpn_directory).serve()
+
+# Example usage, with a non-root stand-in :
+if __name__ == "__main__":
+    if "--serve" in sys.argv:
+        _serve(sys.argv[1:])
+    else:
+        from LogWriter import LogWriter
+        logger = LogWriter("log.txt")
+        helper = PrivilegedHelper(logger, allowed = {"ping": shutil.which("ping")})
+        helper.start()
+        process = helper.run(["ping", "-c", "3", "localhost"], lambda stream_name, lines: print("\n".join(f"{stream_name} : {line}" for line in lines)))
+        print(f"exited with {process.wait()}")
+        helper.stop()
+        logger.close()
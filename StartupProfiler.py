@@ -0,0 +1,82 @@
+import contextlib
+import json
+import os
+import sys
+import time
+
+class StartupProfiler:
+    """
+    Record a timed span per startup phase (imports, config load, stylesheet, ...) and report them once the application is up
+    Disabled, span() returns a shared no-op context manager and mark() returns immediately
+    """
+    _NO_SPAN = contextlib.nullcontext()
+
+    def __init__(self, enabled = False):
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.spans = []  # (name, start, end) in seconds since origin
+        self._open = {}  # name -> start of the spans begun and not ended yet
+
+    def span(self, name):
+        """
+        Return a context manager timing a phase
+        """
+        if not self.enabled:
+            return self._NO_SPAN
+        return self._span(name)
+
+    @contextlib.contextmanager
+    def _span(self, name):
+        start = time.perf_counter() - self.origin
+        try:
+            yield
+        finally:
+            self.spans.append((name, start, time.perf_counter() - self.origin))
+
+    def begin(self, name):
+        """
+        Start timing a phase that does not fit in a with block
+        """
+        if self.enabled:
+            self._open[name] = time.perf_counter() - self.origin
+
+    def end(self, name):
+        """
+        Stop timing a phase started with begin()
+        """
+        if self.enabled and name in self._open:
+            self.spans.append((name, self._open.pop(name), time.perf_counter() - self.origin))
+
+    def mark(self, name):
+        """
+        Record an instant (zero-length span), such as the first paint of the window
+        """
+        if self.enabled:
+            elapsed = time.perf_counter() - self.origin
+            self.spans.append((name, elapsed, elapsed))
+
+    def report(self, report_file = None):
+        """
+        Print the spans as a table on stderr and, if report_file is given, write them as JSON
+        """
+        if not self.enabled:
+            return
+        lines = [f"{'phase':<24}{'start (ms)':>12}{'duration (ms)':>15}"]
+        for name, start, end in sorted(self.spans, key = lambda span: span[1]):
+            lines.append(f"{name:<24}{start * 1000:>12.1f}{(end - start) * 1000:>15.1f}")
+        print("\n".join(lines), file = sys.stderr)
+        if report_file is not None:
+            os.makedirs(os.path.dirname(report_file) or ".", exist_ok = True)
+            with open(report_file, 'w') as profile_file:
+                json.dump([{"phase": name, "start_ms": start * 1000, "duration_ms": (end - start) * 1000} for name, start, end in self.spans], profile_file, indent = 2)
+
+# Process-wide profiler, enabled by the --profile-startup argument or the NEBULA_PROFILE_STARTUP=1 environment variable :
+profiler = StartupProfiler("--profile-startup" in sys.argv or os.environ.get("NEBULA_PROFILE_STARTUP") == "1")
+
+# Example usage :
+if __name__ == "__main__":
+    profiler.enabled = True
+    with profiler.span("sleep"):
+        time.sleep(0.05)
+    profiler.mark("done")
+    profiler.report()
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import threading
+from LogWriter import invoker
+
+class StyleCache:
+    """
+    Compiled stylesheets of the color themes, cached on disk by a hash of the SCSS template and of the theme colors, so
+    libsass is only imported and run when the template or a theme changed
+    The template sets its variables with !default : the theme colors (config.json color names) are prepended to it
+    """
+    def __init__(self, template_file, cache_path, logger):
+        """
+        template_file : SCSS template (styles.scss)
+        cache_path : directory of the compiled stylesheets
+        """
+        self.template_file = template_file
+        self.cache_path = cache_path
+        self.logger = logger
+        self._stylesheets = {}  # hash -> compiled stylesheet
+        self._lock = threading.Lock()
+        with open(self.template_file, 'rb') as template_file:
+            self._template = template_file.read()
+
+    def _hash(self, colors):
+        """
+        Return the cache key of a theme : hash of the template and of its colors
+        """
+        digest = hashlib.sha256(self._template)
+        digest.update(json.dumps(colors, sort_keys = True).encode())
+        return digest.hexdigest()[:32]
+
+    def _compile(self, colors):
+        """
+        Compile the template with a theme's colors (imports libsass on first use only)
+        """
+        import sass
+        variables = "".join(f"${name}: {value};\n" for name, value in colors.items())
+        return sass.compile(string = variables + self._template.decode())
+
+    def stylesheet(self, colors):
+        """
+        Return the stylesheet of a theme (color name -> color), from memory, from the disk cache or compiled
+        """
+        key = self._hash(colors)
+        with self._lock:
+            if key in self._stylesheets:
+                return self._stylesheets[key]
+        cache_file = os.path.join(self.cache_path, f"{key}.css")
+        try:
+            with open(cache_file) as stylesheet_file:
+                stylesheet = stylesheet_file.read()
+        except OSError:
+            stylesheet = self._compile(colors)
+            os.makedirs(self.cache_path, exist_ok = True)
+            temporary_file = f"{cache_file}.{threading.get_ident()}.tmp"
+            with open(temporary_file, 'w') as stylesheet_file:
+                stylesheet_file.write(stylesheet)
+            os.replace(temporary_file, cache_file)
+            # Write to log file :
+            if self.logger.enabled("ACTION"):
+                self.logger.write("ACTION", {"action":f"Compiled stylesheet {key}", "invoker":invoker(self), "output":"0"})
+        with self._lock:
+            self._stylesheets[key] = stylesheet
+        return stylesheet
+
+    def precompile(self, themes):
+        """
+        Load or compile the stylesheet of every theme (name -> colors), so that switching theme needs no compilation
+        """
+        for colors in themes.values():
+            self.stylesheet(colors)
+
+# Example usage :
+if __name__ == "__main__":
+    import time
+    from Config import Config
+    from LogWriter import LogWriter
+    logger = LogWriter("log.txt")
+    config = Config.shared()
+    style_cache = StyleCache("styles.scss", config.resolve(os.path.join(config.get_str("paths", "cache"), "styles")), logger)
+    start = time.perf_counter()
+    style_cache.stylesheet(config.get_dict("colors"))
+    print(f"{(time.perf_counter() - start) * 1000:.1f} ms")
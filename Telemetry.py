@@ -0,0 +1,305 @@
+import atexit
+import bisect
+import collections
+import contextlib
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+from Config import Config
+
+class Telemetry:
+    """
+    Spans, counters, gauges and histograms, exported as a Prometheus textfile (for the node exporter textfile collector)
+    and as a JSON trace that Chrome tracing or Perfetto can load
+    Disabled, span() returns a shared no-op context manager and callers guard the rest with "if telemetry.enabled", so
+    instrumentation can stay in place
+    """
+    _NO_SPAN = contextlib.nullcontext()
+    # Histogram buckets, in seconds :
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    PREFIX = "nebula_"
+
+    def __init__(self, enabled = False, prometheus_file = None, trace_file = None, export_interval = 15, max_events = 100000, process = None):
+        """
+        prometheus_file : textfile rewritten every export_interval seconds and on exit
+        trace_file : JSON trace written on exit (and by export())
+        max_events : trace events kept, the oldest are dropped past this count
+        process : name of the process (gui, nebuladaemon...), added as a "process" label to every metric and naming the
+        process in the trace
+        """
+        self.enabled = enabled
+        self.process = process
+        self._process_labels = (("process", process),) if process else ()
+        self.prometheus_file = prometheus_file
+        self.trace_file = trace_file
+        self.export_interval = export_interval
+        self.origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+        self._counters = {}  # (name, labels) -> value
+        self._gauges = {}  # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [count per bucket (not cumulative)..., sum, count]
+        self._events = collections.deque(maxlen = max_events)
+        self._threads = {}  # native thread id -> name
+        self._async_ids = itertools.count(1)
+        self._stop_event = threading.Event()
+        self._thread = None
+        if self.enabled:
+            self.start()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def _now(self):
+        """
+        Microseconds since the telemetry origin
+        """
+        return (time.perf_counter_ns() - self.origin) // 1000
+
+    def _event(self, event):
+        thread_id = threading.get_native_id()
+        if thread_id not in self._threads:
+            self._threads[thread_id] = threading.current_thread().name
+        event["pid"] = os.getpid()
+        event["tid"] = thread_id
+        self._events.append(event)
+
+    # Metrics :
+
+    def count(self, name, value = 1, **labels):
+        """
+        Increment a counter
+        """
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, value, **labels):
+        """
+        Set a gauge, also traced as a counter track
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+        self._event({"name": name, "ph": "C", "ts": self._now(), "args": {name: value}})
+
+    def observe(self, name, seconds, **labels):
+        """
+        Add a duration to a histogram
+        """
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.BUCKETS) + 3)
+            histogram[bisect.bisect_left(self.BUCKETS, seconds)] += 1  # the last bucket is +Inf
+            histogram[-2] += seconds
+            histogram[-1] += 1
+
+    # Spans :
+
+    def span(self, name, **labels):
+        """
+        Return a context manager timing a block : traced, and added to the {name}_seconds histogram
+        """
+        if not self.enabled:
+            return self._NO_SPAN
+        return _Span(self, name, labels)
+
+    def begin(self, name, **labels):
+        """
+        Start a span that ends in another function or thread (such as a tunnel coming up), return its token for end()
+        Return None when disabled : end(None) does nothing
+        """
+        if not self.enabled:
+            return None
+        return name, labels, time.perf_counter_ns(), next(self._async_ids)
+
+    def end(self, token, **labels):
+        """
+        End a span started with begin(), with extra labels
+        """
+        if token is None:
+            return
+        name, begin_labels, start, async_id = token
+        end = time.perf_counter_ns()
+        labels = {**begin_labels, **labels}
+        self._event({"name": name, "cat": "async", "ph": "b", "id": async_id, "ts": (start - self.origin) // 1000, "args": labels})
+        self._event({"name": name, "cat": "async", "ph": "e", "id": async_id, "ts": (end - self.origin) // 1000})
+        self.observe(f"{name}_seconds", (end - start) / 1e9, **labels)
+
+    # Exporters :
+
+    @staticmethod
+    def _metric_name(name):
+        return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+    @staticmethod
+    def _labels(labels, extra = ()):
+        pairs = [(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for key, value in labels + tuple(extra)]
+        return "{" + ",".join(f'{Telemetry._metric_name(key)}="{value}"' for key, value in pairs) + "}" if pairs else ""
+
+    def prometheus(self):
+        """
+        Return the metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            counters, gauges = dict(self._counters), dict(self._gauges)
+            histograms = {key: list(values) for key, values in self._histograms.items()}
+        lines = []
+        for kind, suffix, metrics in (("counter", "_total", counters), ("gauge", "", gauges)):
+            for name in sorted({name for name, _ in metrics}):
+                metric = self.PREFIX + self._metric_name(name) + suffix
+                lines.append(f"# TYPE {metric} {kind}")
+                lines.extend(f"{metric}{self._labels(self._process_labels + labels)} {value}" for (key, labels), value in metrics.items() if key == name)
+        for name in sorted({name for name, _ in histograms}):
+            metric = self.PREFIX + self._metric_name(name)
+            lines.append(f"# TYPE {metric} histogram")
+            for (key, labels), values in histograms.items():
+                if key != name:
+                    continue
+                labels = self._process_labels + labels
+                cumulative = 0
+                for bound, bucket in zip(self.BUCKETS, values):
+                    cumulative += bucket
+                    lines.append(f"{metric}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{metric}_bucket{self._labels(labels, [('le', '+Inf')])} {values[-1]}")
+                lines.append(f"{metric}_sum{self._labels(labels)} {values[-2]}")
+                lines.append(f"{metric}_count{self._labels(labels)} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def trace(self):
+        """
+        Return the trace in the Chrome trace event format
+        """
+        events = list(self._events)
+        names = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread_id, "args": {"name": name}} for thread_id, name in list(self._threads.items())]
+        if self.process:
+            names.append({"name": "process_name", "ph": "M", "pid": os.getpid(), "args": {"name": self.process}})
+        return {"traceEvents": names + events, "displayTimeUnit": "ms"}
+
+    def _write(self, path, content):
+        """
+        Atomically write an export : collectors never read a half-written file
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok = True)
+        temporary_file = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_file, 'w') as export_file:
+            export_file.write(content)
+        os.replace(temporary_file, path)
+
+    def export(self):
+        """
+        Write the Prometheus textfile and the trace file
+        """
+        if not self.enabled:
+            return
+        if self.prometheus_file:
+            self._write(self.prometheus_file, self.prometheus())
+        if self.trace_file:
+            self._write(self.trace_file, json.dumps(self.trace()))
+
+    def start(self):
+        """
+        Rewrite the Prometheus textfile every export_interval seconds from a background thread, and export on exit
+        """
+        self.enabled = True
+        if self._thread is None and self.prometheus_file:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target = self._export_loop, name = "Telemetry", daemon = True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def _export_loop(self):
+        while not self._stop_event.wait(self.export_interval):
+            self._write(self.prometheus_file, self.prometheus())
+
+    def close(self):
+        """
+        Stop the periodic export and export one last time
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.export()
+        atexit.unregister(self.close)
+
+class _Span:
+    """
+    Context manager returned by Telemetry.span() when enabled
+    """
+    __slots__ = ("telemetry", "name", "labels", "start")
+
+    def __init__(self, telemetry, name, labels):
+        self.telemetry = telemetry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exception):
+        end = time.perf_counter_ns()
+        telemetry = self.telemetry
+        telemetry._event({"name": self.name, "ph": "X", "ts": (self.start - telemetry.origin) // 1000, "dur": (end - self.start) // 1000, "args": self.labels})
+        telemetry.observe(f"{self.name}_seconds", (end - self.start) / 1e9, **self.labels)
+        return False
+
+def _process_name():
+    """
+    Name of the running program (gui, nebuladaemon, nebula...), from its script name
+    """
+    script = sys.argv[0] if sys.argv and sys.argv[0] not in ("", "-c", "-m") else "python"
+    return re.sub(r"[^a-z0-9_]", "_", os.path.splitext(os.path.basename(script))[0].lower())
+
+def _from_config(process = None):
+    """
+    Create the process-wide telemetry from config.json ("telemetry"), enabled there, by the --telemetry argument or by the
+    NEBULA_TELEMETRY=1 environment variable
+    The GUI and the daemon both export : each process writes its own files, named after the configured ones with the
+    process name as a suffix (nebula-gui.prom, nebula-nebuladaemon.prom), and labels its metrics with it
+    process : the name of the process, the script name by default
+    """
+    config = Config.shared()
+    settings = config.get_dict("telemetry", default = {})
+    enabled = settings.get("enabled", False) or "--telemetry" in sys.argv or os.environ.get("NEBULA_TELEMETRY") == "1"
+    process = process or _process_name()
+    def process_file(path):
+        root, extension = os.path.splitext(config.resolve(path))
+        return f"{root}-{process}{extension}"
+    return Telemetry(
+        enabled,
+        process_file(settings["prometheus_file"]) if settings.get("prometheus_file") else None,
+        process_file(settings["trace_file"]) if settings.get("trace_file") else None,
+        settings.get("export_interval", 15),
+        settings.get("max_events", 100000),
+        process
+    )
+
+# Process-wide telemetry :
+telemetry = _from_config()
+
+# Example usage :
+if __name__ == "__main__":
+    telemetry = Telemetry(True, "nebula.prom", "trace.json")
+    for server in ("fr-1", "de-2"):
+        with telemetry.span("connect", server = server):
+            time.sleep(0.02)
+        telemetry.count("connections", server = server)
+    token = telemetry.begin("tunnel_up", server = "fr-1")
+    time.sleep(0.01)
+    telemetry.end(token)
+    telemetry.gauge("log_queue_depth", 3)
+    print(telemetry.prometheus())
+    telemetry.close()
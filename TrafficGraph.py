@@ -0,0 +1,109 @@
+from PyQt6.QtCore import Qt, QPointF, QTimer, pyqtProperty
+from PyQt6.QtGui import QColor, QPainter, QPen, QPolygonF
+from PyQt6.QtWidgets import QWidget
+
+def format_rate(rate):
+    """
+    Return a byte rate as a readable string
+    """
+    for unit in ("B/s", "kB/s", "MB/s"):
+        if rate < 1000:
+            return f"{rate:.0f} {unit}"
+        rate /= 1000
+    return f"{rate:.1f} GB/s"
+
+class TrafficGraph(QWidget):
+    """
+    Graph of the download and upload rates of a TrafficBuffer : the buffer is checked a few times per second and the
+    graph is only repainted when it holds new samples
+    Colors are set by the stylesheet (qproperty-receivedColor, qproperty-sentColor, color)
+    """
+    REFRESH_INTERVAL = 250  # milliseconds
+
+    def __init__(self, buffer, parent = None):
+        super().__init__(parent)
+        self.buffer = buffer
+        self._received_color = QColor("#4CAF50")
+        self._sent_color = QColor("#f44336")
+        self._drawn_version = -1
+        self.setAttribute(Qt.WidgetAttribute.WA_StyledBackground, True)
+        self.setMinimumHeight(100)
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(self.REFRESH_INTERVAL)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start()
+
+    def getReceivedColor(self):
+        return self._received_color
+
+    def setReceivedColor(self, color):
+        self._received_color = color
+        self.update()
+
+    def getSentColor(self):
+        return self._sent_color
+
+    def setSentColor(self, color):
+        self._sent_color = color
+        self.update()
+
+    receivedColor = pyqtProperty(QColor, getReceivedColor, setReceivedColor)
+    sentColor = pyqtProperty(QColor, getSentColor, setSentColor)
+
+    def set_buffer(self, buffer):
+        self.buffer = buffer
+        self._drawn_version = -1
+        self.refresh()
+
+    def refresh(self):
+        """
+        Repaint if the buffer changed since the last paint
+        """
+        if self.buffer.version != self._drawn_version:
+            self.update()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        self._drawn_version = self.buffer.version
+        rates = self.buffer.rates()
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        width, height = self.width(), self.height()
+        text_color = self.palette().color(self.foregroundRole())
+        if not rates:
+            painter.setPen(text_color)
+            painter.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter, "No traffic data")
+            return
+        # One sample per step from the right edge, scaled to the highest rate shown :
+        step = width / max(self.buffer.capacity - 2, 1)
+        peak = max(max(received, sent) for _, received, sent in rates) or 1
+        margin = 20
+        for index, color in ((1, self._received_color), (2, self._sent_color)):
+            points = QPolygonF([QPointF(width - (len(rates) - 1 - position) * step, height - (rate[index] / peak) * (height - margin)) for position, rate in enumerate(rates)])
+            painter.setPen(QPen(color, 2))
+            painter.drawPolyline(points)
+        _, received, sent = rates[-1]
+        painter.setPen(text_color)
+        painter.drawText(6, 15, f"↓ {format_rate(received)}    ↑ {format_rate(sent)}    peak {format_rate(peak)}")
+
+# Example usage :
+if __name__ == "__main__":
+    import math
+    import sys
+    import time
+    from PyQt6.QtWidgets import QApplication
+    from TrafficStats import TrafficBuffer
+    app = QApplication(sys.argv)
+    buffer = TrafficBuffer(120)
+    graph = TrafficGraph(buffer)
+    graph.resize(600, 150)
+    graph.show()
+    totals = [0, 0]
+    def add_sample():
+        totals[0] += 500000 * (1.2 + math.sin(time.monotonic()))
+        totals[1] += 60000 * (1.2 + math.cos(time.monotonic()))
+        buffer.append(time.monotonic(), *totals)
+    sample_timer = QTimer()
+    sample_timer.timeout.connect(add_sample)
+    sample_timer.start(100)
+    sys.exit(app.exec())
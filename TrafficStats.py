@@ -0,0 +1,258 @@
+import array
+import os
+import secrets
+import socket
+import tempfile
+import threading
+import time
+from LogWriter import invoker
+
+class TrafficBuffer:
+    """
+    Fixed-size ring buffer of traffic samples (timestamp, total bytes received, total bytes sent), kept in preallocated
+    arrays : appending never allocates, and the oldest sample is overwritten once the buffer is full
+    """
+    def __init__(self, capacity = 300):
+        self.capacity = capacity
+        self._times = array.array('d', bytes(8 * capacity))
+        self._received = array.array('d', bytes(8 * capacity))
+        self._sent = array.array('d', bytes(8 * capacity))
+        self._next = 0  # index of the next sample to write
+        self._count = 0
+        self._lock = threading.Lock()
+        self.version = 0  # incremented by every append, so readers can tell whether there is anything new
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, received, sent):
+        """
+        Store a sample of the total byte counters
+        """
+        with self._lock:
+            self._times[self._next] = timestamp
+            self._received[self._next] = received
+            self._sent[self._next] = sent
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+            self.version += 1
+
+    def clear(self):
+        with self._lock:
+            self._next = self._count = 0
+            self.version += 1
+
+    def samples(self):
+        """
+        Return the (timestamp, received, sent) samples, oldest first
+        """
+        with self._lock:
+            start = (self._next - self._count) % self.capacity
+            indexes = [(start + offset) % self.capacity for offset in range(self._count)]
+            return [(self._times[index], self._received[index], self._sent[index]) for index in indexes]
+
+    def rates(self):
+        """
+        Return the (timestamp, bytes received per second, bytes sent per second) rates between consecutive samples, oldest first
+        Counters going backwards (the tunnel restarted) count from zero
+        """
+        samples = self.samples()
+        rates = []
+        for (previous_time, previous_received, previous_sent), (timestamp, received, sent) in zip(samples, samples[1:]):
+            elapsed = timestamp - previous_time
+            if elapsed <= 0:
+                continue
+            received_delta = received - previous_received if received >= previous_received else received
+            sent_delta = sent - previous_sent if sent >= previous_sent else sent
+            rates.append((timestamp, received_delta / elapsed, sent_delta / elapsed))
+        return rates
+
+class ManagementCollector:
+    """
+    Collect the byte counters of a running openvpn through its management interface : openvpn is started with the options
+    of openvpn_options() (a local TCP port protected by a one-time password) and pushes a >BYTECOUNT event every interval,
+    which this collector reads from its own thread into a TrafficBuffer
+    """
+    # Seconds between two connection attempts, while openvpn starts or after it restarted :
+    RETRY_INTERVAL = 0.5
+
+    def __init__(self, buffer, logger, interval = 1, host = "127.0.0.1", port = None):
+        """
+        interval : seconds between two byte count events
+        port : management port, a free one by default
+        """
+        self.buffer = buffer
+        self.logger = logger
+        self.interval = interval
+        self.host = host
+        self.port = port or self._free_port()
+        self.password = secrets.token_hex(16)
+        self.password_file = None
+        self.connected = threading.Event()
+        self._socket = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":"initialize ManagementCollector instance", "invoker":invoker(self), "output":"0"})
+
+    def _free_port(self):
+        with socket.socket() as probe:
+            probe.bind((self.host, 0))
+            return probe.getsockname()[1]
+
+    def openvpn_options(self):
+        """
+        Return the openvpn options enabling the management interface, writing the password file they refer to
+        """
+        if self.password_file is None:
+            descriptor, self.password_file = tempfile.mkstemp(prefix = "nebula-management-")
+            with os.fdopen(descriptor, 'w') as password_file:
+                password_file.write(f"{self.password}\n")
+        return f"--management {self.host} {self.port} {self.password_file}"
+
+    def start(self):
+        """
+        Start reading the byte counters, connecting as soon as openvpn listens
+        """
+        self._stop_event.clear()
+        self._thread = threading.Thread(target = self._collect_loop, name = "ManagementCollector", daemon = True)
+        self._thread.start()
+
+    def _collect_loop(self):
+        """
+        Connect to the management interface, and reconnect if openvpn restarts, until stopped
+        """
+        while not self._stop_event.is_set():
+            try:
+                self._socket = socket.create_connection((self.host, self.port), timeout = self.RETRY_INTERVAL)
+            except OSError:
+                self._stop_event.wait(self.RETRY_INTERVAL)
+                continue
+            try:
+                self._socket.settimeout(None)
+                self._read_events()
+            except OSError:
+                pass
+            finally:
+                self.connected.clear()
+                self._socket.close()
+
+    def _read_events(self):
+        """
+        Authenticate, ask for byte count events and store them until the connection closes
+        """
+        pending = b""
+        while not self._stop_event.is_set():
+            chunk = self._socket.recv(4096)
+            if not chunk:
+                return
+            pending += chunk
+            # The password prompt is not followed by a line ending :
+            if pending.startswith(b"ENTER PASSWORD:"):
+                pending = pending[len(b"ENTER PASSWORD:"):]
+                self._socket.sendall(f"{self.password}\n".encode())
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                line = line.rstrip(b"\r")
+                if line.startswith(b">BYTECOUNT:"):
+                    received, _, sent = line[len(b">BYTECOUNT:"):].partition(b",")
+                    try:
+                        self.buffer.append(time.monotonic(), float(received), float(sent))
+                    except ValueError:  # malformed line : skipped, the next one comes an interval later
+                        continue
+                elif line.startswith(b">INFO:"):  # sent once authenticated
+                    self._socket.sendall(f"bytecount {self.interval}\n".encode())
+                    self.connected.set()
+
+    def stop(self):
+        """
+        Stop collecting and remove the password file
+        """
+        self._stop_event.set()
+        if self._socket is not None:
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.password_file is not None:
+            os.unlink(self.password_file)
+            self.password_file = None
+        # Write to log file :
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":"stop collecting openvpn byte counts", "invoker":invoker(self), "output":"0"})
+
+class InterfaceCollector:
+    """
+    Collect the byte counters of a network interface (the tun interface of the tunnel) by sampling /proc/net/dev, for
+    tunnels started without the management interface
+    """
+    def __init__(self, buffer, logger, interface = "tun0", interval = 1):
+        self.buffer = buffer
+        self.logger = logger
+        self.interface = interface
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        """
+        Return the (received, sent) byte counters of the interface, or None if it does not exist
+        """
+        with open("/proc/net/dev") as net_dev:
+            for line in net_dev:
+                name, _, counters = line.partition(":")
+                if counters and name.strip() == self.interface:
+                    fields = counters.split()
+                    return float(fields[0]), float(fields[8])
+        return None
+
+    def start(self):
+        self._stop_event.clear()
+        self._thread = threading.Thread(target = self._collect_loop, name = "InterfaceCollector", daemon = True)
+        self._thread.start()
+
+    def _collect_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                counters = self.sample()
+            except (OSError, ValueError, IndexError):  # unreadable or malformed /proc/net/dev : sampled again an interval later
+                counters = None
+            if counters is not None:
+                self.buffer.append(time.monotonic(), *counters)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+# Example usage, with a fake management server :
+if __name__ == "__main__":
+    from LogWriter import LogWriter
+    logger = LogWriter("log.txt")
+    buffer = TrafficBuffer()
+    collector = ManagementCollector(buffer, logger)
+    collector.openvpn_options()
+    def fake_management_server():
+        with socket.create_server((collector.host, collector.port)) as server:
+            connection, _ = server.accept()
+            with connection:
+                connection.sendall(b"ENTER PASSWORD:")
+                connection.recv(4096)
+                connection.sendall(b"SUCCESS: password is correct\r\n>INFO:OpenVPN Management Interface Version 5\r\n")
+                connection.recv(4096)
+                for second in range(1, 6):
+                    connection.sendall(f">BYTECOUNT:{second * 250000},{second * 40000}\r\n".encode())
+                    time.sleep(0.2)
+    threading.Thread(target = fake_management_server, daemon = True).start()
+    collector.start()
+    time.sleep(1.5)
+    collector.stop()
+    for timestamp, received, sent in buffer.rates():
+        print(f"{received / 1000:.0f} kB/s received, {sent / 1000:.0f} kB/s sent")
+    logger.close()
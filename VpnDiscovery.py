@@ -0,0 +1,285 @@
+import concurrent.futures
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import threading
+import time
+from LogWriter import invoker
+
+class VpnDiscovery:
+    """
+    List the VPN configurations present in the configured directories with os.scandir, in parallel, caching each listing
+    on disk by directory modification time so that unchanged directories are not listed again, and watch the directories
+    (with inotify, or by polling their modification time) to report added and removed configurations
+    """
+    # Entries that are not VPN configurations :
+    IGNORED = ("client", "server", "configurations")
+    # inotify flags (see inotify(7)) :
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_NONBLOCK = 0x800
+    IN_CLOEXEC = 0x80000
+    INOTIFY_EVENT = struct.Struct("iIII")
+    # Longest delay, in seconds, between two checks of a missing directory (or two attempts to watch it) :
+    MAX_RETRY_INTERVAL = 60.0
+
+    def __init__(self, paths, cache_file, logger, poll_interval = 2.0):
+        """
+        Initialize the directories to list, the cache and the watcher settings
+        poll_interval : seconds between two modification time checks when inotify is not available
+        """
+        self.paths = list(paths)
+        self.cache_file = cache_file
+        self.logger = logger
+        self.poll_interval = poll_interval
+        self.listings = {}  # path -> set of configuration names currently known
+        self._cache = {}
+        if os.path.exists(self.cache_file):
+            try:
+                with open(self.cache_file) as cache_file:
+                    self._cache = json.load(cache_file)
+            except ValueError:  # corrupted cache : list everything again
+                self._cache = {}
+        self._lock = threading.Lock()  # one listing at a time : list() is called from several threads (daemon clients)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._libc = None
+        self._watches = {}  # inotify watch descriptor -> path
+        self._retries = {}  # missing or unwatched directory -> (seconds until the next attempt, time of the next attempt)
+
+    def _scan(self, path, force = False):
+        """
+        List the configurations of a directory, from the cache if its modification time did not change (a missing
+        directory is cached as empty, with no modification time)
+        force : list it even if the cache is up to date
+        Return (names, whether the cache was used)
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        cached = self._cache.get(path)
+        if cached is not None and cached["mtime"] == mtime and not force:
+            return cached["names"], True
+        names = []
+        if mtime is not None:
+            try:
+                with os.scandir(path) as entries:
+                    names = sorted(entry.name for entry in entries if entry.name not in self.IGNORED and not entry.name.startswith("."))
+            except OSError:  # removed meanwhile
+                mtime = None
+        self._cache[path] = {"mtime": mtime, "names": names}
+        return names, False
+
+    def _save_cache(self):
+        """
+        Atomically write the cache (temporary file + rename)
+        """
+        os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok = True)
+        temporary_file = f"{self.cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temporary_file, 'w') as cache_file:
+            json.dump(self._cache, cache_file)
+        os.replace(temporary_file, self.cache_file)
+
+    def list(self):
+        """
+        Return the list of VPN configurations present in all the directories, listing them in parallel
+        """
+        with self._lock:
+            with concurrent.futures.ThreadPoolExecutor(max_workers = max(len(self.paths), 1)) as executor:
+                results = list(executor.map(self._scan, self.paths))
+            for path, (names, _) in zip(self.paths, results):
+                self.listings[path] = set(names)
+            if not all(cached for _, cached in results):
+                self._save_cache()
+        vpn_list = []
+        for path, (names, cached) in zip(self.paths, results):
+            vpn_list = vpn_list + names
+            # Write to log file :
+            if self.logger.enabled("ACTION"):
+                self.logger.write("ACTION", {"action":f"list VPN configurations of {path} ({len(names)} found, {'cached' if cached else 'scanned'})", "invoker":invoker(self), "output":"0"})
+        return vpn_list
+
+    def _rescan(self, paths, on_change, force = False):
+        """
+        List directories again and report the configurations added and removed since the last listing
+        force : list them even if the cache is up to date (events were lost)
+        """
+        added, removed = [], []
+        scanned = False
+        with self._lock:
+            for path in paths:
+                names, cached = self._scan(path, force)
+                names = set(names)
+                scanned = scanned or not cached
+                previous = self.listings.get(path, set())
+                added += sorted(names - previous)
+                removed += sorted(previous - names)
+                self.listings[path] = names
+            if scanned:
+                self._save_cache()
+        if added or removed:
+            on_change(added, removed)
+
+    def _retry_due(self, path, now):
+        """
+        Return whether a missing or unwatched directory should be checked again
+        """
+        retry = self._retries.get(path)
+        return retry is None or now >= retry[1]
+
+    def _retry_later(self, path, now):
+        """
+        Check a missing or unwatched directory again later, doubling the delay each time up to MAX_RETRY_INTERVAL
+        """
+        delay = min(self._retries[path][0] * 2, self.MAX_RETRY_INTERVAL) if path in self._retries else self.poll_interval
+        self._retries[path] = (delay, now + delay)
+
+    def watch(self, on_change):
+        """
+        Watch the directories from a background thread and call on_change(added, removed) with lists of configuration names
+        when they change ; list() must have been called first
+        """
+        self._stop_event.clear()
+        inotify_fd = self._init_inotify()
+        target = self._inotify_loop if inotify_fd is not None else self._poll_loop
+        self._thread = threading.Thread(target = target, args = (on_change,) + ((inotify_fd,) if inotify_fd is not None else ()), name = "VpnDiscovery", daemon = True)
+        self._thread.start()
+
+    def _init_inotify(self):
+        """
+        Create an inotify instance watching every directory, or return None if inotify is not available
+        """
+        library = ctypes.util.find_library("c")
+        if library is None:
+            return None
+        libc = ctypes.CDLL(library, use_errno = True)
+        if not hasattr(libc, "inotify_init1"):
+            return None
+        fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if fd < 0:
+            return None
+        self._libc = libc
+        self._watches = {}
+        self._retries = {}
+        for path in self.paths:
+            if not self._add_watch(fd, path):  # missing directory : watched once it appears
+                self._retry_later(path, time.monotonic())
+        return fd
+
+    def _add_watch(self, fd, path):
+        """
+        Watch a directory, return False if it cannot be watched (missing, not readable)
+        """
+        watch = self._libc.inotify_add_watch(fd, os.fsencode(path), self.IN_CREATE | self.IN_DELETE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_DELETE_SELF | self.IN_MOVE_SELF)
+        if watch < 0:
+            return False
+        self._watches[watch] = path
+        return True
+
+    def _retry_watches(self, fd):
+        """
+        Try again to watch the directories that could not be watched, return those watched now
+        """
+        now = time.monotonic()
+        watched = set()
+        for path in list(self._retries):
+            if not self._retry_due(path, now):
+                continue
+            if self._add_watch(fd, path):
+                del self._retries[path]
+                watched.add(path)
+            else:
+                self._retry_later(path, now)
+        return watched
+
+    def _inotify_loop(self, on_change, fd):
+        """
+        Wait for inotify events and rescan the directories they concern, coalescing the bursts of events of mass copies
+        """
+        try:
+            while not self._stop_event.is_set():
+                readable = select.select([fd], [], [], 0.5)[0]
+                # Directories that appeared since they could not be watched :
+                changed_paths = self._retry_watches(fd) if self._retries else set()
+                overflow = False
+                if readable:
+                    # Let a burst of events settle, then read them all :
+                    time.sleep(0.2)
+                    try:
+                        while True:
+                            data = os.read(fd, 65536)
+                            offset = 0
+                            while offset < len(data):
+                                watch, mask, _, length = self.INOTIFY_EVENT.unpack_from(data, offset)
+                                offset += self.INOTIFY_EVENT.size + length
+                                if mask & self.IN_Q_OVERFLOW:  # events were dropped : the listings may be stale
+                                    overflow = True
+                                    continue
+                                path = self._watches.get(watch)
+                                if path is None:
+                                    continue
+                                changed_paths.add(path)
+                                if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF | self.IN_IGNORED):
+                                    # The directory is gone (or the watch now follows it elsewhere) : watch the path again once it exists
+                                    del self._watches[watch]
+                                    if not mask & self.IN_IGNORED:
+                                        self._libc.inotify_rm_watch(fd, watch)
+                                    self._retry_later(path, time.monotonic())
+                    except BlockingIOError:
+                        pass
+                if overflow:
+                    self._rescan(self.paths, on_change, force = True)
+                elif changed_paths:
+                    self._rescan([path for path in self.paths if path in changed_paths], on_change)
+        finally:
+            os.close(fd)
+
+    def _poll_loop(self, on_change):
+        """
+        Check the modification time of every directory every poll_interval seconds and rescan the ones that changed
+        """
+        while not self._stop_event.wait(self.poll_interval):
+            now = time.monotonic()
+            changed_paths = []
+            for path in self.paths:
+                if not self._retry_due(path, now):  # missing, checked less and less often
+                    continue
+                try:
+                    mtime = os.stat(path).st_mtime_ns
+                    self._retries.pop(path, None)
+                except OSError:
+                    mtime = None
+                    self._retry_later(path, now)
+                if mtime != self._cache.get(path, {}).get("mtime"):
+                    changed_paths.append(path)
+            if changed_paths:
+                self._rescan(changed_paths, on_change)
+
+    def stop(self):
+        """
+        Stop watching the directories
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+# Example usage :
+if __name__ == "__main__":
+    from LogWriter import LogWriter
+    logger = LogWriter("log.txt")
+    vpn_discovery = VpnDiscovery(["/etc/openvpn"], ".cache/vpns.json", logger)
+    print(vpn_discovery.list())
+    vpn_discovery.watch(lambda added, removed: print(f"added : {added}, removed : {removed}"))
+    time.sleep(30)
+    vpn_discovery.stop()
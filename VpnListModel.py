@@ -0,0 +1,260 @@
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QSize, QSortFilterProxyModel
+from PyQt6.QtWidgets import QStyledItemDelegate
+
+class VpnListModel(QAbstractListModel):
+    """
+    The VPN configurations of the list, with their flag, latency and pinned (connected) state, kept in display order :
+    the pinned VPN first, then by name or by latency
+    Rows are ordered here with a single key sort and a layout change rather than by a proxy, whose lessThan() would be
+    called from C++ into Python O(n log n) times
+    Flag icons are only fetched from the shared flag_icons cache (see FlagIcons) when the view paints a row
+    """
+    # Latency of the VPN, in seconds (None if unreachable or not measured yet) :
+    LATENCY_ROLE = Qt.ItemDataRole.UserRole + 1
+    # Country code of the VPN flag :
+    FLAG_ROLE = Qt.ItemDataRole.UserRole + 2
+    # Whether the VPN is pinned at the top of the list :
+    PINNED_ROLE = Qt.ItemDataRole.UserRole + 3
+    ROW_SIZE = QSize(200, 40)
+
+    def __init__(self, flag_icons = None, parent = None):
+        super().__init__(parent)
+        self.flag_icons = flag_icons
+        self.pinned = None  # name of the pinned VPN
+        self.sort_by_latency = False
+        self._names = []
+        self._lower_names = []  # lowercase names, for searching
+        self._rows = {}  # name -> row
+        self._latencies = {}  # name -> latency
+        self._flags = {}  # name -> country code
+
+    def rowCount(self, parent = QModelIndex()):
+        return 0 if parent.isValid() else len(self._names)
+
+    def data(self, index, role = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        name = self._names[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return name
+        if role == Qt.ItemDataRole.DecorationRole:
+            return self.flag_icons.icon(self._flags.get(name)) if self.flag_icons is not None else None
+        if role == Qt.ItemDataRole.ToolTipRole:
+            if name not in self._latencies:
+                return None
+            latency = self._latencies[name]
+            return f"Latency : {latency * 1000:.0f} ms" if latency is not None else "Latency : unreachable"
+        if role == Qt.ItemDataRole.SizeHintRole:
+            return self.ROW_SIZE
+        if role == self.LATENCY_ROLE:
+            return self._latencies.get(name)
+        if role == self.FLAG_ROLE:
+            return self._flags.get(name)
+        if role == self.PINNED_ROLE:
+            return name == self.pinned
+        return None
+
+    def name(self, row):
+        """
+        Return the name of the VPN of a row
+        """
+        return self._names[row]
+
+    def names(self):
+        """
+        Return the names of every VPN of the list
+        """
+        return list(self._names)
+
+    def row(self, name):
+        """
+        Return the row of a VPN, or None if it is not in the list
+        """
+        return self._rows.get(name)
+
+    def matches(self, row, search):
+        """
+        Return whether the name of the VPN of a row contains a lowercase search text
+        """
+        return search in self._lower_names[row]
+
+    def _sort_key(self, name):
+        """
+        Return the sort key of a VPN : the pinned VPN first, then by name or by latency (unreachable and unmeasured last) then name
+        """
+        if self.sort_by_latency:
+            latency = self._latencies.get(name)
+            return (name != self.pinned, latency is None, latency or 0, name)
+        return (name != self.pinned, name)
+
+    def _sort(self):
+        """
+        Put the rows back in order, moving the persistent indexes (selection, current row, proxy mapping) along
+        """
+        order = sorted(range(len(self._names)), key = lambda row: self._sort_key(self._names[row]))
+        if all(row == new_row for new_row, row in enumerate(order)):
+            return
+        self.layoutAboutToBeChanged.emit()
+        new_rows = [0] * len(order)
+        for new_row, row in enumerate(order):
+            new_rows[row] = new_row
+        self._names = [self._names[row] for row in order]
+        self._lower_names = [self._lower_names[row] for row in order]
+        self._rows = {name: row for row, name in enumerate(self._names)}
+        persistent_indexes = self.persistentIndexList()
+        self.changePersistentIndexList(persistent_indexes, [self.index(new_rows[index.row()]) for index in persistent_indexes])
+        self.layoutChanged.emit()
+
+    def set_sort_by_latency(self, by_latency):
+        """
+        Sort by latency rather than by name
+        """
+        if by_latency != self.sort_by_latency:
+            self.sort_by_latency = by_latency
+            self._sort()
+
+    def add(self, names):
+        """
+        Add the VPNs that are not in the list yet
+        """
+        names = [name for name in dict.fromkeys(names) if name not in self._rows]
+        if not names:
+            return
+        first = len(self._names)
+        self.beginInsertRows(QModelIndex(), first, first + len(names) - 1)
+        for row, name in enumerate(names, first):
+            self._rows[name] = row
+        self._names.extend(names)
+        self._lower_names.extend(name.lower() for name in names)
+        self.endInsertRows()
+        self._sort()
+
+    def remove(self, names):
+        """
+        Remove VPNs from the list
+        """
+        rows = sorted((self._rows[name] for name in set(names) if name in self._rows), reverse = True)
+        if not rows:
+            return
+        for row in rows:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            name = self._names.pop(row)
+            del self._lower_names[row]
+            self._latencies.pop(name, None)
+            self._flags.pop(name, None)
+            self.endRemoveRows()
+        self._rows = {name: row for row, name in enumerate(self._names)}
+
+    def _changed(self, rows = None):
+        """
+        Notify the views (and the proxy, which re-filters the changed rows) that rows changed, all of them by default
+        """
+        if not self._names:
+            return
+        if rows is None:
+            self.dataChanged.emit(self.index(0), self.index(len(self._names) - 1))
+            return
+        for row in rows:
+            if row is not None:
+                self.dataChanged.emit(self.index(row), self.index(row))
+
+    def set_latencies(self, latencies):
+        """
+        Set the latency of VPNs (name -> latency in seconds or None)
+        """
+        self._latencies.update((name, latency) for name, latency in latencies.items() if name in self._rows)
+        self._changed()
+        if self.sort_by_latency:
+            self._sort()
+
+    def set_flags(self, flags):
+        """
+        Set the flag country code of VPNs (name -> country code or None), notifying only the rows whose flag changed
+        """
+        changed = [self._rows[name] for name, code in flags.items() if name in self._rows and self._flags.get(name) != code]
+        self._flags.update((name, code) for name, code in flags.items() if name in self._rows)
+        if len(changed) > len(self._names) // 2:
+            self._changed()
+        else:
+            self._changed(changed)
+
+    def set_pinned(self, name):
+        """
+        Pin a VPN at the top of the list (None to unpin) : its sort key changes and the list is put back in order
+        """
+        previous, self.pinned = self.pinned, name
+        self._changed([self._rows.get(previous), self._rows.get(name)])
+        self._sort()
+
+class VpnFilterProxy(QSortFilterProxyModel):
+    """
+    Filtered view of a VpnListModel, in the model's order : restricted to a set of allowed names and to the names containing
+    a search text ; the pinned VPN is never filtered out
+    """
+    def __init__(self, parent = None):
+        super().__init__(parent)
+        self.search = ""
+        self.allowed = None  # set of names, or None for every name
+        self.setDynamicSortFilter(True)  # re-filter the rows that change, as they change
+
+    def set_search(self, text):
+        """
+        Only show the VPNs whose name contains a text (case-insensitive)
+        """
+        search = text.strip().lower()
+        if search == self.search:
+            return
+        self.search = search
+        self.invalidateRowsFilter()
+
+    def set_allowed(self, names):
+        """
+        Only show a set of VPNs (None to show them all)
+        """
+        self.allowed = names
+        self.invalidateRowsFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        model = self.sourceModel()
+        name = model.name(source_row)
+        if name == model.pinned:
+            return True
+        if self.allowed is not None and name not in self.allowed:
+            return False
+        return not self.search or model.matches(source_row, self.search)
+
+class VpnListDelegate(QStyledItemDelegate):
+    """
+    Draw the latency of each VPN right-aligned in its row, as a second column, and a separator under the pinned VPN
+    """
+    def paint(self, painter, option, index):
+        super().paint(painter, option, index)
+        latency = index.data(VpnListModel.LATENCY_ROLE)
+        pinned = index.data(VpnListModel.PINNED_ROLE)
+        if latency is None and not pinned:
+            return
+        painter.save()
+        painter.setPen(option.palette.text().color())
+        if latency is not None:
+            painter.drawText(option.rect.adjusted(0, 0, -15, 0), Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter, f"{latency * 1000:.0f} ms")
+        if pinned:
+            painter.drawLine(option.rect.left() + 5, option.rect.bottom(), option.rect.right() - 5, option.rect.bottom())
+        painter.restore()
+
+# Example usage :
+if __name__ == "__main__":
+    import sys
+    from PyQt6.QtWidgets import QApplication, QListView
+    app = QApplication(sys.argv)
+    vpn_list_model = VpnListModel()
+    vpn_list_model.add([f"{code}-{number}.ovpn" for code in ("de", "fr", "us") for number in range(3)])
+    vpn_filter_proxy = VpnFilterProxy()
+    vpn_filter_proxy.setSourceModel(vpn_list_model)
+    vpn_list_model.set_pinned("us-1.ovpn")
+    vpn_filter_proxy.set_search("fr")
+    print([vpn_filter_proxy.index(row, 0).data() for row in range(vpn_filter_proxy.rowCount())])
+    view = QListView()
+    view.setModel(vpn_filter_proxy)
+    view.setItemDelegate(VpnListDelegate(view))
+    view.show()
+    sys.exit(app.exec())
@@ -0,0 +1,80 @@
+"""
+Benchmark of command output reading : lines/sec and CPU time of the I/O loop used by CommandRunner against the previous
+threading model (one thread per command plus one readline() thread per stream), with several commands running at once
+Run from anywhere : python3 benchmarks/command_output.py [commands] [lines per command]
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+from IOLoop import IOLoop
+
+def output_command(lines):
+    """
+    Shell command printing a given number of openvpn-like lines
+    """
+    return ["/bin/sh", "-c", f"yes 'Sat Oct 18 19:05:00 2026 TCP/UDP: Preserving recently used remote address' | head -n {lines}"]
+
+def read_with_threads(commands, lines):
+    """
+    Previous model : a thread per command, running a readline() loop thread per stream
+    """
+    counts = [0] * commands
+    def stream_reader(process, stream, index):
+        while True:
+            output = stream.readline()
+            if output:
+                counts[index] += 1
+            elif process.poll() is not None:
+                break
+    def target(index):
+        process = subprocess.Popen(output_command(lines), stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True, bufsize = 1)
+        readers = [threading.Thread(target = stream_reader, args = (process, stream, index)) for stream in (process.stdout, process.stderr)]
+        for reader in readers:
+            reader.start()
+        for reader in readers:
+            reader.join()
+    threads = [threading.Thread(target = target, args = (index,)) for index in range(commands)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts)
+
+def read_with_io_loop(commands, lines):
+    """
+    Current model : every stream read by the shared I/O loop thread
+    """
+    counts = [0] * commands
+    closed = threading.Semaphore(0)
+    def count(index, chunk):
+        counts[index] += len(chunk)
+    io_loop = IOLoop.shared()
+    for index in range(commands):
+        process = subprocess.Popen(output_command(lines), stdout = subprocess.PIPE, stderr = subprocess.PIPE, bufsize = 0)
+        io_loop.register(process.stdout, lambda chunk, index = index: count(index, chunk), closed.release)
+        io_loop.register(process.stderr, lambda chunk, index = index: count(index, chunk), closed.release)
+    for _ in range(2 * commands):
+        closed.acquire()
+    return sum(counts)
+
+def measure(reader, commands, lines):
+    """
+    Return (lines read, lines/sec, CPU seconds of this process) for a reading model
+    """
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    total = reader(commands, lines)
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    return total, total / wall, cpu
+
+if __name__ == "__main__":
+    commands = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    for name, reader, threads in (("threads + readline()", read_with_threads, 3 * commands), ("I/O loop", read_with_io_loop, 1)):
+        total, rate, cpu = measure(reader, commands, lines)
+        print(f"{name:<22} {total} lines  {rate:12,.0f} lines/s  {cpu:6.2f} s CPU  {threads} reading threads")
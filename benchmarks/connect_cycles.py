@@ -0,0 +1,83 @@
+"""
+Microbenchmark of log payload capture during connect/disconnect cycles :
+- payload cost : the old inspect.stack() invoker against invoker(), with ACTION entries enabled and disabled
+- full cycles : CommandRunner.run() + stop() of a short command, with ACTION entries enabled and disabled
+Run from anywhere : python3 benchmarks/connect_cycles.py [cycles]
+"""
+import inspect
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+# Config reads and updates config.json and state.json next to the modules : point it to a copy before they are imported,
+# so the benchmark leaves the repository's state alone
+WORKING_DIRECTORY = tempfile.mkdtemp()
+shutil.copy(os.path.join(REPOSITORY, "config.json"), WORKING_DIRECTORY)
+os.environ["NEBULA_CONFIG"] = os.path.join(WORKING_DIRECTORY, "config.json")
+
+from LogWriter import LogWriter, invoker
+from CommandRunner import CommandRunner
+
+# Log entries written by one connect/disconnect cycle (CommandRunner.__init__, run() and stop()) :
+ACTIONS_PER_CYCLE = 10
+
+class Caller:
+    """
+    Stand-in for the instances that write log entries
+    """
+    def __init__(self, logger):
+        self.logger = logger
+
+    def inspect_payload(self):
+        self.logger.write("ACTION", {"action":"benchmark", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
+
+    def invoker_payload(self):
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":"benchmark", "invoker":invoker(self), "output":"0"})
+
+def time_payloads(logger, method, cycles):
+    """
+    Return the time spent building and queuing the log entries of cycles connect/disconnect cycles, in seconds
+    """
+    start = time.perf_counter()
+    for _ in range(cycles * ACTIONS_PER_CYCLE):
+        method()
+    elapsed = time.perf_counter() - start
+    logger.sync()
+    return elapsed
+
+def time_cycles(logger, cycles):
+    """
+    Return the time spent in cycles CommandRunner run/stop cycles, in seconds
+    """
+    start = time.perf_counter()
+    for _ in range(cycles):
+        command_runner = CommandRunner("/bin/sleep 10", logger)
+        command_runner.run()
+        while command_runner.process is None:
+            time.sleep(0.0005)
+        command_runner.stop()
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    os.chdir(WORKING_DIRECTORY)
+    logger = LogWriter(os.path.join(WORKING_DIRECTORY, "log.txt"))
+    caller = Caller(logger)
+    results = {}
+    results["payload, inspect.stack()"] = time_payloads(logger, caller.inspect_payload, cycles)
+    results["payload, invoker()"] = time_payloads(logger, caller.invoker_payload, cycles)
+    logger.set_enabled("ACTION", False)
+    results["payload, invoker(), ACTION disabled"] = time_payloads(logger, caller.invoker_payload, cycles)
+    logger.set_enabled("ACTION", True)
+    results["run/stop cycles"] = time_cycles(logger, cycles)
+    logger.set_enabled("ACTION", False)
+    results["run/stop cycles, ACTION disabled"] = time_cycles(logger, cycles)
+    logger.close()
+    for name, elapsed in results.items():
+        print(f"{name:<40} {elapsed / cycles * 1000:8.3f} ms/cycle")
+    shutil.rmtree(WORKING_DIRECTORY)
@@ -0,0 +1,512 @@
+"""
+Headless benchmark suite : log writing and flushing, command output, teardown and concurrent execution, telemetry
+overhead, VPN listing, flag icons, VPN list and console updates, and stylesheet compilation, run on a plain Linux machine (offscreen
+Qt platform, sh/yes/sleep stand-ins for openvpn) against a temporary copy of config.json
+Results are written as JSON ; --compare checks them against a saved baseline and exits with 1 on regressions
+Run from anywhere :
+    python3 benchmarks/suite.py [--quick] [--only log_write,stylesheet] [--log-sizes 10,100,1000] [--output results.json]
+    python3 benchmarks/suite.py --compare baseline.json [--threshold 0.25] [--results results.json]
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+from command_output import output_command
+
+BENCHMARKS = {}  # name -> function(options, working_directory) returning {metric: (value, unit, better)}
+_application = None  # the QApplication must outlive every widget, so it is created once and kept
+
+def benchmark(function):
+    BENCHMARKS[function.__name__] = function
+    return function
+
+def median_time(function, repeat):
+    """
+    Return the median duration of repeat calls to function, in seconds
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+def prepare(working_directory):
+    """
+    Copy config.json to the working directory (without log rotation, which would split the logs being measured) and
+    make every module use it : must run before the modules reading the configuration are imported
+    """
+    with open(os.path.join(REPOSITORY, "config.json")) as config_file:
+        config = json.load(config_file)
+    config["paths"]["vpns"] = [os.path.join(working_directory, "vpns")]
+    config["paths"]["flags"] = os.path.join(REPOSITORY, config["paths"]["flags"])
+    config["log"]["rotation"]["max_bytes"] = 0
+    config["daemon"]["socket"] = os.path.join(working_directory, "daemon.sock")
+    with open(os.path.join(working_directory, "config.json"), 'w') as config_file:
+        json.dump(config, config_file, indent = 2)
+    os.makedirs(os.path.join(working_directory, "vpns"))
+    os.environ["NEBULA_CONFIG"] = os.path.join(working_directory, "config.json")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    os.chdir(working_directory)
+
+@benchmark
+def log_write(options, working_directory):
+    """
+    LogWriter.write() : rate at which entries are queued, and at which they are written to disk, per log format
+    """
+    from LogWriter import LogWriter, invoker
+    count = 5000 if options.quick else 50000
+    metrics = {}
+    for log_format in LogWriter.LOG_FORMATS:
+        logger = LogWriter(os.path.join(working_directory, f"write_{log_format}.txt"), log_format = log_format)
+        start = time.perf_counter()
+        for _ in range(count):
+            logger.write("ACTION", {"action":"benchmark", "invoker":invoker(), "output":"0"})
+        queued = time.perf_counter() - start
+        logger.sync()
+        written = time.perf_counter() - start
+        logger.close()
+        metrics[f"{log_format} queued"] = (count / queued, "entries/s", "higher")
+        metrics[f"{log_format} written"] = (count / written, "entries/s", "higher")
+    return metrics
+
+@benchmark
+def log_render(options, working_directory):
+    """
+    Rendering of log entries to text (what the writer thread does per entry), for payloads of the declared shape, with a
+    nested dictionary, and with an undeclared key
+    """
+    from LogWriter import LogWriter, invoker
+    logger = LogWriter(os.path.join(working_directory, "render.txt"))
+    count = 20000 if options.quick else 200000
+    payloads = {
+        "ACTION": ("ACTION", {"action":"benchmark", "invoker":invoker(), "output":"0"}),
+        "EVENT": ("EVENT", {"event":"benchmark", "triggered by":invoker(), "output":"0"}),
+        "nested": ("ERROR", {"message":"benchmark", "raised by":{"file":"suite.py", "details":{"command":"openvpn", "depth":{"level":3}}}}),
+        "undeclared key": ("INFO", {"message":"benchmark", "extra":"value"})
+    }
+    metrics = {}
+    for name, (log_type, args) in payloads.items():
+        def render():
+            for entry_number in range(count):
+                logger._render_entry(entry_number, "2026-10-18T19:05:00+00:00", log_type, args)
+        metrics[name] = (count / median_time(render, 3), "entries/s", "higher")
+    logger.close()
+    return metrics
+
+@benchmark
+def log_flush(options, working_directory):
+    """
+    LogWriter.flush() of the oldest 1000 entries, on text logs of each size of --log-sizes (MB) and on a jsonl log of the smallest one
+    """
+    from LogWriter import LogWriter, invoker
+    metrics = {}
+    # A block of rendered entries, repeated up to each size :
+    sample_file = os.path.join(working_directory, "flush_sample.txt")
+    logger = LogWriter(sample_file, log_format = "text")
+    for _ in range(1000):
+        logger.write("ACTION", {"action":"benchmark", "invoker":invoker(), "output":"0"})
+    logger.close()
+    with open(sample_file, 'rb') as log_file:
+        sample = log_file.read()
+    sizes = [10] if options.quick else options.log_sizes
+    for size in sizes:
+        log_path = os.path.join(working_directory, f"flush_{size}.txt")
+        with open(log_path, 'wb') as log_file:
+            for _ in range(size * 1024 * 1024 // len(sample) + 1):
+                log_file.write(sample)
+        logger = LogWriter(log_path, log_format = "text")
+        start = time.perf_counter()
+        logger.flush(1000)
+        elapsed = time.perf_counter() - start
+        logger.close()
+        os.unlink(log_path)
+        metrics[f"text {size} MB"] = (elapsed * 1000, "ms", "lower")
+    # Indexed records : written through the logger, as their index must match them
+    log_path = os.path.join(working_directory, "flush_records.txt")
+    logger = LogWriter(log_path, log_format = "jsonl")
+    while os.path.getsize(logger.records_file) < sizes[0] * 1024 * 1024 if os.path.exists(logger.records_file) else True:
+        for _ in range(5000):
+            logger.write("ACTION", {"action":"benchmark", "invoker":invoker(), "output":"0"})
+        logger.sync()
+    start = time.perf_counter()
+    logger.flush(1000)
+    metrics[f"jsonl {sizes[0]} MB"] = ((time.perf_counter() - start) * 1000, "ms", "lower")
+    logger.close()
+    return metrics
+
+@benchmark
+def command_output(options, working_directory):
+    """
+    CommandRunner output rate : one and four yes-based commands printing openvpn-like lines at once
+    """
+    from CommandRunner import CommandRunner
+    from LogWriter import LogWriter
+    logger = LogWriter(os.path.join(working_directory, "commands.txt"))
+    lines = 50000 if options.quick else 500000
+    metrics = {}
+    for commands in (1, 4):
+        counts = [0] * commands
+        runners = [CommandRunner(shlex.join(output_command(lines)), logger, on_output = lambda stream_name, chunk, index = index: counts.__setitem__(index, counts[index] + len(chunk))) for index in range(commands)]
+        start = time.perf_counter()
+        for runner in runners:
+            runner.run()
+        for runner in runners:
+            runner.finished.wait()
+            runner.process.wait()
+        elapsed = time.perf_counter() - start
+        metrics[f"{commands} command{'s' if commands > 1 else ''}"] = (sum(counts) / elapsed, "lines/s", "higher")
+    logger.close()
+    return metrics
+
+@benchmark
+def command_teardown(options, working_directory):
+    """
+    CommandRunner.stop() latency of a quiet command (sleep), of a command flooding its output (yes), and of a command
+    ignoring SIGTERM (killed after a 100 ms grace time) ; and how long stop_async() keeps the caller waiting
+    """
+    from CommandRunner import CommandRunner
+    from LogWriter import LogWriter
+    logger = LogWriter(os.path.join(working_directory, "teardown.txt"))
+    cycles = 5 if options.quick else 20
+    metrics = {}
+    for name, command, grace in (("quiet", "/bin/sleep 60", None), ("flooding", "/usr/bin/yes", None), ("ignoring SIGTERM", "/bin/sh -c 'trap \"\" TERM; while :; do sleep 0.01; done'", 0.1)):
+        durations = []
+        for _ in range(cycles):
+            runner = CommandRunner(command, logger)
+            runner.run()
+            time.sleep(0.05)
+            start = time.perf_counter()
+            runner.stop(grace)
+            durations.append(time.perf_counter() - start)
+        metrics[f"{name} median"] = (statistics.median(durations) * 1000, "ms", "lower")
+        metrics[f"{name} max"] = (max(durations) * 1000, "ms", "lower")
+    returns = []
+    for _ in range(cycles):
+        runner = CommandRunner("/bin/sleep 60", logger)
+        runner.run()
+        time.sleep(0.05)
+        start = time.perf_counter()
+        future = runner.stop_async()
+        returns.append(time.perf_counter() - start)
+        future.result()
+    metrics["stop_async return"] = (statistics.median(returns) * 1000, "ms", "lower")
+    logger.close()
+    return metrics
+
+@benchmark
+def command_executor(options, working_directory):
+    """
+    CommandExecutor throughput (8 commands at once) against running the same commands serially with CommandRunner, for
+    commands that wait (sleep 50 ms, as ping does) and for commands that exit at once (true)
+    """
+    from CommandExecutor import CommandExecutor
+    from CommandRunner import CommandRunner
+    from LogWriter import LogWriter
+    logger = LogWriter(os.path.join(working_directory, "executor.txt"))
+    count = 24 if options.quick else 120
+    metrics = {}
+    for name, command in (("waiting", "/bin/sleep 0.05"), ("instant", "/bin/true")):
+        start = time.perf_counter()
+        for _ in range(count):
+            runner = CommandRunner(command, logger)
+            runner.run()
+            runner.finished.wait()
+            runner.process.wait()
+        serial = time.perf_counter() - start
+        executor = CommandExecutor(logger, max_concurrency = 8, timeout = 10)
+        start = time.perf_counter()
+        results = executor.run([command] * count)
+        concurrent = time.perf_counter() - start
+        executor.shutdown()
+        if not all(result.succeeded for result in results):
+            raise RuntimeError(f"{command} failed under the executor")
+        metrics[f"{name} serial"] = (count / serial, "commands/s", "higher")
+        metrics[f"{name} executor"] = (count / concurrent, "commands/s", "higher")
+        metrics[f"{name} speedup"] = (serial / concurrent, "x", "higher")
+    logger.close()
+    return metrics
+
+@benchmark
+def telemetry(options, working_directory):
+    """
+    Telemetry : cost of a span and of a counter increment, disabled (what instrumented code pays in production) and enabled
+    """
+    from Telemetry import Telemetry
+    count = 100000 if options.quick else 1000000
+    metrics = {}
+    for state, enabled in (("disabled", False), ("enabled", True)):
+        instance = Telemetry(enabled, max_events = count)
+        def spans():
+            for _ in range(count):
+                with instance.span("benchmark", server = "benchmark"):
+                    pass
+        def counts():
+            for _ in range(count):
+                instance.count("benchmark", server = "benchmark")
+        metrics[f"span {state}"] = (median_time(spans, 3) / count * 1e9, "ns", "lower")
+        metrics[f"count {state}"] = (median_time(counts, 3) / count * 1e9, "ns", "lower")
+        instance.close()
+    return metrics
+
+def create_configurations(directory, count):
+    """
+    Create count minimal VPN configurations in a directory (once), whose remotes refuse connections at once so that
+    probing their latencies does not outlast the benchmark
+    """
+    existing = len(os.listdir(directory))
+    for index in range(existing, count):
+        with open(os.path.join(directory, f"xx-{index:05d}.example.com_{'udp' if index % 2 else 'tcp'}.ovpn"), 'w') as configuration:
+            configuration.write(f"client\ndev tun\nproto {'udp' if index % 2 else 'tcp'}\nremote 127.0.0.1 {20000 + index % 1000}\ncipher AES-256-GCM\n")
+
+@benchmark
+def list_vpns(options, working_directory):
+    """
+    VpnDiscovery.list() of a directory of 10k configurations, without and with its listing cache
+    """
+    from LogWriter import LogWriter
+    from VpnDiscovery import VpnDiscovery
+    count = 2000 if options.quick else 10000
+    directory = os.path.join(working_directory, "vpns")
+    create_configurations(directory, count)
+    logger = LogWriter(os.path.join(working_directory, "discovery.txt"))
+    cache_file = os.path.join(working_directory, "vpns.json")
+    def cold():
+        if os.path.exists(cache_file):
+            os.unlink(cache_file)
+        VpnDiscovery([directory], cache_file, logger).list()
+    metrics = {
+        f"{count} configurations, scanned": (median_time(cold, 5) * 1000, "ms", "lower"),
+        f"{count} configurations, cached": (median_time(lambda: VpnDiscovery([directory], cache_file, logger).list(), 5) * 1000, "ms", "lower")
+    }
+    logger.close()
+    return metrics
+
+@benchmark
+def stylesheet(options, working_directory):
+    """
+    StyleCache : libsass import, compilation, and loads from the disk and memory caches
+    """
+    from Config import Config
+    from LogWriter import LogWriter
+    from StyleCache import StyleCache
+    logger = LogWriter(os.path.join(working_directory, "styles.txt"))
+    colors = Config.shared().get_dict("colors")
+    cache_path = os.path.join(working_directory, "styles")
+    new_cache = lambda: StyleCache(os.path.join(REPOSITORY, "styles.scss"), cache_path, logger)
+    def compile_stylesheet():
+        shutil.rmtree(cache_path, ignore_errors = True)
+        new_cache().stylesheet(colors)
+    metrics = {}
+    if "sass" not in sys.modules:  # imported by the first compilation only
+        start = time.perf_counter()
+        importlib.import_module("sass")
+        metrics["libsass import"] = ((time.perf_counter() - start) * 1000, "ms", "lower")
+    metrics["compilation"] = (median_time(compile_stylesheet, 5) * 1000, "ms", "lower")
+    metrics["disk cache"] = (median_time(lambda: new_cache().stylesheet(colors), 5) * 1000, "ms", "lower")
+    style_cache = new_cache()
+    style_cache.stylesheet(colors)
+    metrics["memory cache"] = (median_time(lambda: style_cache.stylesheet(colors), 100) * 1000, "ms", "lower")
+    logger.close()
+    return metrics
+
+def resident_memory():
+    """
+    Resident memory of the process, in MiB
+    """
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+@benchmark
+def flag_icons(options, working_directory):
+    """
+    VPN list of 5k rows with their flags, shown once : time to the first paint, resident memory and flag icons created,
+    for one QIcon per row (what add_items_to_list did), the shared lazily loaded FlagIcons, and FlagIcons from the atlas
+    """
+    global _application
+    from PyQt6.QtCore import QSize
+    from PyQt6.QtGui import QIcon
+    from PyQt6.QtWidgets import QApplication, QListView, QListWidget, QListWidgetItem
+    from FlagIcons import FlagIcons, build_atlas
+    from VpnListModel import VpnListModel
+    application = _application = QApplication.instance() or QApplication([])
+    flags_path = os.path.join(REPOSITORY, "flags")
+    codes = sorted(os.path.splitext(name)[0] for name in os.listdir(flags_path) if name.endswith(".png"))
+    rows = {f"{codes[index % len(codes)]}-{index:05d}.example.com_udp.ovpn": codes[index % len(codes)] for index in range(5000)}
+    atlas_file = os.path.join(working_directory, "flags_atlas.png")
+    build_atlas(flags_path, atlas_file)
+    def per_row_icons():
+        view = QListWidget()
+        for name, code in rows.items():
+            item = QListWidgetItem(name)
+            item.setIcon(QIcon(os.path.join(flags_path, f"{code}.png")))
+            item.setSizeHint(QSize(200, 40))
+            view.setIconSize(QSize(20, 20))
+            view.addItem(item)
+        return view, len(rows)
+    def shared_icons(atlas):
+        flag_icons = FlagIcons(flags_path, atlas)
+        model = VpnListModel(flag_icons)
+        view = QListView()
+        view.setModel(model)
+        view.setIconSize(QSize(20, 20))
+        view.setUniformItemSizes(True)
+        model.add(list(rows))
+        model.set_flags(rows)
+        return view, flag_icons
+    metrics = {}
+    for name, build in (("per-row QIcon", per_row_icons), ("FlagIcons", lambda: shared_icons(None)), ("FlagIcons atlas", lambda: shared_icons(atlas_file))):
+        application.processEvents()
+        memory = resident_memory()
+        start = time.perf_counter()
+        view, icons = build()
+        view.show()
+        application.processEvents()
+        metrics[f"{name} first paint"] = ((time.perf_counter() - start) * 1000, "ms", "lower")
+        metrics[f"{name} memory"] = (resident_memory() - memory, "MiB", "lower")
+        metrics[f"{name} icons"] = (icons if isinstance(icons, int) else len(icons._icons), "icons", "lower")
+        view.close()
+        view.deleteLater()
+        application.processEvents()
+    return metrics
+
+@benchmark
+def gui(options, working_directory):
+    """
+    MainWindow : time to the first paint and to the end of startup, adding 10k VPNs to the list, and console lines/s
+    """
+    count = 2000 if options.quick else 10000
+    create_configurations(os.path.join(working_directory, "vpns"), count)
+    global _application
+    from PyQt6.QtCore import QThreadPool
+    from PyQt6.QtWidgets import QApplication
+    application = _application = QApplication.instance() or QApplication([])
+    start = time.perf_counter()
+    import gui as nebula_gui
+    window = nebula_gui.MainWindow(nebula_gui.logger)
+    window.show()
+    while not window.started:
+        application.processEvents()
+    first_paint = time.perf_counter() - start
+    while window.ovpn_index is None or not window.address_list.isEnabled():
+        application.processEvents()
+    started = time.perf_counter() - start
+    metrics = {"first paint": (first_paint * 1000, "ms", "lower"), "startup": (started * 1000, "ms", "lower")}
+    # Adding the VPNs (add_items_to_list in earlier versions) :
+    names = window.vpn_model.names()
+    def add():
+        window.vpn_model.remove(names)
+        application.processEvents()
+        start = time.perf_counter()
+        window.add_vpns(names)
+        application.processEvents()
+        return time.perf_counter() - start
+    metrics[f"add {len(names)} VPNs"] = (statistics.median(add() for _ in range(5)) * 1000, "ms", "lower")
+    # Console : lines queued from a thread, flushed by the console timer
+    lines = 20000 if options.quick else 200000
+    start = time.perf_counter()
+    producer = threading.Thread(target = lambda: [window.add_console_line(f"Sat Oct 18 19:05:00 2026 benchmark line {index}") for index in range(lines)])
+    producer.start()
+    while producer.is_alive() or window.pending_console_lines:
+        application.processEvents()
+    metrics["console"] = (lines / (time.perf_counter() - start), "lines/s", "higher")
+    window.close()
+    QThreadPool.globalInstance().waitForDone()  # latency probes and theme precompilation
+    window.vpn_discovery.stop()
+    window.config.stop()
+    if window.daemon.running():  # started by the window
+        window.daemon.shutdown()
+    window.deleteLater()
+    application.processEvents()
+    nebula_gui.logger.close()
+    return metrics
+
+def machine():
+    """
+    Describe the machine and the revision the results come from
+    """
+    try:
+        revision = subprocess.run(["git", "-C", REPOSITORY, "rev-parse", "--short", "HEAD"], capture_output = True, text = True).stdout.strip()
+    except OSError:
+        revision = ""
+    return {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count(), "revision": revision, "date": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+
+def run(options):
+    """
+    Run the selected benchmarks in a temporary working directory, return the results
+    """
+    working_directory = tempfile.mkdtemp(prefix = "nebula-benchmarks-")
+    prepare(working_directory)
+    results = {"machine": machine(), "benchmarks": {}}
+    try:
+        for name, function in BENCHMARKS.items():
+            if options.only and name not in options.only:
+                continue
+            print(f"{name}...", file = sys.stderr)
+            metrics = function(options, working_directory)
+            results["benchmarks"][name] = {metric: {"value": value, "unit": unit, "better": better} for metric, (value, unit, better) in metrics.items()}
+            for metric, (value, unit, _) in metrics.items():
+                print(f"    {metric:<36} {value:14,.2f} {unit}", file = sys.stderr)
+    finally:
+        os.chdir(REPOSITORY)
+        shutil.rmtree(working_directory, ignore_errors = True)
+    return results
+
+def compare(results, baseline, threshold):
+    """
+    Print the change of every metric against the baseline, return the regressions : metrics worse by more than threshold (a fraction)
+    """
+    regressions = []
+    for name, metrics in results["benchmarks"].items():
+        for metric, current in metrics.items():
+            previous = baseline.get("benchmarks", {}).get(name, {}).get(metric)
+            if previous is None or not previous["value"]:
+                continue
+            change = (current["value"] - previous["value"]) / previous["value"]
+            worse = -change if current["better"] == "higher" else change
+            flag = "REGRESSION" if worse > threshold else ("improved" if worse < -threshold else "")
+            print(f"{name + ' / ' + metric:<52} {previous['value']:14,.2f} -> {current['value']:14,.2f} {current['unit']:<10} {change:+8.1%}  {flag}")
+            if flag == "REGRESSION":
+                regressions.append(f"{name} / {metric}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Nebula benchmark suite")
+    parser.add_argument("--quick", action = "store_true", help = "smaller workloads, for a quick check")
+    parser.add_argument("--only", type = lambda names: names.split(","), default = None, help = f"comma-separated benchmarks among {', '.join(BENCHMARKS)}")
+    parser.add_argument("--log-sizes", type = lambda sizes: [int(size) for size in sizes.split(",")], default = [10, 100], help = "sizes of the flushed logs in MB (default 10,100 ; 1000 needs several GB of memory)")
+    parser.add_argument("--output", help = "write the results to this file (to save a baseline) instead of the standard output")
+    parser.add_argument("--compare", help = "baseline to compare the results with")
+    parser.add_argument("--results", help = "with --compare : results to compare, instead of running the benchmarks")
+    parser.add_argument("--threshold", type = float, default = 0.25, help = "relative change counted as a regression (default 0.25)")
+    options = parser.parse_args()
+    if options.results:
+        with open(options.results) as results_file:
+            results = json.load(results_file)
+    else:
+        results = run(options)
+    if options.output:
+        with open(options.output, 'w') as output_file:
+            json.dump(results, output_file, indent = 2)
+    elif not options.compare:
+        json.dump(results, sys.stdout, indent = 2)
+        print()
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), options.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) : {', '.join(regressions)}", file = sys.stderr)
+            sys.exit(1)
@@ -6,36 +6,53 @@ https://www.pythonguis.com/tutorials/pyqt6-actions-toolbars-menus/
 
 '''
 
-# Library imports :
-import sys
-import csv
-import re
-import json
-import subprocess
-import sass
-import time
-import os
-import signal
-import keyring
-import inspect
-from PyQt6.QtCore import Qt, QSize, QRunnable, pyqtSlot, QThreadPool
-from PyQt6.QtGui import QIcon
-from PyQt6.QtWidgets import (QApplication, QLabel, QListWidget, QListWidgetItem, QMainWindow, QPushButton, QWidget, QVBoxLayout, QHBoxLayout, QFrame, QSizePolicy, QSpacerItem, QScrollArea)
-# Module imports :
-from CommandRunner import CommandRunner, CommandError
-from Encrypter import Encrypter
-from LogWriter import LogWriter
-
-# Initialize LogWriter :
-logger = LogWriter("log.txt")
-# Write to log file :
-logger.write("ACTION", {"action":"Initialize LogWriter", "invoker":f"file : {os.path.basename(__file__)}", "output":"0"})
+from StartupProfiler import profiler
+
+# Only what the first frame needs is imported here : CommandRunner, keyring, discovery, indexing, location and latency
+# modules are imported when first used, after the window is painted (see MainWindow.finish_startup)
+with profiler.span("imports"):
+    # Library imports :
+    import sys
+    import os
+    import collections
+    from PyQt6.QtCore import Qt, QSize, pyqtSignal, QThreadPool, QTimer
+    from PyQt6.QtWidgets import (QApplication, QLabel, QMainWindow, QPushButton, QWidget, QVBoxLayout, QHBoxLayout, QSizePolicy, QSpacerItem, QPlainTextEdit, QComboBox, QListView, QLineEdit)
+    # Module imports :
+    from Config import Config
+    from DaemonClient import DaemonClient, DaemonError
+    from FlagIcons import FlagIcons
+    from LogWriter import LogWriter, invoker
+    from StyleCache import StyleCache
+    from Telemetry import telemetry
+    from TrafficGraph import TrafficGraph
+    from TrafficStats import TrafficBuffer
+    from VpnListModel import VpnListModel, VpnFilterProxy, VpnListDelegate
+
+# Initialize LogWriter, except in the worker processes parsing configurations (see OvpnIndex), which import this file
+# as __mp_main__ and log nothing :
+if __name__ != "__mp_main__":
+    with profiler.span("log writer"):
+        logger = LogWriter("log.txt")
+    # Write to log file :
+    if logger.enabled("ACTION"):
+        logger.write("ACTION", {"action":"Initialize LogWriter", "invoker":f"file : {os.path.basename(__file__)}", "output":"0"})
 
 # Main window :
 class MainWindow(QMainWindow):
     """
     The GUI window
     """
+    # Emitted from the discovery watcher thread with the VPN configurations added and removed :
+    vpns_changed = pyqtSignal(list, list)
+    # Emitted from the thread pool once the VPN configurations metadata is indexed :
+    vpns_indexed = pyqtSignal()
+    # Emitted from the thread pool with the latency of every VPN configuration :
+    latencies_measured = pyqtSignal(dict)
+    # Emitted from the daemon stream thread with the events of the connection daemon (see NebulaDaemon), and from the thread pool when a request fails :
+    daemon_message = pyqtSignal(dict)
+    # Emitted from the config watcher thread with a section of config.json that changed and its new value :
+    config_changed = pyqtSignal(str, object)
+
     def __init__(self, logger):
         """
         Initialize the window and variables
@@ -43,32 +60,47 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.logger = logger
         # Write to log file :
-        self.logger.write("ACTION", {"action":"Initialize MainWindow", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":"Initialize MainWindow", "invoker":invoker(self), "output":"0"})
 
-        # Load config.json file :
-        with open("config.json") as config_file:
-            self.config = json.load(config_file)
+        # Load config.json file (parsed once for the whole process, see Config) :
+        with profiler.span("config load"):
+            self.config = Config.shared()
+            self.cache_path = self.config.resolve(self.config.get_str("paths", "cache"))
         # Write to log file :
-        self.logger.write("ACTION", {"action":"Load config.json", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":"Load config.json", "invoker":invoker(self), "output":"0"})
         
         # Window style :
         self.setWindowTitle(' ')
         self.showMaximized()
-        self.stylesheet = self.compile_stylesheet('config.json')
-        self.setStyleSheet(self.stylesheet)
+        with profiler.span("stylesheet"):
+            self.themes = {"custom": self.config.get_dict("colors"), **self.config.get_dict("themes", default = {})}
+            self.style_cache = StyleCache(os.path.join(Config.BASE_PATH, "styles.scss"), os.path.join(self.cache_path, "styles"), self.logger)
+            self.stylesheet = self.theme_stylesheet(self.config.get_str("theme", default = "custom"))
+            self.setStyleSheet(self.stylesheet)
 
         # Variables :
         self.connected = False
         self.connected_status = "off"
         self.vpn_address = ""
         self.server_location = ""
-        self.separator_item = None
-        self.connected_item = None
-        self.console_lines = []
+        self.pending_console_lines = collections.deque()  # lines queued from any thread, waiting for the next console refresh
         self.process = None
-        self.vpn_paths = self.config["paths"]["vpns"]
+        self.vpn_paths = self.config.get_list("paths", "vpns")
+        # Created after the first paint (see finish_startup) :
+        self.vpn_discovery = None
+        self.ovpn_index = None
+        self.location_service = None
+        self.latency_prober = None
+        self.connection_busy = False  # a connection, switch or disconnection is under way
+        self.started = False
+        self.connect_to_fastest = False  # connect to the lowest-latency VPN once latencies are measured
 
         # Define widgets :
+        profiler.begin("widget build")
+        flags_atlas = self.config.get_str("paths", "flags_atlas", default = "")
+        self.flag_icons = FlagIcons(self.config.resolve(self.config.get_str("paths", "flags")), self.config.resolve(flags_atlas) if flags_atlas else None)
         self.title_label = QLabel("Nebula")
         self.title_label.setObjectName("title_label")
         self.title_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
@@ -82,29 +114,97 @@ class MainWindow(QMainWindow):
         self.location_label = QLabel(f"Location: {self.server_location}")
         self.location_label.setObjectName("location_label")
 
+        self.info_label = QLabel("")
+        self.info_label.setObjectName("info_label")
+
         self.connect_button = QPushButton("Connect")
         self.connect_button.setFixedSize(150, 100)
         self.connect_button.setObjectName("connect_button")
         self.connect_button.clicked.connect(self.toggle_connection)
 
+        self.fastest_button = QPushButton("Connect to fastest")
+        self.fastest_button.setObjectName("fastest_button")
+        self.fastest_button.clicked.connect(self.connect_fastest)
+
+        self.theme_selector = QComboBox()
+        self.theme_selector.setObjectName("theme_selector")
+        self.theme_selector.addItems(list(self.themes))
+        self.theme_selector.setCurrentText(self.config.get_str("theme", default = "custom"))
+        self.theme_selector.currentIndexChanged.connect(self.switch_theme)
+
         self.horizontal_spacer = QSpacerItem(0, 40, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
 
-        self.address_list = QListWidget()
-        self.address_list.setSortingEnabled(True)
-        self.address_list.itemSelectionChanged.connect(self.handle_selection)
-        self.initial_vpn_list = self.list_vpns()
-        self.add_items_to_list(self.address_list, [{"text": vpn} for vpn in self.initial_vpn_list])
+        self.protocol_filter = QComboBox()
+        self.protocol_filter.setObjectName("protocol_filter")
+        self.protocol_filter.addItems(["All protocols", "UDP", "TCP"])
+        self.protocol_filter.currentIndexChanged.connect(self.filter_vpn_list)
+
+        self.country_filter = QComboBox()
+        self.country_filter.setObjectName("country_filter")
+        self.country_filter.addItem("All countries")
+        self.country_filter.currentIndexChanged.connect(self.filter_vpn_list)
+
+        self.sort_order = QComboBox()
+        self.sort_order.setObjectName("sort_order")
+        self.sort_order.addItems(["Sort by name", "Sort by latency"])
+        self.sort_order.currentIndexChanged.connect(self.sort_vpn_list)
+
+        self.search_box = QLineEdit()
+        self.search_box.setObjectName("search_box")
+        self.search_box.setPlaceholderText("Search")
+        self.search_box.setClearButtonEnabled(True)
+        # Filter once typing pauses rather than on every keystroke :
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(150)
+        self.search_timer.timeout.connect(self.search_vpn_list)
+        self.search_box.textChanged.connect(self.search_timer.start)
+
+        # The VPN list : model (VpnListModel) -> filter (VpnFilterProxy) -> view, only the visible rows are ever painted
+        self.vpn_model = VpnListModel(self.flag_icons, self)
+        self.vpn_proxy = VpnFilterProxy(self)
+        self.vpn_proxy.setSourceModel(self.vpn_model)
+        self.address_list = QListView()
+        self.address_list.setModel(self.vpn_proxy)
+        self.address_list.setItemDelegate(VpnListDelegate(self.address_list))
+        self.address_list.setIconSize(QSize(20, 20))  # Set icon size
+        self.address_list.setUniformItemSizes(True)  # Every row has the size of the first one : no per-row layout pass
+        self.address_list.setEditTriggers(QListView.EditTrigger.NoEditTriggers)
+        self.address_list.selectionModel().selectionChanged.connect(self.handle_selection)
+        self.vpns_changed.connect(self.update_vpn_list)
+        self.vpns_indexed.connect(self.update_locations)
+        self.vpns_indexed.connect(self.handle_selection)
+        self.vpns_indexed.connect(self.filter_vpn_list)
+        self.vpns_indexed.connect(self.probe_latencies)
+        self.latencies_measured.connect(self.update_latencies)
+        # The VPN list and its controls are enabled once the VPNs are listed (see finish_startup) :
+        self.startup_widgets = (self.connect_button, self.fastest_button, self.search_box, self.protocol_filter, self.country_filter, self.sort_order, self.address_list)
+        for widget in self.startup_widgets:
+            widget.setEnabled(False)
 
         self.horizontal_spacer_2 = QSpacerItem(0, 100, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
 
-        self.console = QLabel(self)
-        self.console.setWordWrap(True)
-        self.console.setAlignment(Qt.AlignmentFlag.AlignTop | Qt.AlignmentFlag.AlignLeft)  # Align to top-left
-        self.console.setSizePolicy(self.console.sizePolicy().horizontalPolicy(), self.console.sizePolicy().verticalPolicy().Expanding)
+        # Download and upload rates of the tunnel, repainted at most 4 times per second :
+        self.traffic_buffer = TrafficBuffer(self.config.get_int("traffic", "history", default = 300))
+        self.traffic_graph = TrafficGraph(self.traffic_buffer)
+        self.traffic_graph.setObjectName("traffic_graph")
+        self.traffic_graph.setFixedHeight(120)
+        # The tunnel is run by the connection daemon, which the window follows once started (see attach_daemon) :
+        self.daemon = DaemonClient()
+        self.daemon_stream = None
+        self.daemon_message.connect(self.handle_daemon_message)
+
+        self.console = QPlainTextEdit(self)
+        self.console.setObjectName("console")
+        self.console.setReadOnly(True)
+        self.console.setMaximumBlockCount(self.config.get_int("console", "max_lines", default = 5000))  # Oldest lines are dropped past this count
+        self.console.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+        # Flush queued lines into the console at most once per frame :
+        self.console_timer = QTimer(self)
+        self.console_timer.setInterval(16)
+        self.console_timer.timeout.connect(self.flush_console)
+        self.console_timer.start()
         self.add_console_line(">>>")
-        self.console_scroll_area = QScrollArea(self)
-        self.console_scroll_area.setWidgetResizable(True)
-        self.console_scroll_area.setWidget(self.console)
 
         # Define layouts :
         self.main_layout = QVBoxLayout()
@@ -113,6 +213,8 @@ class MainWindow(QMainWindow):
         self.top_sub_layout = QHBoxLayout()
         self.top_sub_left_layout = QVBoxLayout()
         self.top_sub_right_layout = QVBoxLayout()
+        self.bottom_left_layout = QVBoxLayout()
+        self.list_options_layout = QHBoxLayout()
         self.bottom_right_layout = QVBoxLayout()
 
         # Nest layouts and add widgets :
@@ -126,117 +228,443 @@ class MainWindow(QMainWindow):
         self.top_sub_left_layout.addWidget(self.status_label)
         self.top_sub_left_layout.addWidget(self.address_label)
         self.top_sub_left_layout.addWidget(self.location_label)
+        self.top_sub_left_layout.addWidget(self.info_label)
         self.top_sub_right_layout.addWidget(self.connect_button, alignment=Qt.AlignmentFlag.AlignRight)
-        self.bottom_layout.addWidget(self.address_list)
+        self.top_sub_right_layout.addWidget(self.fastest_button, alignment=Qt.AlignmentFlag.AlignRight)
+        self.top_sub_right_layout.addWidget(self.theme_selector, alignment=Qt.AlignmentFlag.AlignRight)
+        self.bottom_layout.addLayout(self.bottom_left_layout)
+        self.bottom_left_layout.addWidget(self.search_box)
+        self.bottom_left_layout.addLayout(self.list_options_layout)
+        self.list_options_layout.addWidget(self.protocol_filter)
+        self.list_options_layout.addWidget(self.country_filter)
+        self.list_options_layout.addWidget(self.sort_order)
+        self.bottom_left_layout.addWidget(self.address_list)
         self.bottom_layout.addLayout(self.bottom_right_layout)
         self.bottom_right_layout.addSpacerItem(self.horizontal_spacer_2)
-        self.bottom_right_layout.addWidget(self.console_scroll_area)
+        self.bottom_right_layout.addWidget(self.traffic_graph)
+        self.bottom_right_layout.addWidget(self.console)
 
         # Define central widget :
         self.central_widget = QWidget()
         self.central_widget.setLayout(self.main_layout)
         self.setCentralWidget(self.central_widget)
+        profiler.end("widget build")
         # Write to log file :
-        self.logger.write("ACTION", {"action":"Configure window and widgets", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":"Configure window and widgets", "invoker":invoker(self), "output":"0"})
 
-    def add_console_line(self, text):
+    def paintEvent(self, event):
+        """
+        Paint the window, and finish starting up once the first frame is painted
+        """
+        super().paintEvent(event)
+        if not self.started:
+            self.started = True
+            profiler.mark("first paint")
+            QTimer.singleShot(0, self.finish_startup)
+
+    def closeEvent(self, event):
+        """
+        Stop following the connection daemon when the window is closed : the tunnel keeps running
+        """
+        daemon_stream, self.daemon_stream = self.daemon_stream, None
+        if daemon_stream is not None:
+            daemon_stream.close()
+        super().closeEvent(event)
+
+    def finish_startup(self):
         """
-        Add a new line of text to the terminal console
+        Load what the first frame does not need : VPN discovery, metadata index, country data and latency prober,
+        then list the VPNs and start watching, indexing and probing them in the background
         """
-        self.console_lines.append(text)
-        self.console.setText("<br>".join(self.console_lines))
+        # Deferred imports (see the module imports) :
+        from LatencyProber import LatencyProber
+        from LocationService import LocationService
+        from OvpnIndex import OvpnIndex
+        from VpnDiscovery import VpnDiscovery
+        cache_path = self.cache_path
+        with profiler.span("location data"):
+            self.location_service = LocationService(os.path.join(Config.BASE_PATH, "country_codes.csv"), os.path.join(cache_path, "country_codes.marshal"), self.logger)
+        with profiler.span("VPN discovery"):
+            self.vpn_discovery = VpnDiscovery(self.vpn_paths, os.path.join(cache_path, "vpns.json"), self.logger)
+            self.ovpn_index = OvpnIndex(os.path.join(cache_path, "ovpn_index.marshal"), self.logger)
+            self.latency_prober = LatencyProber(self.logger, **self.config.get_dict("latency", default = {}))
+            self.initial_vpn_list = self.list_vpns()
+        with profiler.span("VPN list"):
+            self.add_vpns(self.initial_vpn_list)
+            for widget in self.startup_widgets:
+                widget.setEnabled(True)
+        # Keep the list up to date with the VPN directories :
+        self.vpn_discovery.watch(self.vpns_changed.emit)
+        # Parse the configurations metadata in the background :
+        self.index_vpns()
+        # Start the connection daemon if needed, and follow the tunnel :
+        QThreadPool.globalInstance().start(self.attach_daemon)
+        # Compile the other themes in the background, so that switching theme is instant :
+        QThreadPool.globalInstance().start(lambda: self.style_cache.precompile(self.themes))
+        # Apply the changes made to config.json while running :
+        self.config_changed.connect(self.apply_config)
+        for section in ("colors", "themes", "theme", "paths", "console", "latency"):
+            self.config.subscribe(section, lambda value, section = section: self.config_changed.emit(section, value))
+        self.config.watch(self.logger)
+        profiler.report(os.path.join(cache_path, "startup_profile.json"))
+
+    def apply_config(self, section, value):
+        """
+        Update the window after a section of config.json changed on disk
+        """
+        if section in ("colors", "themes"):
+            self.themes = {"custom": self.config.get_dict("colors"), **self.config.get_dict("themes", default = {})}
+            current_theme = self.theme_selector.currentText()
+            self.theme_selector.blockSignals(True)
+            self.theme_selector.clear()
+            self.theme_selector.addItems(list(self.themes))
+            self.theme_selector.setCurrentText(current_theme if current_theme in self.themes else "custom")
+            self.theme_selector.blockSignals(False)
+            self.switch_theme()
+        elif section == "theme":
+            self.theme_selector.setCurrentText(value)
+        elif section == "paths":
+            if value.get("vpns") != self.vpn_paths:
+                self.reload_vpn_paths(value.get("vpns", []))
+        elif section == "console":
+            self.console.setMaximumBlockCount(value.get("max_lines", 5000))
+        elif section == "latency":
+            from LatencyProber import LatencyProber
+            self.latency_prober = LatencyProber(self.logger, **value)
         # Write to log file :
-        self.logger.write("ACTION", {"action":f"Add line {text} to console", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
+        self.logger.write("EVENT", {"event":f"config.json section {section} changed","triggered by":invoker(self), "output":"0"})
 
-    def add_items_to_list(self, list_widget, items):
+    def reload_vpn_paths(self, paths):
         """
-        Add one or multiple items to the VPN list
+        List the VPNs of new VPN directories, replacing the ones of the previous directories (except the connected one)
         """
-        for item in items:
-            address = item['text']
-            list_item = QListWidgetItem()
-            list_item.setText(address)
-            try:
-                icon = QIcon(f"flags/{address[:2]}.png")  # Path to the flag icon
-                list_item.setIcon(icon)
-            except:
-                # Write to log file :
-                self.logger.write("WARNING", {"message":f"Failed to load icon 'flags/{address[:2]}.png'", "raised by":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}})
-            list_item.setSizeHint(QSize(200, 40))  # Set item size
-            list_widget.setIconSize(QSize(20, 20))  # Set icon size
-            list_widget.addItem(list_item)
+        from VpnDiscovery import VpnDiscovery
+        self.vpn_discovery.stop()
+        self.vpn_paths = paths
+        self.vpn_discovery = VpnDiscovery(self.vpn_paths, os.path.join(self.cache_path, "vpns.json"), self.logger)
+        vpns = self.list_vpns()
+        listed = set(vpns)
+        self.vpn_model.remove([vpn for vpn in self.vpn_model.names() if vpn not in listed and vpn != self.vpn_address])
+        self.add_vpns(vpns)
+        self.vpn_discovery.watch(self.vpns_changed.emit)
+        self.index_vpns()
+
+    def add_console_line(self, text):
+        """
+        Queue a new line of text for the terminal console, from any thread
+        """
+        self.pending_console_lines.append(text)
+
+    def add_command_output(self, lines):
+        """
+        Queue a batch of (stream name, line) openvpn output lines sent by the connection daemon, from any thread
+        """
+        self.pending_console_lines.extend(f"{stream_name} : {line}" for stream_name, line in lines)
+
+    def flush_console(self):
+        """
+        Append the queued lines to the console in a single block, scrolling down only if it was already at the bottom
+        """
+        if not self.pending_console_lines:
+            return
+        lines = []
+        while self.pending_console_lines:
+            lines.append(self.pending_console_lines.popleft())
+        # Only the lines the console can hold are worth appending :
+        lines = lines[-self.console.maximumBlockCount():]
+        scroll_bar = self.console.verticalScrollBar()
+        at_bottom = scroll_bar.value() >= scroll_bar.maximum() - 2
+        self.console.appendPlainText("\n".join(lines))
+        if at_bottom:
+            scroll_bar.setValue(scroll_bar.maximum())
+
+    def add_vpns(self, vpns):
+        """
+        Add VPNs to the list, with their flags
+        """
+        self.vpn_model.add(vpns)
+        self.vpn_model.set_flags(self.locate_vpns(vpns)[0])
+
+    def locate_vpns(self, vpns):
+        """
+        Return the flag country code of each VPN (see LocationService) and the set of their countries
+        """
+        flags = {}
+        countries = set()
+        for vpn in vpns:
+            location = self.location_service.locate(vpn, self.ovpn_index.lookup(vpn))
+            flags[vpn] = location["code"] if location else None
+            if location is not None:
+                countries.add(location["country"])
+        return flags, countries
+
+    def update_locations(self):
+        """
+        Locate the VPNs again once their remote hosts are indexed : update the flag icons and the countries of the country filter
+        """
+        flags, countries = self.locate_vpns(self.vpn_model.names())
+        self.vpn_model.set_flags(flags)
+        selected_country = self.country_filter.currentText()
+        self.country_filter.blockSignals(True)
+        self.country_filter.clear()
+        self.country_filter.addItems(["All countries"] + sorted(countries))
+        self.country_filter.setCurrentIndex(max(self.country_filter.findText(selected_country), 0))
+        self.country_filter.blockSignals(False)
 
     def list_vpns(self):
         """
-        Use subprocess.run() to execute the commands : ls (paths) -Iserver -Iclient -Iconfigurations
-        and return the list of vpns present in all paths specified in the config.json
+        Return the list of vpns present in all paths specified in the config.json (without client, server and configurations),
+        listed in-process and cached by directory modification time (see VpnDiscovery)
         """
-        vpn_list = []
-        for path in self.vpn_paths:
-            vpn_list = vpn_list + subprocess.run(['/bin/ls', path, '-Iclient', '-Iserver', '-Iconfigurations'], capture_output=True, text=True).stdout.splitlines()
-            # Write to log file :
-            self.logger.write("COMMAND", {"command":f"/bin/ls {path} -Iclient -Iserver -Iconfigurations", "requires sudo":"no", "invoker":"script", "output (STDOUT stream)":"", "errors (STDERR Stream)":""})
-        return vpn_list
+        return self.vpn_discovery.list()
+
+    def update_vpn_list(self, added, removed):
+        """
+        Add and remove the rows of the VPN configurations that appeared in or disappeared from the VPN directories
+        """
+        self.add_vpns(added)
+        # The connected VPN stays in the list until disconnection :
+        self.vpn_model.remove([vpn for vpn in removed if vpn != self.vpn_address])
+        self.index_vpns()
+        # Write to log file :
+        self.logger.write("EVENT", {"event":f"VPN list updated ({len(added)} added, {len(removed)} removed)","triggered by":invoker(self), "output":"0"})
+
+    def index_vpns(self):
+        """
+        Update the configurations metadata index from the thread pool, emitting vpns_indexed once done
+        """
+        def index():
+            self.ovpn_index.update(self.vpn_discovery.listings)
+            self.vpns_indexed.emit()
+        QThreadPool.globalInstance().start(index)
+
+    def filter_vpn_list(self):
+        """
+        Hide the VPNs that do not match the selected protocol (the VPNs not indexed yet stay visible) or country
+        """
+        protocol = self.protocol_filter.currentText().lower()
+        matches = None if protocol == "all protocols" else set(self.ovpn_index.filter(proto = protocol))
+        country = None if self.country_filter.currentIndex() <= 0 else self.country_filter.currentText()
+        if matches is None and country is None:
+            self.vpn_proxy.set_allowed(None)
+            return
+        allowed = set()
+        for vpn in self.vpn_model.names():
+            metadata = self.ovpn_index.lookup(vpn)
+            if matches is not None and metadata is not None and vpn not in matches:
+                continue
+            if country is not None:
+                location = self.location_service.locate(vpn, metadata)
+                if location is None or location["country"] != country:
+                    continue
+            allowed.add(vpn)
+        self.vpn_proxy.set_allowed(allowed)
+
+    def search_vpn_list(self):
+        """
+        Only show the VPNs whose name contains the text of the search box
+        """
+        self.vpn_proxy.set_search(self.search_box.text())
+
+    def probe_latencies(self):
+        """
+        Measure the latency of every indexed VPN from the thread pool, emitting latencies_measured once done
+        (measures younger than the prober's ttl are reused, see LatencyProber)
+        """
+        def probe():
+            self.latencies_measured.emit(self.latency_prober.probe_configs(self.ovpn_index.configs()))
+        QThreadPool.globalInstance().start(probe)
+
+    def update_latencies(self, latencies):
+        """
+        Display the measured latencies in the VPN list, re-sort it, and connect to the fastest VPN if it was requested
+        """
+        self.vpn_model.set_latencies(latencies)
+        if self.connect_to_fastest:
+            self.connect_to_fastest = False
+            self.fastest_button.setEnabled(True)
+            # Among the VPNs left visible by the filters :
+            candidates = [self.vpn_proxy.index(row, 0) for row in range(self.vpn_proxy.rowCount())]
+            candidates = [index for index in candidates if index.data(VpnListModel.LATENCY_ROLE) is not None]
+            if candidates:
+                fastest = min(candidates, key = lambda index: index.data(VpnListModel.LATENCY_ROLE))
+                # Switch to it, unless it is the connected VPN already :
+                if fastest.data() != self.vpn_address:
+                    self.address_list.setCurrentIndex(fastest)
+                    self.toggle_connection()
+            else:
+                self.add_console_line("No reachable VPN server found")
+
+    def sort_vpn_list(self):
+        """
+        Sort the VPN list by name or by latency (the connected VPN stays pinned at the top)
+        """
+        self.vpn_model.set_sort_by_latency(self.sort_order.currentText() == "Sort by latency")
+
+    def connect_fastest(self):
+        """
+        Measure the latencies (reusing the fresh ones) and connect to the lowest-latency VPN among the listed ones
+        """
+        if self.connection_busy or self.connect_to_fastest:
+            return
+        self.connect_to_fastest = True
+        self.fastest_button.setEnabled(False)
+        self.probe_latencies()
+        # Write to log file :
+        self.logger.write("EVENT", {"event":"Connection to the fastest VPN requested","triggered by":invoker(self), "output":"0"})
 
     def toggle_connection(self):
         """
-        Connect or disconnect the VPN when connect_button is pressed
-        """
-        selected_item = self.get_selected_item()  # get the selected VPN in the list
-        if selected_item:
-            if not self.connected:  # Connect
-                self.command_runner = CommandRunner(f"/etc/openvpn {selected_item.text()}", self.logger, True)
-                self.command_runner.run()
-                self.connected = True
-                self.vpn_address = selected_item.text()
-                self.connected_item = selected_item
-                self.connected_status = "on"
-
-                # Retrieve server location
-                self.server_location = "unknown"
-                with open('country_codes.csv', 'rt') as country_codes:
-                    reader = csv.reader(country_codes, delimiter=',')
-                    for row in reader:
-                        if self.vpn_address[:2].upper() == row[1]:
-                            self.server_location = row[0]
-                            break
-
-                # Update button appearance:
-                self.connect_button.setText("Disconnect")
-                self.connect_button.setStyleSheet("background-color: #f44336;")
-
-                # Move connected item to top:
-                self.move_item_to_top(selected_item)
-                # Write to log file :
-                self.logger.write("EVENT", {"event":f"Connection attempt to VPN {self.vpn_address}","triggered by":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
-
-            else:  # Disconnect
-                self.command_runner.stop()
-                self.connected = False
-                self.vpn_address = ""
-                self.connected_item = None
-                self.connected_status = "off"
-                self.server_location = ""
-
-                # Update button appearance:
-                self.connect_button.setText("Connect")
-                self.connect_button.setStyleSheet("background-color: #4CAF50;")
-
-                # Remove separator and re-sort list:
-                self.reset_list_order()
+        Connect to the selected VPN when connect_button is pressed, switching from the connected one if it is another,
+        or disconnect if it is the connected one ; the tunnels are started and stopped by the connection daemon
+        """
+        selected_vpn = self.get_selected_vpn()  # get the selected VPN in the list
+        if not selected_vpn or self.connection_busy:
+            return
+        with telemetry.span("toggle_connection"):
+            self.connection_busy = True
+            self.connect_button.setEnabled(False)
+            if self.connected and selected_vpn == self.vpn_address:  # Disconnect
+                self.connected_status = "disconnecting"
+                self.request_daemon(lambda: self.daemon.disconnect(wait = False))
+            else:  # Connect, or switch to another VPN
+                self.connected_status = "switching" if self.connected else "connecting"
+                self.request_daemon(lambda: self.daemon.connect(selected_vpn, wait = False))
                 # Write to log file :
-                self.logger.write("EVENT", {"event":"Disconnection from current VPN","triggered by":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
+                self.logger.write("EVENT", {"event":f"Connection attempt to VPN {selected_vpn}","triggered by":invoker(self), "output":"0"})
+            self.update_connection_status()
 
+    def request_daemon(self, request):
+        """
+        Send a request to the connection daemon from the thread pool : its outcome arrives as daemon events
+        """
+        def send():
+            try:
+                request()
+            except DaemonError as e:
+                self.daemon_message.emit({"event": "refused", "error": str(e)})
+        QThreadPool.globalInstance().start(send)
+
+    def attach_daemon(self):
+        """
+        Start the connection daemon unless it is running, and follow it, from the thread pool
+        """
+        try:
+            self.daemon.start()
+            self.daemon_stream = self.daemon.follow(self.receive_daemon_message, self.config.get_int("console", "max_lines", default = 5000))
+        except DaemonError as e:
+            self.add_console_line(f"Connection daemon unavailable : {e}")
+
+    def receive_daemon_message(self, message):
+        """
+        Handle a message of the daemon stream, from its thread : output lines and traffic samples are queued here, the
+        events go to the GUI thread
+        """
+        if "output" in message:
+            self.add_command_output(message["output"])
+        elif "traffic" in message:
+            if message["reset"]:
+                self.traffic_buffer.clear()
+            for sample in message["traffic"]:
+                self.traffic_buffer.append(*sample)
+        else:
+            self.daemon_message.emit(message)
+
+    def handle_daemon_message(self, message):
+        """
+        Follow the tunnel as the connection daemon reports it, whichever client changed it : the first message is its
+        current state, then come its events
+        """
+        event = message.get("event", message.get("status"))
+        if event in ("connecting", "switching", "disconnecting"):
+            self.connection_busy = True
+            self.connect_button.setEnabled(False)
+            self.connected_status = event
+            self.update_connection_status()
+        elif event in ("connected", "on"):
+            self.connection_started(message["vpn"], message["phases"], None)
+        elif event == "failed":
+            self.connection_started(message["vpn"], None, message["error"])
+        elif event == "disconnected":
+            self.connection_ended(message["vpn"], message["return_code"])
+        elif event == "refused":
+            self.connection_busy = False
+            self.connect_button.setEnabled(True)
+            self.connected_status = "on" if self.connected else "off"
             self.update_connection_status()
+            self.add_console_line(f"Connection daemon : {message['error']}")
+        elif event == "closed" and self.daemon_stream is not None:  # the daemon stopped, not the window
+            self.daemon_stream = None
+            if self.connected:
+                self.connection_ended(self.vpn_address, None)
+            self.add_console_line("The connection daemon stopped")
+
+    def connection_started(self, vpn, phases, error):
+        """
+        Update the window once connected to a VPN (the previous one, if any, is disconnected), or once connecting failed
+        """
+        if self.vpn_address:
+            self.unpin_vpn(self.vpn_address)
+        if error is not None:
+            self.connected = False
+            self.vpn_address = ""
+            self.connected_status = "off"
+            self.server_location = ""
+            self.add_console_line(f"Connection to {vpn} failed : {error}")
+            # Write to log file :
+            self.logger.write("EVENT", {"event":f"Connection to VPN {vpn} failed : {error}","triggered by":invoker(self), "output":"1"})
+        else:
+            self.connected = True
+            self.vpn_address = vpn
+            self.connected_status = "on"
+            # Retrieve server location
+            self.server_location = self.location_service.describe(self.vpn_address, self.ovpn_index.lookup(self.vpn_address))
+            # Pin connected VPN to top:
+            self.pin_vpn(vpn)
+            self.add_console_line(f"Connected to {vpn} : " + ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in phases.items()))
+        self.connection_busy = False
+        self.connect_button.setEnabled(True)
+        self.update_connect_button()
+        self.update_connection_status()
+
+    def connection_ended(self, vpn, return_code):
+        """
+        Update the window once disconnected from a VPN
+        """
+        self.connected = False
+        self.vpn_address = ""
+        self.connected_status = "off"
+        self.server_location = ""
+        # Unpin the VPN, back to its place in the list:
+        self.unpin_vpn(vpn)
+        self.connection_busy = False
+        self.connect_button.setEnabled(True)
+        self.update_connect_button()
+        self.update_connection_status()
+        # Write to log file :
+        self.logger.write("EVENT", {"event":f"Disconnection from VPN {vpn} (openvpn return code {return_code})","triggered by":invoker(self), "output":"0"})
 
-    def get_selected_item(self):
+    def update_connect_button(self):
         """
-        Return the selected VPN from the left list
+        Label connect_button with what pressing it does for the selected VPN
         """
-        item = None
-        if self.address_list.selectedItems():
-            item = self.address_list.selectedItems()[0]
-        return item
+        if not self.connected:
+            self.connect_button.setText("Connect")
+            self.connect_button.setStyleSheet("background-color: #4CAF50;")
+        elif self.get_selected_vpn() not in (None, self.vpn_address):
+            self.connect_button.setText("Switch")
+            self.connect_button.setStyleSheet("background-color: #4CAF50;")
+        else:
+            self.connect_button.setText("Disconnect")
+            self.connect_button.setStyleSheet("background-color: #f44336;")
+
+    def get_selected_vpn(self):
+        """
+        Return the name of the selected VPN from the left list, or None
+        """
+        indexes = self.address_list.selectionModel().selectedIndexes()
+        return indexes[0].data() if indexes else None
 
     def update_connection_status(self):
         """
@@ -246,138 +674,78 @@ class MainWindow(QMainWindow):
         self.address_label.setText(f"Connected to : {self.vpn_address}" if self.vpn_address else "Connected to :")
         self.location_label.setText(f"Location: {self.server_location}" if self.server_location else "Location:")
 
-    def move_item_to_top(self, item):
+    def pin_vpn(self, vpn):
         """
-        Move the connected VPN to the top and add a separator
+        Pin the connected VPN at the top of the list, above a separator (a sort key change, see VpnListModel)
         """
-        # Remove sorting temporarily
-        self.address_list.setSortingEnabled(False)
-
-        # Create a separator item if not already created
-        if self.separator_item is None:
-            self.separator_item = QListWidgetItem("᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆᠆")
-            self.separator_item.setFlags(Qt.ItemFlag.NoItemFlags)  # Make it non-selectable
-            #self.separator_item.setSizeHint(QSize(200, 10))  # Smaller size for separator
-            self.address_list.insertItem(0, self.separator_item)
+        self.vpn_model.set_pinned(vpn)
+        self.address_list.setCurrentIndex(self.vpn_proxy.mapFromSource(self.vpn_model.index(self.vpn_model.row(vpn))))  # Ensure it stays selected
+        self.address_list.scrollToTop()
 
-        # Move the connected item to the top (right under the separator)
-        self.address_list.takeItem(self.address_list.row(item))  # Remove from the current position
-        self.address_list.insertItem(0, item)  # Insert at the top
-        self.address_list.setCurrentItem(item)  # Ensure it stays selected
-
-    def reset_list_order(self):
+    def unpin_vpn(self, vpn):
         """
-        Remove the separator and sort items alphabetically when disconnected
+        Put the disconnected VPN back in its place in the list, or remove it if its configuration disappeared meanwhile
         """
-        # Remove sorting temporarily
-        self.address_list.setSortingEnabled(False)
-
-        # Remove the connected item and reinsert it to trigger sorting
-        if self.connected_item:
-            self.address_list.takeItem(self.address_list.row(self.connected_item))
-            self.address_list.addItem(self.connected_item)
-
-        # Remove the separator item if it exists
-        if self.separator_item:
-            self.address_list.takeItem(self.address_list.row(self.separator_item))
-            self.separator_item = None
-
-        # Enable sorting
-        self.address_list.setSortingEnabled(True)
+        self.vpn_model.set_pinned(None)
+        if not any(vpn in names for names in self.vpn_discovery.listings.values()):
+            self.vpn_model.remove([vpn])
+        elif self.vpn_model.row(vpn) is not None:
+            self.address_list.scrollTo(self.vpn_proxy.mapFromSource(self.vpn_model.index(self.vpn_model.row(vpn))))
 
     def handle_selection(self):
         """
-        Handle selection of items in the list
-        """
-        pass
-
-    def compile_stylesheet(self, json_file):
-        """
-        Compile a Scss file into CSS for the window's stylesheet to allow reading variables from config.json
-        """
-        with open(json_file, 'r') as config_file:
-            config = json.load(config_file)
-        colors = config["colors"]
-        scss_content="""
-            $background_color:{background_color};
-            $list_background_color:{list_background_color};
-            $border_color:{border_color};
-            $item_background_color:{item_background_color};
-            $selected_item_background_color:{selected_item_background_color};
-            $main_text_color:{main_text_color};
-            $small_text_color:{small_text_color};
-            $button_text_color:{button_text_color};
-            $connect_button_color:{connect_button_color};
-            $disconnect_button_color:{disconnect_button_color};
-            $scroll_border_color:{scroll_border_color};
-            QWidget#central_widget {{
-                background-color:$background_color;
-            }}
-            QListWidget {{
-                background-color: $list_background_color;
-                border:1px solid $border_color;
-                padding: 5px;
-            }}
-            QListWidget::item {{
-                background-color: $item_background_color;
-                margin: 5px;
-                padding: 10px;
-                border-radius: 10px;
-                color: $border_color;
-            }}
-            QListWidget::item:selected {{
-                background-color: $selected_item_background_color;
-            }}
-            QLabel#title_label {{
-                font-size: 28px;
-                font-weight: bold;
-                color: $main_text_color;
-            }}
-            QLabel#status_label {{
-                font-size: 18px;
-                font-weight: bold;
-                color: $small_text_color;
-            }}
-            QLabel#address_label {{
-                font-size: 14px;
-                color: $small_text_color;
-            }}
-            QLabel#location_label {{
-                font-size: 14px;
-                color: $small_text_color;
-            }}
-            QPushButton {{
-                font-size: 16px;
-                font-weight: bold;
-                padding: 10px;
-                border-radius: 10px;
-            }}
-            QPushButton#connect_button {{
-                background-color: $connect_button_color;
-                color: white;
-            }}
-            QPushButton#disconnect_button {{
-                background-color: $disconnect_button_color;
-                color: white;
-            }}
-            QScrollArea {{
-                border: 2px solid $scroll_border_color;
-            }}
-        """
-        scss_formatted = scss_content.format(**colors)
-        stylesheet = sass.compile(string=scss_formatted)
+        Handle selection of items in the list : display the server information of the selected VPN from the metadata index
+        """
+        selected_vpn = self.get_selected_vpn()
+        self.update_connect_button()
+        metadata = self.ovpn_index.lookup(selected_vpn) if selected_vpn else None
+        if metadata is None:
+            self.info_label.setText("")
+            return
+        remotes = ", ".join(f"{host}:{port} ({proto})" for host, port, proto in metadata["remotes"][:3])
+        if len(metadata["remotes"]) > 3:
+            remotes += f" (+{len(metadata['remotes']) - 3})"
+        self.info_label.setText(
+            f"Server : {remotes or 'none'}\n"
+            f"Cipher : {metadata['cipher'] or 'default'}    "
+            f"Authentication : {'username/password' if metadata['auth_user_pass'] else 'certificate'}    "
+            f"Embedded : {', '.join(metadata['embedded']) or 'none'}"
+        )
+
+    def theme_stylesheet(self, theme):
+        """
+        Return the window's stylesheet for a theme, compiled from styles.scss with the theme colors of config.json only if
+        they or the template changed since the last compilation (see StyleCache)
+        """
+        stylesheet = self.style_cache.stylesheet(self.themes.get(theme, self.themes["custom"]))
         # Write to log file :
-        self.logger.write("ACTION", {"action":"Formatted and compiled stylesheet", "invoker":{"file":f"{os.path.basename(__file__)}", "instance":f"{self}", "called by":f"{inspect.stack()[1].function}"}, "output":"0"})
+        if self.logger.enabled("ACTION"):
+            self.logger.write("ACTION", {"action":f"Loaded stylesheet of theme {theme}", "invoker":invoker(self), "output":"0"})
         return stylesheet
-    
+
+    def switch_theme(self):
+        """
+        Apply the theme selected in theme_selector, and remember it in config.json ; themes are precompiled, so this is only a setStyleSheet
+        """
+        theme = self.theme_selector.currentText()
+        self.stylesheet = self.theme_stylesheet(theme)
+        self.setStyleSheet(self.stylesheet)
+        if self.config.get_str("theme", default = "custom") != theme:
+            self.config.set("theme", value = theme)
+
 # Start the application :
 if __name__ == '__main__':
-    keyring.set_password("system", "sudo", "Tomtom67*hacunamatata")
     # Write to log file :
     logger.write("EVENT", {"event":"Started application","triggered by":f"file : {os.path.basename(__file__)}", "output":"0"})
     # Create the window
-    app = QApplication(sys.argv)
+    with profiler.span("application"):
+        app = QApplication(sys.argv)
     main_window = MainWindow(logger)
     main_window.show()
+    # Keyring is slow to import : store the sudo password once the event loop runs
+    def store_sudo_password():
+        import keyring
+        keyring.set_password("system", "sudo", "Tomtom67*hacunamatata")
+    QTimer.singleShot(0, store_sudo_password)
     # Start the event loop
     sys.exit(app.exec())
\ No newline at end of file
@@ -0,0 +1,75 @@
+'''
+Command line client of the connection daemon (see NebulaDaemon), started if it is not running :
+    python3 nebula.py list
+    python3 nebula.py status
+    python3 nebula.py connect <VPN>
+    python3 nebula.py disconnect
+    python3 nebula.py follow [--replay N]
+    python3 nebula.py shutdown
+'''
+
+import argparse
+import sys
+from DaemonClient import DaemonClient, DaemonError
+
+def format_phases(phases):
+    return ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in (phases or {}).items())
+
+def print_message(message):
+    """
+    Print a message of the daemon stream
+    """
+    if "output" in message:
+        for stream_name, line in message["output"]:
+            print(f"{stream_name} : {line}")
+    elif "event" in message:
+        details = format_phases(message.get("phases")) or message.get("error") or (f"openvpn return code {message['return_code']}" if message.get("return_code") is not None else "")
+        print(f">>> {message['event']} {message.get('vpn') or ''}{f' : {details}' if details else ''}")
+    elif "status" in message:
+        print(f">>> {message['status']} {message['vpn'] or ''}")
+    sys.stdout.flush()
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description = "Nebula VPN client")
+    commands = parser.add_subparsers(dest = "command", required = True)
+    commands.add_parser("list", help = "list the VPN configurations")
+    commands.add_parser("status", help = "show the state of the tunnel")
+    connect_parser = commands.add_parser("connect", help = "connect to a VPN, switching from the connected one")
+    connect_parser.add_argument("vpn")
+    commands.add_parser("disconnect", help = "disconnect the tunnel")
+    follow_parser = commands.add_parser("follow", help = "print the events and openvpn output until interrupted")
+    follow_parser.add_argument("--replay", type = int, default = 20, help = "past output lines to print first")
+    commands.add_parser("shutdown", help = "disconnect and stop the daemon")
+    options = parser.parse_args(arguments)
+    client = DaemonClient()
+    try:
+        if options.command == "shutdown":
+            if client.running():
+                client.shutdown()
+            return 0
+        client.start()
+        if options.command == "list":
+            print("\n".join(client.list()))
+        elif options.command == "status":
+            status = client.status()
+            rates = f" (received {status['rates'][0] / 1000:.1f} kB/s, sent {status['rates'][1] / 1000:.1f} kB/s)" if status["rates"] else ""
+            print(f"{status['status']} {status['vpn'] or ''}{rates}")
+        elif options.command == "connect":
+            reply = client.connect(options.vpn)
+            print(f"connected to {reply['vpn']} : {format_phases(reply['phases'])}")
+        elif options.command == "disconnect":
+            reply = client.disconnect()
+            print(f"disconnected from {reply['vpn']} (openvpn return code {reply['return_code']})" if reply["vpn"] else "not connected")
+        elif options.command == "follow":
+            stream = client.follow(print_message, options.replay)
+            try:
+                stream.wait()
+            except KeyboardInterrupt:
+                stream.close()
+    except DaemonError as e:
+        print(f"nebula : {e}", file = sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))